@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+GPS Extractor Benchmark - Reproducible latency/throughput runs for gps-extractor.py
+
+Generates synthetic JPEG/TIFF/HEIC files with known GPS tags, then measures each
+extraction mode in its own process so peak RSS is attributable to that mode:
+
+    exiftool   extract_gps_with_exiftool() called directly, one exiftool per file
+    server     end-to-end POST /extract-gps against a spawned server
+
+Online geocoding is served by a local stub, so runs never touch the network.
+
+Usage:
+    python3 gps-benchmark.py run --files 200 --output bench.json
+    python3 gps-benchmark.py compare baseline.json bench.json
+"""
+
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXTRACTOR_PATH = os.path.join(HERE, 'gps-extractor.py')
+
+MODES = ('exiftool', 'server')
+FORMATS = ('jpg', 'tif', 'heic')
+
+
+def load_extractor():
+    """Import gps-extractor.py as a module (its file name is not importable)"""
+    spec = importlib.util.spec_from_file_location('gps_extractor', EXTRACTOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------------
+# Synthetic files
+# ---------------------------------------------------------------------------
+
+def rational_triplet(value):
+    """Degrees as three EXIF RATIONALs (deg, min, sec * 1000)"""
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round(((value - degrees) * 60 - minutes) * 60 * 1000)
+    return struct.pack('<6I', degrees, 1, minutes, 1, seconds, 1000)
+
+
+def build_tiff(latitude, longitude, captured_at):
+    """Little-endian TIFF header with IFD0 -> Exif IFD (DateTimeOriginal) and GPS IFD"""
+    # Layout: header(8) | IFD0 | Exif IFD | GPS IFD | data area
+    ifd0_offset = 8
+    ifd0_size = 2 + 2 * 12 + 4
+    exif_offset = ifd0_offset + ifd0_size
+    exif_size = 2 + 1 * 12 + 4
+    gps_offset = exif_offset + exif_size
+    gps_size = 2 + 4 * 12 + 4
+    data_offset = gps_offset + gps_size
+
+    date_bytes = captured_at.encode('ascii') + b'\0'
+    lat_bytes = rational_triplet(latitude)
+    lng_bytes = rational_triplet(longitude)
+    date_at = data_offset
+    lat_at = date_at + len(date_bytes)
+    lng_at = lat_at + len(lat_bytes)
+
+    def entry(tag, kind, count, value):
+        return struct.pack('<HHII', tag, kind, count, value)
+
+    def inline_ascii(text):
+        return struct.unpack('<I', text.encode('ascii').ljust(4, b'\0'))[0]
+
+    ifd0 = struct.pack('<H', 2)
+    ifd0 += entry(0x8769, 4, 1, exif_offset)
+    ifd0 += entry(0x8825, 4, 1, gps_offset)
+    ifd0 += struct.pack('<I', 0)
+
+    exif = struct.pack('<H', 1)
+    exif += entry(0x9003, 2, len(date_bytes), date_at)
+    exif += struct.pack('<I', 0)
+
+    gps = struct.pack('<H', 4)
+    gps += entry(0x0001, 2, 2, inline_ascii('N' if latitude >= 0 else 'S'))
+    gps += entry(0x0002, 5, 3, lat_at)
+    gps += entry(0x0003, 2, 2, inline_ascii('E' if longitude >= 0 else 'W'))
+    gps += entry(0x0004, 5, 3, lng_at)
+    gps += struct.pack('<I', 0)
+
+    return b'II*\0' + struct.pack('<I', ifd0_offset) + ifd0 + exif + gps + date_bytes + lat_bytes + lng_bytes
+
+
+def build_jpeg(tiff, size):
+    """JPEG with the TIFF block in APP1 and a COM segment padding to the target size"""
+    app1 = b'Exif\0\0' + tiff
+    data = b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1
+    remaining = max(0, size - len(data) - 2)
+    while remaining > 4:
+        chunk = min(remaining - 4, 65533)
+        data += b'\xff\xfe' + struct.pack('>H', chunk + 2) + os.urandom(chunk)
+        remaining -= chunk + 4
+    return data + b'\xff\xd9'
+
+
+def build_tiff_file(tiff, size):
+    """Bare TIFF: the metadata block followed by filler image bytes"""
+    return tiff + os.urandom(max(0, size - len(tiff)))
+
+
+def box(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def full_box(kind, version, flags, payload):
+    return box(kind, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def build_heic(tiff, size):
+    """Minimal HEIF container with a single Exif item stored in mdat"""
+    exif_item = struct.pack('>I', 6) + b'Exif\0\0' + tiff
+    filler = os.urandom(max(0, size - len(exif_item) - 200))
+    ftyp = box(b'ftyp', b'heic' + struct.pack('>I', 0) + b'mif1heic')
+
+    def build_meta(extent_offset):
+        hdlr = full_box(b'hdlr', 0, 0, struct.pack('>I', 0) + b'pict' + b'\0' * 12 + b'\0')
+        infe = full_box(b'infe', 2, 0, struct.pack('>HH', 1, 0) + b'Exif' + b'\0')
+        iinf = full_box(b'iinf', 0, 0, struct.pack('>H', 1) + infe)
+        iloc = full_box(b'iloc', 0, 0, bytes([0x44, 0x00]) + struct.pack(
+            '>HHHHII', 1, 1, 0, 1, extent_offset, len(exif_item)))
+        return full_box(b'meta', 0, 0, hdlr + iinf + iloc)
+
+    # The item offset depends on the meta box size, which does not depend on the offset value
+    meta = build_meta(0)
+    extent_offset = len(ftyp) + len(meta) + 8
+    meta = build_meta(extent_offset)
+    return ftyp + meta + box(b'mdat', exif_item + filler)
+
+
+BUILDERS = {'jpg': build_jpeg, 'tif': build_tiff_file, 'heic': build_heic}
+
+
+def generate_corpus(directory, count, size, formats, seed, prefix='bench'):
+    """Write `count` files cycling through formats; returns [(path, lat, lng)]"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        fmt = formats[i % len(formats)]
+        latitude = round(rng.uniform(-60, 70), 6)
+        longitude = round(rng.uniform(-180, 180), 6)
+        captured = time.gmtime(1577836800 + rng.randint(0, 5 * 365 * 86400))
+        tiff = build_tiff(latitude, longitude, time.strftime('%Y:%m:%d %H:%M:%S', captured))
+        path = os.path.join(directory, f"{prefix}_{i:05d}.{fmt}")
+        with open(path, 'wb') as f:
+            f.write(BUILDERS[fmt](tiff, size))
+        corpus.append((path, latitude, longitude))
+    return corpus
+
+
+# ---------------------------------------------------------------------------
+# Geocoding stub
+# ---------------------------------------------------------------------------
+
+class GeocodeStubHandler(BaseHTTPRequestHandler):
+    """Answers Nominatim and BigDataCloud reverse requests with a canned place"""
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.path.startswith('/reverse'):
+            payload = {'display_name': 'Benchville, Stub State, Stubland',
+                       'address': {'city': 'Benchville', 'state': 'Stub State', 'country': 'Stubland'}}
+        elif self.path.startswith('/data/reverse-geocode-client'):
+            payload = {'city': 'Benchville', 'principalSubdivision': 'Stub State', 'countryName': 'Stubland'}
+        else:
+            self.send_error(404, "Not found")
+            return
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_geocode_stub(latency_ms):
+    """Run the stub on an ephemeral port in a daemon thread; returns its base URL"""
+    GeocodeStubHandler.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GeocodeStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ---------------------------------------------------------------------------
+# Modes
+# ---------------------------------------------------------------------------
+
+def bench_exiftool(corpus, warmup, args):
+    """Call the extraction and geocoding functions directly, one exiftool per file"""
+    extractor = load_extractor()
+
+    def extract_all(files):
+        latencies = []
+        errors = 0
+        for path, _, _ in files:
+            started = time.perf_counter()
+            result = extractor.extract_gps_with_exiftool(path)
+            if result.get('has_location'):
+                extractor.get_location_name(result['latitude'], result['longitude'])
+            else:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    extract_all(warmup)
+    started = time.perf_counter()
+    latencies, errors = extract_all(corpus)
+    return latencies, time.perf_counter() - started, errors, None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_of(pid):
+    """VmHWM (peak resident set) of a running process in KiB, Linux only"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def request_bodies(files):
+    bodies = []
+    for path, _, _ in files:
+        with open(path, 'rb') as f:
+            payload = {'file_data': base64.b64encode(f.read()).decode('ascii'),
+                       'filename': os.path.basename(path)}
+        bodies.append(json.dumps(payload).encode('utf-8'))
+    return bodies
+
+
+def post_all(url, bodies, concurrency):
+    """POST every body from `concurrency` client threads; returns (latencies, errors)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    queue = list(bodies)
+
+    def client():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                body = queue.pop()
+            started = time.perf_counter()
+            req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(req, timeout=60) as response:
+                    ok = json.loads(response.read()).get('has_location')
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def bench_server(corpus, warmup, args):
+    """POST every file to one spawned server, warmed up first, optionally from several client threads"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, EXTRACTOR_PATH, 'serve', str(port)],
+        env=dict(os.environ, GPS_LOG_LEVEL='WARNING'),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        url = f"http://localhost:{port}/extract-gps"
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(('localhost', port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError("GPS extractor server did not start")
+                time.sleep(0.05)
+
+        # Same server for warm-up and timing, so the timed run sees a warm process
+        post_all(url, request_bodies(warmup), args.concurrency)
+        bodies = request_bodies(corpus)
+        started = time.perf_counter()
+        latencies, errors = post_all(url, bodies, args.concurrency)
+        return latencies, time.perf_counter() - started, errors, peak_rss_of(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+MODE_RUNNERS = {'exiftool': bench_exiftool, 'server': bench_server}
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, wall_seconds, errors, server_rss_kb):
+    ordered = sorted(latencies)
+    to_ms = lambda v: round(v * 1000, 3) if v is not None else None
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    summary = {
+        'files': len(latencies),
+        'errors': errors,
+        'p50_ms': to_ms(percentile(ordered, 50)),
+        'p95_ms': to_ms(percentile(ordered, 95)),
+        'p99_ms': to_ms(percentile(ordered, 99)),
+        'mean_ms': to_ms(sum(ordered) / len(ordered)) if ordered else None,
+        'files_per_s': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        # ru_maxrss is KiB on Linux
+        'peak_rss_kb': usage_self.ru_maxrss,
+        'children_peak_rss_kb': usage_children.ru_maxrss,
+    }
+    if server_rss_kb is not None:
+        summary['server_peak_rss_kb'] = server_rss_kb
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_child(args):
+    """Benchmark one mode inside this (fresh) process and print its summary as JSON"""
+    stub, stub_url = start_geocode_stub(args.geocode_latency_ms)
+    os.environ['GPS_NOMINATIM_URL'] = stub_url
+    os.environ['GPS_BIGDATACLOUD_URL'] = stub_url
+    os.environ['GPS_LOG_LEVEL'] = 'WARNING'
+
+    with tempfile.TemporaryDirectory(prefix='gps-bench-') as directory:
+        formats = args.formats.split(',')
+        corpus = generate_corpus(directory, args.files, args.size, formats, args.seed)
+        # Untimed files that warm up the interpreter, exiftool's startup path and the server process;
+        # other files and coordinates than the timed ones, so no timed lookup is pre-cached
+        warmup = generate_corpus(directory, args.warmup, args.size, formats, args.seed + 1, prefix='warmup')
+        latencies, wall, errors, server_rss_kb = MODE_RUNNERS[args.mode](corpus, warmup, args)
+    stub.shutdown()
+    print(json.dumps(summarize(latencies, wall, errors, server_rss_kb)))
+
+
+def run(args):
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODE_RUNNERS:
+            raise SystemExit(f"Unknown mode {mode!r}; available: {', '.join(MODES)}")
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {k: v for k, v in vars(args).items() if k not in ('func', 'output')},
+        },
+        'results': {},
+    }
+    for mode in modes:
+        cmd = [sys.executable, os.path.abspath(__file__), '_child', mode,
+               '--files', str(args.files), '--size', str(args.size), '--formats', args.formats,
+               '--seed', str(args.seed), '--warmup', str(args.warmup),
+               '--concurrency', str(args.concurrency),
+               '--geocode-latency-ms', str(args.geocode_latency_ms)]
+        completed = subprocess.run(cmd, capture_output=True, text=True)
+        if completed.returncode != 0:
+            report['results'][mode] = {'error': completed.stderr.strip().splitlines()[-1:] or 'failed'}
+        else:
+            report['results'][mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{mode:>10}: {json.dumps(report['results'][mode])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+
+
+def compare(args):
+    """Print per-mode deltas between two result files; non-zero exit on regression"""
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.candidate) as f:
+        candidate = json.load(f)['results']
+
+    regressed = False
+    # Lower is better for latency and memory, higher for throughput
+    metrics = [('p50_ms', -1), ('p95_ms', -1), ('p99_ms', -1), ('files_per_s', 1), ('peak_rss_kb', -1)]
+    for mode in sorted(set(baseline) & set(candidate)):
+        print(mode)
+        for metric, direction in metrics:
+            old, new = baseline[mode].get(metric), candidate[mode].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change * direction < -args.threshold
+            regressed = regressed or worse
+            print(f"  {metric:>12}: {old:>10} -> {new:>10} ({change:+.1f}%){'  REGRESSION' if worse else ''}")
+    return 1 if regressed else 0
+
+
+def add_workload_arguments(parser):
+    parser.add_argument('--files', type=int, default=100, help='Files per mode')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='Approximate bytes per file')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='Comma-separated of jpg,tif,heic')
+    parser.add_argument('--seed', type=int, default=1234, help='Seed for coordinates and timestamps')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed files before each mode')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads in server mode')
+    parser.add_argument('--geocode-latency-ms', type=float, default=0.0,
+                        help='Artificial latency of the geocoding stub')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='gps-benchmark.py', description='Benchmark gps-extractor.py')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subcommands.add_parser('run', help='Run the benchmark for one or more modes')
+    run_parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated of ' + ', '.join(MODES))
+    run_parser.add_argument('--output', help='Write results JSON here')
+    add_workload_arguments(run_parser)
+
+    compare_parser = subcommands.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent')
+
+    child_parser = subcommands.add_parser('_child')
+    child_parser.add_argument('mode', choices=MODES)
+    add_workload_arguments(child_parser)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        return compare(args)
+    else:
+        run_child(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -3,65 +3,697 @@
 GPS Extractor Server - Extracts GPS data from photos using EXIFTool
 """
 
+import argparse
+import base64
+import bisect
+import csv
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import hashlib
 import json
+import logging
+import math
+import mmap
 import os
+import random
+import select
+import shutil
+import socket
+import sqlite3
+import struct
+import threading
 import tempfile
 import subprocess
 import urllib.request
 import urllib.parse
 import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from contextlib import contextmanager
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import sys
 
+logger = logging.getLogger('gps_extractor')
+
+# Structured request logging: level and the fraction of requests that get a timing record
+LOG_LEVEL = os.environ.get('GPS_LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('GPS_LOG_SAMPLE_RATE', '0.1'))
+
+# Default per-request budget; clients can lower or raise it with X-Request-Timeout-Ms
+REQUEST_TIMEOUT_MS = float(os.environ.get('GPS_REQUEST_TIMEOUT_MS', '20000'))
+EXIFTOOL_TIMEOUT = 30
+GEOCODE_TIMEOUT = 15
+
+# Online reverse geocoding providers (overridable, e.g. to point at a local stub)
+NOMINATIM_URL = os.environ.get('GPS_NOMINATIM_URL', 'https://nominatim.openstreetmap.org')
+BIGDATACLOUD_URL = os.environ.get('GPS_BIGDATACLOUD_URL', 'https://api.bigdatacloud.net')
+
+# Offline reverse geocoder index (see build-index subcommand)
+GEOCODER_INDEX_PATH = os.environ.get('GPS_GEOCODER_INDEX')
+GEOCODER_MAX_DISTANCE_KM = float(os.environ.get('GPS_GEOCODER_MAX_DISTANCE_KM', '50'))
+OFFLINE_GEOCODER = None
+
+# SQLite index of extracted photo metadata maintained by watch mode
+PHOTO_INDEX_PATH = os.environ.get('GPS_PHOTO_INDEX', 'photo-index.db')
+
+# Directory the /apply-plan endpoint may reorganize; unset disables the endpoint
+LIBRARY_ROOT = os.environ.get('GPS_LIBRARY_ROOT')
+
+# Routes that change files; they get no CORS headers, so browsers on other origins cannot call them
+PRIVATE_PATHS = ('/apply-plan',)
+
+# Offline administrative boundaries (GeoJSON, e.g. Natural Earth admin 0 / admin 1)
+COUNTRIES_GEOJSON_PATH = os.environ.get('GPS_COUNTRIES_GEOJSON')
+ADMIN1_GEOJSON_PATH = os.environ.get('GPS_ADMIN1_GEOJSON')
+BOUNDARIES = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(latitude, longitude):
+    """Convert latitude/longitude in degrees to a point on the unit sphere"""
+    lat = math.radians(latitude)
+    lng = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+
+def chord_to_km(chord_squared):
+    """Convert a squared chord length on the unit sphere to a great-circle distance"""
+    chord = math.sqrt(chord_squared)
+    return 2 * math.asin(min(1.0, chord / 2)) * EARTH_RADIUS_KM
+
+
+class GeocoderIndex:
+    """Read-only, memory-mapped reverse geocoding index.
+
+    The file is produced by ``build_geocoder_index`` and laid out so that it can be
+    used straight from the page cache without any parsing:
+
+        header        magic, version, place count, string count, string bytes
+        x, y, z       float32[count]   unit-sphere coordinates in k-d tree order
+        lat, lng      float32[count]   original coordinates in the same order
+        name_ids      uint32[count]    index into the string table
+        str_offsets   uint32[strings + 1]
+        str_data      utf-8 bytes of the interned place names
+
+    The k-d tree is implicit: the node of the range [lo, hi) is at (lo + hi) // 2
+    and splits on axis depth % 3. Every worker process that maps the same file
+    shares the same physical pages, so RSS does not grow per worker.
+    """
+
+    MAGIC = b'PSGI'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHIII')
+    HEADER_SIZE = 32
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, version, _flags, count, string_count, string_bytes = self.HEADER.unpack_from(view, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{path} is not a version {self.VERSION} geocoder index")
+        if sys.byteorder != 'little':
+            raise ValueError("Geocoder index requires a little-endian host")
+
+        self.count = count
+        sections = self.section_layout(count, string_count, string_bytes)
+        self._x = view[sections['x']].cast('f')
+        self._y = view[sections['y']].cast('f')
+        self._z = view[sections['z']].cast('f')
+        self._lat = view[sections['lat']].cast('f')
+        self._lng = view[sections['lng']].cast('f')
+        self._name_ids = view[sections['name_ids']].cast('I')
+        self._str_offsets = view[sections['str_offsets']].cast('I')
+        self._str_data = view[sections['str_data']]
+
+    @classmethod
+    def section_layout(cls, count, string_count, string_bytes):
+        """Return the byte slice of every section, each aligned to 8 bytes"""
+        sizes = [
+            ('x', 4 * count), ('y', 4 * count), ('z', 4 * count),
+            ('lat', 4 * count), ('lng', 4 * count),
+            ('name_ids', 4 * count),
+            ('str_offsets', 4 * (string_count + 1)),
+            ('str_data', string_bytes),
+        ]
+        layout = {}
+        offset = cls.HEADER_SIZE
+        for name, size in sizes:
+            layout[name] = slice(offset, offset + size)
+            offset += (size + 7) & ~7
+        return layout
+
+    def place_name(self, string_id):
+        """Decode one interned place name"""
+        start = self._str_offsets[string_id]
+        end = self._str_offsets[string_id + 1]
+        return self._str_data[start:end].tobytes().decode('utf-8')
+
+    def nearest(self, latitude, longitude):
+        """Return (place_name, distance_km, latitude, longitude) of the closest place"""
+        if self.count == 0:
+            return None
+        query = to_unit_vector(latitude, longitude)
+        axes = (self._x, self._y, self._z)
+        best_index = -1
+        best_distance = float('inf')
+
+        # Iterative descent; each entry carries the squared distance to its splitting plane
+        stack = [(0, self.count, 0, 0.0)]
+        while stack:
+            lo, hi, depth, plane_distance = stack.pop()
+            if lo >= hi or plane_distance >= best_distance:
+                continue
+            mid = (lo + hi) >> 1
+            dx = query[0] - self._x[mid]
+            dy = query[1] - self._y[mid]
+            dz = query[2] - self._z[mid]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best_distance:
+                best_distance = distance
+                best_index = mid
+
+            axis = depth % 3
+            diff = query[axis] - axes[axis][mid]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            stack.append((far[0], far[1], depth + 1, diff * diff))
+            stack.append((near[0], near[1], depth + 1, 0.0))
+
+        return (
+            self.place_name(self._name_ids[best_index]),
+            chord_to_km(best_distance),
+            self._lat[best_index],
+            self._lng[best_index],
+        )
+
+    def lookup(self, latitude, longitude, max_distance_km=GEOCODER_MAX_DISTANCE_KM):
+        """Return the nearest place name, or None if nothing is close enough"""
+        match = self.nearest(latitude, longitude)
+        if match and match[1] <= max_distance_km:
+            return match[0]
+        return None
+
+
+def read_gazetteer(source_path, admin1_codes_path=None, country_info_path=None):
+    """Yield (latitude, longitude, place_name) rows from a gazetteer file.
+
+    Accepts either a GeoNames dump (cities1000.txt etc., tab separated) or a
+    simple CSV/TSV with latitude, longitude and name columns.
+    """
+    admin1_names = {}
+    if admin1_codes_path:
+        with open(admin1_codes_path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) >= 2:
+                    admin1_names[parts[0]] = parts[1]
+
+    country_names = {}
+    if country_info_path:
+        with open(country_info_path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) >= 5:
+                    country_names[parts[0]] = parts[4]
+
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split('\t')
+            if len(parts) >= 19:
+                # GeoNames: name is column 1, lat/lng 4-5, country 8, admin1 10
+                name = parts[1]
+                country = parts[8]
+                region = admin1_names.get(f"{country}.{parts[10]}") or country_names.get(country, country)
+                place_name = f"{name}, {region}" if region else name
+                yield float(parts[4]), float(parts[5]), place_name
+            else:
+                if len(parts) < 3:
+                    parts = next(csv.reader([line]))
+                if len(parts) < 3:
+                    continue
+                try:
+                    yield float(parts[0]), float(parts[1]), parts[2].strip()
+                except ValueError:
+                    # Header row
+                    continue
+
+
+def build_geocoder_index(source_path, output_path, admin1_codes_path=None, country_info_path=None):
+    """Compile a gazetteer into the binary format read by GeocoderIndex"""
+    points = []
+    string_ids = {}
+    strings = []
+    for latitude, longitude, place_name in read_gazetteer(source_path, admin1_codes_path, country_info_path):
+        string_id = string_ids.get(place_name)
+        if string_id is None:
+            string_id = string_ids[place_name] = len(strings)
+            strings.append(place_name.encode('utf-8'))
+        points.append(to_unit_vector(latitude, longitude) + (latitude, longitude, string_id))
+
+    # Lay the points out as an implicit k-d tree: median of every range at its middle
+    stack = [(0, len(points), 0)]
+    while stack:
+        lo, hi, depth = stack.pop()
+        if hi - lo <= 1:
+            continue
+        axis = depth % 3
+        points[lo:hi] = sorted(points[lo:hi], key=lambda p: p[axis])
+        mid = (lo + hi) >> 1
+        stack.append((lo, mid, depth + 1))
+        stack.append((mid + 1, hi, depth + 1))
+
+    str_offsets = [0]
+    for encoded in strings:
+        str_offsets.append(str_offsets[-1] + len(encoded))
+
+    count = len(points)
+    layout = GeocoderIndex.section_layout(count, len(strings), str_offsets[-1])
+    sections = {
+        'x': struct.pack(f'<{count}f', *(p[0] for p in points)),
+        'y': struct.pack(f'<{count}f', *(p[1] for p in points)),
+        'z': struct.pack(f'<{count}f', *(p[2] for p in points)),
+        'lat': struct.pack(f'<{count}f', *(p[3] for p in points)),
+        'lng': struct.pack(f'<{count}f', *(p[4] for p in points)),
+        'name_ids': struct.pack(f'<{count}I', *(p[5] for p in points)),
+        'str_offsets': struct.pack(f'<{len(str_offsets)}I', *str_offsets),
+        'str_data': b''.join(strings),
+    }
+
+    # Write to a temporary file and rename so running servers never see a partial index
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        header = GeocoderIndex.HEADER.pack(
+            GeocoderIndex.MAGIC, GeocoderIndex.VERSION, 0, count, len(strings), str_offsets[-1]
+        )
+        f.write(header.ljust(GeocoderIndex.HEADER_SIZE, b'\0'))
+        for name, section in layout.items():
+            f.seek(section.start)
+            f.write(sections[name])
+        f.truncate(max(GeocoderIndex.HEADER_SIZE, *(s.stop for s in layout.values())))
+    os.replace(temp_path, output_path)
+    return count, len(strings)
+
+
+def load_offline_geocoder(path):
+    """Map the offline geocoder index and make it the first geocoding source"""
+    global OFFLINE_GEOCODER
+    OFFLINE_GEOCODER = GeocoderIndex(path)
+    return OFFLINE_GEOCODER
+
+
+class BoundaryIndex:
+    """Offline country/admin1 resolver over simplified boundary polygons.
+
+    Polygons are bucketed into a uniform latitude/longitude grid. Each grid cell
+    lists the regions whose bounding box overlaps it, and each region keeps its
+    edges bucketed by grid row, so a point-in-polygon test only walks the edges
+    that cross the point's latitude band.
+    """
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.regions = []
+        self.grid = {}
+
+    def _row(self, latitude):
+        return int(math.floor((latitude + 90) / self.cell_size))
+
+    def _col(self, longitude):
+        return int(math.floor((longitude + 180) / self.cell_size))
+
+    def load_geojson(self, path, level):
+        """Load a GeoJSON FeatureCollection (e.g. Natural Earth admin 0 or admin 1)"""
+        with open(path, encoding='utf-8') as f:
+            collection = json.load(f)
+        for feature in collection.get('features', []):
+            geometry = feature.get('geometry') or {}
+            props = feature.get('properties') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            name = first_property(props, ('name_en', 'NAME_EN', 'name', 'NAME', 'ADMIN', 'admin'))
+            if level == 'country':
+                country = first_property(props, ('ADMIN', 'admin', 'NAME_EN', 'name_en', 'NAME', 'name'))
+            else:
+                country = first_property(props, ('admin', 'ADMIN', 'geonunit', 'country'))
+            self.add_region(level, name, country, [ring for polygon in polygons for ring in polygon])
+        return self
+
+    def add_region(self, level, name, country, rings):
+        """Register one region; all rings (outer and holes) use the even-odd rule"""
+        region_id = len(self.regions)
+        edges_by_row = {}
+        min_x = min_y = float('inf')
+        max_x = max_y = float('-inf')
+        for ring in rings:
+            for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                min_x, max_x = min(min_x, x1), max(max_x, x1)
+                min_y, max_y = min(min_y, y1), max(max_y, y1)
+                if y1 == y2:
+                    # Horizontal edges never change the crossing count
+                    continue
+                for row in range(self._row(min(y1, y2)), self._row(max(y1, y2)) + 1):
+                    edges_by_row.setdefault(row, array('d')).extend((x1, y1, x2, y2))
+
+        self.regions.append({
+            'level': level,
+            'name': name,
+            'country': country,
+            'bbox': (min_x, min_y, max_x, max_y),
+            'edges_by_row': edges_by_row,
+        })
+        for row in range(self._row(min_y), self._row(max_y) + 1):
+            for col in range(self._col(min_x), self._col(max_x) + 1):
+                self.grid.setdefault((row, col), []).append(region_id)
+
+    def contains(self, region, latitude, longitude):
+        """Ray-casting point-in-polygon test against the edges of one grid row"""
+        min_x, min_y, max_x, max_y = region['bbox']
+        if not (min_x <= longitude <= max_x and min_y <= latitude <= max_y):
+            return False
+        edges = region['edges_by_row'].get(self._row(latitude))
+        if not edges:
+            return False
+        inside = False
+        for i in range(0, len(edges), 4):
+            x1, y1, x2, y2 = edges[i], edges[i + 1], edges[i + 2], edges[i + 3]
+            if (y1 > latitude) != (y2 > latitude):
+                if longitude < x1 + (latitude - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        return inside
+
+    def resolve(self, latitude, longitude):
+        """Return {'country', 'admin1'} for a point, or None if it is not on land"""
+        result = {}
+        for region_id in self.grid.get((self._row(latitude), self._col(longitude)), ()):
+            region = self.regions[region_id]
+            if region['level'] in result or not self.contains(region, latitude, longitude):
+                continue
+            if region['level'] == 'admin1':
+                result['admin1'] = region['name']
+                result.setdefault('country', region['country'])
+            else:
+                result['country'] = region['name']
+        if not result:
+            return None
+        result.setdefault('admin1', None)
+        return result
+
+
+def first_property(props, keys):
+    """Return the first non-empty value among several property spellings"""
+    for key in keys:
+        if props.get(key):
+            return props[key]
+    return None
+
+
+def load_boundaries(countries_path=None, admin1_path=None):
+    """Load the boundary resolver used to validate and name coordinates offline"""
+    global BOUNDARIES
+    index = BoundaryIndex()
+    if countries_path:
+        index.load_geojson(countries_path, 'country')
+    if admin1_path:
+        index.load_geojson(admin1_path, 'admin1')
+    BOUNDARIES = index
+    return index
+
+
+def offline_location_name(latitude, longitude):
+    """Name a point from the offline index and boundaries, or None to go online"""
+    place = OFFLINE_GEOCODER.lookup(latitude, longitude) if OFFLINE_GEOCODER is not None else None
+    if BOUNDARIES is None:
+        return place
+
+    admin = BOUNDARIES.resolve(latitude, longitude)
+    if admin is None:
+        # At sea: the nearest city is only a reference point, not the location
+        return f"Near {place.split(', ')[0]}" if place else None
+
+    region = admin['admin1'] or admin['country']
+    if place:
+        city, _, place_region = place.partition(', ')
+        if not place_region or place_region in (admin['admin1'], admin['country']):
+            return f"{city}, {region}" if region else city
+    # Nearest city lies across a border; fall back to the containing region
+    if admin['admin1'] and admin['country']:
+        return f"{admin['admin1']}, {admin['country']}"
+    return region
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus exposition model"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process counters and histograms rendered as Prometheus text at /metrics.
+
+    Metrics are per process; with --workers each worker exposes its own series,
+    distinguished by the pid label.
+    """
+
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                       0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """Render every series in Prometheus text format 0.0.4"""
+        pid = str(os.getpid())
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            snapshot = [(key, list(h.counts), h.sum, h.count) for key, h in histograms]
+
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        def label_text(labels, extra=()):
+            pairs = list(labels) + [('pid', pid)] + list(extra)
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{label_text(labels)} {value}")
+
+        for (name, labels), counts, total, count in snapshot:
+            header(name)
+            cumulative = 0
+            for bound, bucket_count in zip(self.LATENCY_BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{label_text(labels, [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{label_text(labels)} {total}")
+            lines.append(f"{name}_count{label_text(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+METRICS.describe('gps_extractor_stage_seconds', 'histogram', 'Time spent in each request stage')
+METRICS.describe('gps_extractor_request_seconds', 'histogram', 'Total request latency')
+METRICS.describe('gps_extractor_requests_total', 'counter', 'Requests handled by path and status')
+METRICS.describe('gps_extractor_offline_geocode_total', 'counter', 'Offline geocoder lookups by result')
+METRICS.describe('gps_extractor_geocode_provider_total', 'counter', 'Online geocoding calls by provider and result')
+
+
+@contextmanager
+def timed_stage(stage, timings=None, **labels):
+    """Time a block into the stage histogram and the per-request timings dict"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe('gps_extractor_stage_seconds', elapsed, stage=stage, **labels)
+        if timings is not None:
+            key = f"{stage}:{labels['provider']}" if 'provider' in labels else stage
+            timings[key] = round(timings.get(key, 0.0) + elapsed * 1000, 3)
+
+
+def log_request_sample(record):
+    """Emit one structured timing record for a sampled fraction of requests"""
+    if LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE:
+        logger.info(json.dumps(record, sort_keys=True))
+
+
+class Deadline:
+    """Absolute point in time by which a request must be answered"""
+
+    HEADER = 'X-Request-Timeout-Ms'
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    @classmethod
+    def from_headers(cls, headers):
+        """Use the client's budget if it sent one, else the server default"""
+        try:
+            budget_ms = float(headers.get(cls.HEADER) or REQUEST_TIMEOUT_MS)
+        except ValueError:
+            budget_ms = REQUEST_TIMEOUT_MS
+        return cls(max(0.0, budget_ms) / 1000.0)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap):
+        """Timeout for one stage: its own cap, cut to what is left of the budget"""
+        return min(cap, self.remaining())
+
+
 class GPSExtractorHandler(BaseHTTPRequestHandler):
+    # Per-request stage timings (ms), reset at the start of every request
+    timings = None
+
+    def log_message(self, format, *args):
+        """Route the default per-request access log through logging at DEBUG"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
     def do_OPTIONS(self):
-        """Handle CORS preflight requests"""
+        """Handle CORS preflight requests; /apply-plan is not offered to other origins"""
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        if self.path not in PRIVATE_PATHS:
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', f'Content-Type, {Deadline.HEADER}')
         self.end_headers()
+
+    def do_GET(self):
+        """Serve Prometheus metrics, trip summaries and map tiles"""
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/metrics':
+            body = METRICS.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/trips':
+            self.handle_trips(urllib.parse.parse_qs(url.query))
+        elif url.path.startswith('/tiles/'):
+            self.handle_tile(url.path[len('/tiles/'):], urllib.parse.parse_qs(url.query))
+        else:
+            self.send_error(404, "Not found")
     
     def do_POST(self):
         """Handle GPS extraction requests"""
         if self.path == '/extract-gps':
+            self.timings = {}
+            self.deadline = Deadline.from_headers(self.headers)
+            started = time.perf_counter()
+            status = 200
             try:
-                # Read the request data
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
+                # Read the request data; a client that stalls cannot hold us past the deadline
+                with timed_stage('body_read', self.timings):
+                    content_length = int(self.headers['Content-Length'])
+                    self.connection.settimeout(max(0.001, self.deadline.remaining()))
+                    try:
+                        post_data = self.rfile.read(content_length)
+                    finally:
+                        self.connection.settimeout(self.timeout)
+                    data = json.loads(post_data.decode('utf-8'))
                 
                 file_data = data.get('file_data')
                 file_name = data.get('filename', 'unknown.jpg')
                 
                 if not file_data:
+                    status = 400
                     self.send_error(400, "No file data provided.")
                     return
                 
                 # Decode base64 data
-                import base64
-                file_bytes = base64.b64decode(file_data)
+                with timed_stage('base64_decode', self.timings):
+                    file_bytes = base64.b64decode(file_data)
+                
+                if self.deadline.expired():
+                    status = 504
+                    self.send_error(504, "Request deadline exceeded before extraction")
+                    return
                 
                 # Create a temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as temp_file:
-                    temp_file.write(file_bytes)
-                    temp_file_path = temp_file.name
+                with timed_stage('temp_write', self.timings):
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as temp_file:
+                        temp_file.write(file_bytes)
+                        temp_file_path = temp_file.name
                 
                 try:
                     # Use EXIFTool to extract GPS data
-                    print(f"Processing file: {file_name}")
-                    result = self.extract_gps_with_exiftool(temp_file_path)
-                    print(f"GPS extraction result: {result}")
+                    with timed_stage('exiftool', self.timings):
+                        result = self.extract_gps_with_exiftool(temp_file_path)
+                    logger.debug("GPS extraction result for %s: %s", file_name, result)
                     
                     # If GPS data found, get location name
-                    print(f"GPS result check: success={result.get('success')}, has_location={result.get('has_location')}")
                     if result.get('success') and result.get('has_location'):
-                        print(f"🔍 CALLING REVERSE GEOCODING for {result['latitude']}, {result['longitude']}")
                         location_name = self.get_location_name(result['latitude'], result['longitude'])
                         result['location_name'] = location_name
-                        print(f"🌍 FINAL LOCATION NAME: {location_name}")
-                    else:
-                        print("❌ No GPS data found, skipping reverse geocoding")
+                        if location_name is None:
+                            # Out of budget: return the coordinates without a place name
+                            result['partial'] = True
+                            result['deadline_exceeded'] = 'geocode'
+                        logger.debug("Location name for %s: %s", file_name, location_name)
+                    elif result.get('deadline_exceeded'):
+                        result['partial'] = True
                     
                     # Send the result back
                     self.send_response(200)
@@ -77,228 +709,1238 @@ class GPSExtractorHandler(BaseHTTPRequestHandler):
                     except:
                         pass
                 
+            except socket.timeout:
+                status = 408
+                self.send_error(408, "Request body not received before the deadline")
             except Exception as e:
+                status = 500
                 self.send_error(500, f"Error processing file: {str(e)}")
+            finally:
+                elapsed = time.perf_counter() - started
+                METRICS.observe('gps_extractor_request_seconds', elapsed, path=self.path)
+                METRICS.inc('gps_extractor_requests_total', path=self.path, status=str(status))
+                log_request_sample({
+                    'event': 'extract_gps',
+                    'status': status,
+                    'total_ms': round(elapsed * 1000, 3),
+                    'budget_ms': round(self.deadline.budget * 1000, 3),
+                    'stages_ms': self.timings,
+                })
+        elif self.path == '/apply-plan':
+            self.handle_apply_plan()
         else:
             self.send_error(404, "Not found")
     
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path not in PRIVATE_PATHS:
+            self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_trips(self, query):
+        """Group the indexed photos into trips by time gap and distance"""
+        if not os.path.exists(PHOTO_INDEX_PATH):
+            self.send_error(404, "No photo index; run the watch command first")
+            return
+        try:
+            gap_hours = float(query.get('gap_hours', [TRIP_GAP_HOURS])[0])
+            distance_km = float(query.get('distance_km', [TRIP_DISTANCE_KM])[0])
+        except ValueError:
+            self.send_error(400, "gap_hours and distance_km must be numbers")
+            return
+        geocode = query.get('geocode', ['0'])[0].lower() in ('1', 'true', 'yes')
+        include_photos = query.get('photos', ['0'])[0].lower() in ('1', 'true', 'yes')
+        
+        index = PhotoIndex(PHOTO_INDEX_PATH)
+        try:
+            with timed_stage('trip_segmentation'):
+                result = trips_from_index(index, gap_hours, distance_km, geocode=geocode,
+                                          include_photos=include_photos)
+        finally:
+            index.close()
+        self.send_json(200, result)
+    
+    def handle_tile(self, tile_path, query):
+        """Photo counts or points for one map tile: /tiles/{z}/{x}/{y}"""
+        try:
+            zoom, x, y = (int(part) for part in tile_path.split('/'))
+            depth = int(query.get('depth', ['2'])[0])
+            limit = int(query.get('limit', [TILE_POINT_LIMIT])[0])
+        except ValueError:
+            self.send_error(400, "Expected /tiles/{z}/{x}/{y} with integer depth and limit")
+            return
+        mode = query.get('mode', ['auto'])[0]
+        if not 0 <= zoom <= TILE_MAX_ZOOM or not (0 <= x < 1 << zoom and 0 <= y < 1 << zoom):
+            self.send_error(400, f"Tile out of range (zoom 0-{TILE_MAX_ZOOM})")
+            return
+        if mode not in ('auto', 'counts', 'points'):
+            self.send_error(400, "mode must be auto, counts or points")
+            return
+        if not os.path.exists(PHOTO_INDEX_PATH):
+            self.send_error(404, "No photo index; run the watch command first")
+            return
+        
+        index = PhotoIndex(PHOTO_INDEX_PATH)
+        try:
+            with timed_stage('tile_query'):
+                result = index.tile(zoom, x, y, depth=min(max(depth, 0), TILE_MAX_DEPTH), mode=mode,
+                                    limit=min(max(limit, 0), TILE_POINT_LIMIT))
+        finally:
+            index.close()
+        self.send_json(200, result)
+    
+    def handle_apply_plan(self):
+        """Apply, resume or roll back a sort plan inside the configured library root"""
+        if not LIBRARY_ROOT:
+            self.send_error(403, "Server was started without a library root")
+            return
+        # A JSON body cannot be sent cross-origin without a preflight, which this route never grants
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            self.send_error(415, "Content-Type must be application/json")
+            return
+        try:
+            content_length = int(self.headers['Content-Length'])
+            plan = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            action = plan.get('action', 'apply')
+            executor = PlanExecutor(plan, LIBRARY_ROOT)
+            with timed_stage('apply_plan', action=action):
+                if action == 'rollback':
+                    summary = executor.rollback()
+                elif action in ('apply', 'resume'):
+                    summary = executor.apply(resume=action == 'resume')
+                else:
+                    raise PlanError(f"Unknown action {action!r}")
+            self.send_json(200, summary)
+        except (PlanError, KeyError, ValueError) as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.send_error(500, f"Error applying plan: {str(e)}")
+    
     def extract_gps_with_exiftool(self, file_path):
-        """Extract GPS data using EXIFTool"""
+        """Extract GPS data using EXIFTool within the request deadline"""
+        return extract_gps_with_exiftool(file_path, self.deadline)
+    
+    def get_location_name(self, latitude, longitude):
+        """Get location name from coordinates, recording per-provider timings"""
+        return get_location_name(latitude, longitude, self.timings, self.deadline)
+
+def run_killable(cmd, timeout):
+    """subprocess.run, but a timeout kills the whole process group (exiftool and any helpers)"""
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
         try:
-            # Run EXIFTool to get GPS coordinates
-            cmd = [
-                'exiftool',
-                '-GPS:GPSLatitude',
-                '-GPS:GPSLongitude', 
-                '-GPS:GPSLatitudeRef',
-                '-GPS:GPSLongitudeRef',
-                '-c', '%.6f',
-                '-j',  # JSON output
-                file_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                # Parse the JSON output
-                exif_data = json.loads(result.stdout)
-                if exif_data and len(exif_data) > 0:
-                    gps_data = exif_data[0]
-                    
-                    lat = gps_data.get('GPSLatitude')
-                    lng = gps_data.get('GPSLongitude')
-                    lat_ref = gps_data.get('GPSLatitudeRef', 'N')
-                    lng_ref = gps_data.get('GPSLongitudeRef', 'E')
-                    
-                    # Debug: Print the raw GPS data
-                    print(f"🔍 RAW GPS DATA: lat={lat}, lng={lng}, lat_ref={lat_ref}, lng_ref={lng_ref}")
-                    
-                    if lat and lng:
-                        # Convert to decimal degrees
-                        latitude = float(lat)
-                        longitude = float(lng)
-                        
-                        # Apply direction references
-                        if lat_ref == 'S':
-                            latitude = -latitude
-                        if lng_ref == 'W':
-                            longitude = -longitude
-                        
-                        # Special handling for California coordinates
-                        # If longitude is positive but should be negative for California
-                        if latitude > 30 and latitude < 50 and longitude > 0 and longitude < 180:
-                            # This looks like California coordinates that should be negative
-                            print(f"⚠️  SUSPECTED CALIFORNIA COORDINATES: Converting {longitude} to {-longitude}")
+            os.killpg(process.pid, 9)
+        except OSError:
+            process.kill()
+        process.communicate()
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+def parse_capture_time(value):
+    """Normalize an exiftool date (formatted with -d) to ISO 8601, or None if unset/invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%dT%H:%M:%S').isoformat()
+    except ValueError:
+        # Cameras write 0000:00:00 00:00:00 when the clock was never set
+        return None
+
+def extract_gps_with_exiftool(file_path, deadline=None):
+    """Extract GPS data using EXIFTool; the process is killed if the deadline passes"""
+    timeout = deadline.timeout(EXIFTOOL_TIMEOUT) if deadline else EXIFTOOL_TIMEOUT
+    try:
+        # Run EXIFTool to get GPS coordinates
+        cmd = [
+            'exiftool',
+            '-GPS:GPSLatitude',
+            '-GPS:GPSLongitude', 
+            '-GPS:GPSLatitudeRef',
+            '-GPS:GPSLongitudeRef',
+            '-EXIF:DateTimeOriginal',
+            '-QuickTime:CreateDate',
+            '-c', '%.6f',
+            '-d', '%Y-%m-%dT%H:%M:%S',
+            '-j',  # JSON output
+            file_path
+        ]
+
+        result = run_killable(cmd, timeout)
+
+        if result.returncode == 0:
+            # Parse the JSON output
+            exif_data = json.loads(result.stdout)
+            if exif_data and len(exif_data) > 0:
+                gps_data = exif_data[0]
+
+                lat = gps_data.get('GPSLatitude')
+                lng = gps_data.get('GPSLongitude')
+                # exiftool prints references as words ("South", "West"), so compare the first letter
+                lat_ref = str(gps_data.get('GPSLatitudeRef', 'N'))[:1].upper()
+                lng_ref = str(gps_data.get('GPSLongitudeRef', ''))[:1].upper()
+                captured_at = parse_capture_time(gps_data.get('DateTimeOriginal') or gps_data.get('CreateDate'))
+
+                if lat and lng:
+                    # Convert to decimal degrees
+                    latitude = float(lat)
+                    longitude = float(lng)
+
+                    # Apply direction references
+                    if lat_ref == 'S':
+                        latitude = -latitude
+                    if lng_ref == 'W':
+                        longitude = -longitude
+
+                    # Some writers drop GPSLongitudeRef; only flip the sign when the
+                    # boundaries confirm the east reading is at sea and the west one on land
+                    if not lng_ref and BOUNDARIES is not None and longitude > 0:
+                        if BOUNDARIES.resolve(latitude, longitude) is None and \
+                                BOUNDARIES.resolve(latitude, -longitude) is not None:
+                            logger.info("Missing longitude ref: %s is at sea, using %s", longitude, -longitude)
                             longitude = -longitude
-                        
-                        # Debug: Print the raw GPS data
-                        print(f"Raw GPS data: lat={lat}, lng={lng}, lat_ref={lat_ref}, lng_ref={lng_ref}")
-                        print(f"Converted coordinates: {latitude}, {longitude}")
-                        
-                        return {
-                            'success': True,
-                            'latitude': latitude,
-                            'longitude': longitude,
-                            'has_location': True
-                        }
-                    else:
-                        return {
-                            'success': True,
-                            'latitude': None,
-                            'longitude': None,
-                            'has_location': False,
-                            'message': 'No GPS data found in file'
-                        }
+
+                    logger.debug("Raw GPS data: lat=%s, lng=%s, lat_ref=%s, lng_ref=%s -> %s, %s",
+                                 lat, lng, lat_ref, lng_ref, latitude, longitude)
+
+                    return {
+                        'success': True,
+                        'latitude': latitude,
+                        'longitude': longitude,
+                        'captured_at': captured_at,
+                        'has_location': True
+                    }
                 else:
                     return {
-                        'success': False,
-                        'error': 'No EXIF data found'
+                        'success': True,
+                        'latitude': None,
+                        'longitude': None,
+                        'captured_at': captured_at,
+                        'has_location': False,
+                        'message': 'No GPS data found in file'
                     }
             else:
                 return {
                     'success': False,
-                    'error': f'EXIFTool error: {result.stderr}'
+                    'error': 'No EXIF data found'
                 }
-                
-        except subprocess.TimeoutExpired:
+        else:
             return {
                 'success': False,
-                'error': 'EXIFTool timeout'
+                'error': f'EXIFTool error: {result.stderr}'
             }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'EXIFTool exception: {str(e)}'
+
+    except subprocess.TimeoutExpired:
+        return {
+            'success': False,
+            'error': 'EXIFTool timeout',
+            'deadline_exceeded': 'exiftool' if timeout < EXIFTOOL_TIMEOUT else None
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'EXIFTool exception: {str(e)}'
+        }
+
+def get_location_name(latitude, longitude, timings=None, deadline=None):
+    """Get location name from coordinates using multiple reverse geocoding APIs"""
+    if OFFLINE_GEOCODER is not None or BOUNDARIES is not None:
+        with timed_stage('geocode', timings, provider='offline'):
+            location_name = offline_location_name(latitude, longitude)
+        METRICS.inc('gps_extractor_offline_geocode_total', result='hit' if location_name else 'miss')
+        if location_name:
+            return location_name
+
+    try:
+        # Try multiple APIs for better reliability
+        apis = [
+            # API 1: OpenStreetMap Nominatim (with different parameters)
+            {
+                'name': 'nominatim',
+                'url': f"{NOMINATIM_URL}/reverse?format=json&lat={latitude}&lon={longitude}&zoom=5&addressdetails=1&accept-language=en",
+                'headers': {
+                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                    'Accept': 'application/json',
+                    'Accept-Language': 'en-US,en;q=0.9'
+                }
+            },
+            # API 2: BigDataCloud (free, no rate limits)
+            {
+                'name': 'bigdatacloud',
+                'url': f"{BIGDATACLOUD_URL}/data/reverse-geocode-client?latitude={latitude}&longitude={longitude}&localityLanguage=en",
+                'headers': {
+                    'User-Agent': 'photoSorter/1.0',
+                    'Accept': 'application/json'
+                }
+            },
+            # API 3: OpenStreetMap with different zoom level
+            {
+                'name': 'nominatim_coarse',
+                'url': f"{NOMINATIM_URL}/reverse?format=json&lat={latitude}&lon={longitude}&zoom=3&addressdetails=1",
+                'headers': {
+                    'User-Agent': 'photoSorter/1.0 (https://github.com/photoSorter)',
+                    'Accept': 'application/json'
+                }
             }
-    
-    def get_location_name(self, latitude, longitude):
-        """Get location name from coordinates using multiple reverse geocoding APIs"""
+        ]
+
+        for i, api in enumerate(apis):
+            if deadline is not None and deadline.expired():
+                # Cancel the remaining providers; the caller returns coordinates only
+                METRICS.inc('gps_extractor_geocode_provider_total', provider=api['name'], result='cancelled')
+                return None
+            try:
+                # Create request
+                req = urllib.request.Request(api['url'])
+                for header, value in api['headers'].items():
+                    req.add_header(header, value)
+
+                # Make the request
+                timeout = deadline.timeout(GEOCODE_TIMEOUT) if deadline else GEOCODE_TIMEOUT
+                with timed_stage('geocode', timings, provider=api['name']):
+                    with urllib.request.urlopen(req, timeout=timeout) as response:
+                        data = json.loads(response.read().decode('utf-8'))
+                logger.debug("API %s response: %s", api['name'], data)
+
+                if i == 0 or i == 2:  # OpenStreetMap APIs
+                    if data and data.get('display_name') and not data.get('error'):
+                        # Extract location name
+                        if data.get('address'):
+                            addr = data['address']
+                            if addr.get('city') or addr.get('town') or addr.get('village'):
+                                location_name = addr.get('city') or addr.get('town') or addr.get('village')
+                                if addr.get('state'):
+                                    location_name += f", {addr['state']}"
+                                elif addr.get('country'):
+                                    location_name += f", {addr['country']}"
+                            elif addr.get('state'):
+                                location_name = addr['state']
+                                if addr.get('country'):
+                                    location_name += f", {addr['country']}"
+                            elif addr.get('country'):
+                                location_name = addr['country']
+                            else:
+                                location_name = data['display_name'].split(',')[0]
+                        else:
+                            location_name = data['display_name'].split(',')[0]
+
+                        METRICS.inc('gps_extractor_geocode_provider_total', provider=api['name'], result='found')
+                        return location_name
+
+                elif i == 1:  # BigDataCloud API
+                    if data and not data.get('error'):
+                        city = data.get('city', '')
+                        state = data.get('principalSubdivision', '')
+                        country = data.get('countryName', '')
+                        locality = data.get('locality', '')
+
+                        # Build location name from available data
+                        if city:
+                            location_name = city
+                            if state:
+                                location_name += f", {state}"
+                            elif country:
+                                location_name += f", {country}"
+                        elif state:
+                            location_name = state
+                            if country:
+                                location_name += f", {country}"
+                        elif country:
+                            location_name = country
+                        elif locality:
+                            # Special handling for ocean locations
+                            if "sea" in locality.lower() or "ocean" in locality.lower():
+                                location_name = f"Near {locality}"
+                            else:
+                                location_name = f"Near {locality}"
+                        else:
+                            # If all else fails, use coordinates
+                            location_name = f"{latitude:.4f}, {longitude:.4f}"
+
+                        METRICS.inc('gps_extractor_geocode_provider_total', provider=api['name'], result='found')
+                        return location_name
+
+                METRICS.inc('gps_extractor_geocode_provider_total', provider=api['name'], result='empty')
+
+                # Add delay between API calls to avoid rate limiting
+                time.sleep(deadline.timeout(1) if deadline else 1)
+
+            except Exception as e:
+                METRICS.inc('gps_extractor_geocode_provider_total', provider=api['name'], result='error')
+                logger.warning("Geocoding API %s failed: %s", api['name'], e)
+                continue
+
+        if deadline is not None and deadline.expired():
+            return None
+        
+        # If all APIs fail, return coordinates
+        logger.warning("All reverse geocoding APIs failed for %.4f, %.4f", latitude, longitude)
+        return f"{latitude:.4f}, {longitude:.4f}"
+
+    except Exception as e:
+        logger.error("Error getting location name: %s", e)
+        return f"{latitude:.4f}, {longitude:.4f}"
+
+PHOTO_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.heic', '.heif', '.tif', '.tiff', '.dng', '.cr2', '.nef', '.arw',
+    '.mp4', '.mov', '.m4v', '.3gp',
+}
+
+
+def is_photo(path):
+    name = os.path.basename(path)
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in PHOTO_EXTENSIONS
+
+
+TILE_MAX_ZOOM = 18
+TILE_MAX_DEPTH = 4
+TILE_POINT_LIMIT = int(os.environ.get('GPS_TILE_POINT_LIMIT', '256'))
+MERCATOR_MAX_LAT = 85.05112878
+
+
+def lat_lng_to_tile(latitude, longitude, zoom=TILE_MAX_ZOOM):
+    """Web Mercator tile (x, y) containing a point; latitudes past the projection clamp to the edge"""
+    latitude = min(max(latitude, -MERCATOR_MAX_LAT), MERCATOR_MAX_LAT)
+    n = 1 << zoom
+    sin_lat = math.sin(math.radians(latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_to_quadkey(x, y, zoom):
+    """Bing-style quadkey: one base-4 digit per zoom level, so a tile's key prefixes all its descendants"""
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def quadkey_to_tile(quadkey):
+    x = y = 0
+    for digit in quadkey:
+        x, y = (x << 1) | (int(digit) & 1), (y << 1) | (int(digit) >> 1)
+    return x, y, len(quadkey)
+
+
+def point_quadkey(latitude, longitude):
+    """Quadkey of the max-zoom tile containing a point, or None without coordinates"""
+    if latitude is None or longitude is None:
+        return None
+    return tile_to_quadkey(*lat_lng_to_tile(latitude, longitude), TILE_MAX_ZOOM)
+
+
+class PhotoIndex:
+    """SQLite index of extracted photo metadata, keyed by absolute path"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS photos (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            latitude REAL,
+            longitude REAL,
+            location_name TEXT,
+            captured_at REAL,
+            quadkey TEXT,
+            error TEXT,
+            indexed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS photos_quadkey ON photos (quadkey);
+        CREATE TABLE IF NOT EXISTS tile_counts (
+            zoom INTEGER NOT NULL,
+            quadkey TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (zoom, quadkey)
+        ) WITHOUT ROWID
+    """
+
+    # Columns added after the first release, applied to existing databases on open
+    MIGRATIONS = (
+        ('captured_at', 'ALTER TABLE photos ADD COLUMN captured_at REAL'),
+        ('quadkey', 'ALTER TABLE photos ADD COLUMN quadkey TEXT'),
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(photos)')}
+        for column, statement in self.MIGRATIONS:
+            if columns and column not in columns:
+                self._db.execute(statement)
+        self._db.executescript(self.SCHEMA)
+        if columns and 'quadkey' not in columns:
+            self.rebuild_tiles()
+
+    def is_current(self, path, size, mtime):
+        """True if the file was indexed with this size and mtime"""
+        with self._lock:
+            row = self._db.execute('SELECT size, mtime FROM photos WHERE path = ?', (path,)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def upsert(self, record):
+        record = dict(record, quadkey=point_quadkey(record.get('latitude'), record.get('longitude')))
+        with self._lock, self._db:
+            row = self._db.execute('SELECT quadkey FROM photos WHERE path = ?', (record['path'],)).fetchone()
+            previous = row[0] if row else None
+            self._db.execute(
+                'INSERT OR REPLACE INTO photos '
+                '(path, size, mtime, latitude, longitude, location_name, captured_at, quadkey, error, indexed_at) '
+                'VALUES (:path, :size, :mtime, :latitude, :longitude, :location_name, :captured_at, :quadkey, '
+                ':error, :indexed_at)',
+                record,
+            )
+            if previous != record['quadkey']:
+                self._adjust_tiles(previous, -1)
+                self._adjust_tiles(record['quadkey'], 1)
+
+    def remove(self, path):
+        """Drop a file, or every file under a directory that went away"""
+        # Paths under the directory sort between 'dir/' and 'dir0' ('0' follows the separator); unlike
+        # LIKE this is case-sensitive, has no wildcards and can use the primary key index
+        directory = path.rstrip(os.sep)
+        bounds = (path, directory + os.sep, directory + chr(ord(os.sep) + 1))
+        where = 'path = ? OR (path >= ? AND path < ?)'
+        with self._lock, self._db:
+            rows = self._db.execute(f'SELECT quadkey FROM photos WHERE ({where}) AND quadkey IS NOT NULL',
+                                    bounds).fetchall()
+            self._db.execute(f'DELETE FROM photos WHERE {where}', bounds)
+            for (quadkey,) in rows:
+                self._adjust_tiles(quadkey, -1)
+
+    def _adjust_tiles(self, quadkey, delta):
+        """Add delta to the count of every tile from the world tile down to the photo's max-zoom tile"""
+        if quadkey is None:
+            return
+        tiles = [(zoom, quadkey[:zoom], delta) for zoom in range(len(quadkey) + 1)]
+        self._db.executemany(
+            'INSERT INTO tile_counts (zoom, quadkey, count) VALUES (?, ?, ?) '
+            'ON CONFLICT (zoom, quadkey) DO UPDATE SET count = count + excluded.count',
+            tiles,
+        )
+        if delta < 0:
+            self._db.executemany('DELETE FROM tile_counts WHERE zoom = ? AND quadkey = ? AND count <= 0',
+                                 [tile[:2] for tile in tiles])
+
+    def rebuild_tiles(self):
+        """Recompute quadkeys and the whole tile pyramid, e.g. for databases indexed before tiles existed"""
+        with self._db:
+            rows = self._db.execute('SELECT path, latitude, longitude FROM photos').fetchall()
+            self._db.executemany('UPDATE photos SET quadkey = ? WHERE path = ?',
+                                 [(point_quadkey(lat, lng), path) for path, lat, lng in rows])
+            self._db.execute('DELETE FROM tile_counts')
+            for zoom in range(TILE_MAX_ZOOM + 1):
+                self._db.execute(
+                    'INSERT INTO tile_counts (zoom, quadkey, count) '
+                    'SELECT ?, substr(quadkey, 1, ?), COUNT(*) FROM photos '
+                    'WHERE quadkey IS NOT NULL GROUP BY substr(quadkey, 1, ?)',
+                    (zoom, zoom, zoom),
+                )
+
+    def tile(self, zoom, x, y, depth=2, mode='auto', limit=TILE_POINT_LIMIT):
+        """Photo count of one tile plus either its sub-tile counts `depth` levels down or its points.
+
+        Both answers are bounded (at most 4**depth cells or `limit` points) regardless of library
+        size; 'auto' returns points once the tile holds no more than `limit` photos.
+        """
+        quadkey = tile_to_quadkey(x, y, zoom)
+        # Quadkey digits are 0-3, so every descendant sorts in [quadkey, quadkey + '4')
+        bounds = (quadkey, quadkey + '4')
+        with self._lock:
+            row = self._db.execute('SELECT count FROM tile_counts WHERE zoom = ? AND quadkey = ?',
+                                   (zoom, quadkey)).fetchone()
+            count = row[0] if row else 0
+            result = {'z': zoom, 'x': x, 'y': y, 'count': count}
+            if mode == 'points' or (mode == 'auto' and count <= limit):
+                points = self._db.execute(
+                    'SELECT path, latitude, longitude FROM photos WHERE quadkey >= ? AND quadkey < ? LIMIT ?',
+                    bounds + (limit,)).fetchall()
+                result['points'] = [{'path': path, 'latitude': lat, 'longitude': lng}
+                                    for path, lat, lng in points]
+                result['truncated'] = count > len(points)
+            else:
+                depth = min(depth, TILE_MAX_ZOOM - zoom)
+                cells = self._db.execute(
+                    'SELECT quadkey, count FROM tile_counts WHERE zoom = ? AND quadkey >= ? AND quadkey < ?',
+                    (zoom + depth,) + bounds).fetchall()
+                result['cells'] = [dict(zip(('x', 'y', 'z'), quadkey_to_tile(key)), count=cell_count)
+                                   for key, cell_count in cells]
+        return result
+
+    def records(self):
+        """All (path, captured_at, latitude, longitude) rows, for batch analysis"""
+        with self._lock:
+            return self._db.execute('SELECT path, captured_at, latitude, longitude FROM photos').fetchall()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM photos').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def iso_to_epoch(value):
+    """Capture times carry no zone; store them as if UTC so ordering and gaps are preserved"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def index_photo(index, path):
+    """Extract GPS data for one file and store it unless the index is already current"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        index.remove(path)
+        return None
+    if index.is_current(path, stat.st_size, stat.st_mtime):
+        return None
+
+    with timed_stage('exiftool'):
+        result = extract_gps_with_exiftool(path)
+    record = {
+        'path': path,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'latitude': result.get('latitude'),
+        'longitude': result.get('longitude'),
+        'location_name': None,
+        'captured_at': iso_to_epoch(result.get('captured_at')),
+        'error': result.get('error'),
+        'indexed_at': time.time(),
+    }
+    if result.get('has_location'):
+        record['location_name'] = get_location_name(result['latitude'], result['longitude'])
+    index.upsert(record)
+    return record
+
+
+class InotifyWatcher:
+    """Recursive directory watcher on Linux inotify, loaded through ctypes"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self._paths = {}
+        self._add_tree(root)
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            logger.warning("Cannot watch %s: %s", directory, os.strerror(ctypes.get_errno()))
+            return
+        self._paths[wd] = directory
+
+    def _add_tree(self, directory):
+        """Watch a directory and everything below it; returns the files already there"""
+        found = []
+        for current, dirs, files in os.walk(directory):
+            self._add_watch(current)
+            found.extend(os.path.join(current, name) for name in files)
+        return found
+
+    def events(self, timeout):
+        """Wait up to `timeout` seconds and return [(kind, path)] with kind 'changed' or 'removed'"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
         try:
-            import urllib.request
-            import urllib.parse
-            import time
-            
-            # Try multiple APIs for better reliability
-            apis = [
-                # API 1: OpenStreetMap Nominatim (with different parameters)
-                {
-                    'url': f"https://nominatim.openstreetmap.org/reverse?format=json&lat={latitude}&lon={longitude}&zoom=5&addressdetails=1&accept-language=en",
-                    'headers': {
-                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                        'Accept': 'application/json',
-                        'Accept-Language': 'en-US,en;q=0.9'
-                    }
-                },
-                # API 2: BigDataCloud (free, no rate limits)
-                {
-                    'url': f"https://api.bigdatacloud.net/data/reverse-geocode-client?latitude={latitude}&longitude={longitude}&localityLanguage=en",
-                    'headers': {
-                        'User-Agent': 'photoSorter/1.0',
-                        'Accept': 'application/json'
-                    }
-                },
-                # API 3: OpenStreetMap with different zoom level
-                {
-                    'url': f"https://nominatim.openstreetmap.org/reverse?format=json&lat={latitude}&lon={longitude}&zoom=3&addressdetails=1",
-                    'headers': {
-                        'User-Agent': 'photoSorter/1.0 (https://github.com/photoSorter)',
-                        'Accept': 'application/json'
-                    }
-                }
-            ]
-            
-            for i, api in enumerate(apis):
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        results = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _cookie, length = self.EVENT.unpack_from(buffer, offset)
+            name = buffer[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0')
+            offset += self.EVENT.size + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were dropped; rescan everything once to catch up
+                results.extend(('changed', path) for path in self._add_tree(self.root))
+                continue
+            if mask & self.IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            directory = self._paths.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # A new or moved-in directory may already contain files
+                    results.extend(('changed', p) for p in self._add_tree(path))
+                elif mask & (self.IN_MOVED_FROM | self.IN_DELETE):
+                    results.append(('removed', path))
+            elif mask & (self.IN_MOVED_FROM | self.IN_DELETE):
+                results.append(('removed', path))
+            else:
+                results.append(('changed', path))
+        return results
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Portable fallback: compares (size, mtime) snapshots of the tree every interval"""
+
+    def __init__(self, root, interval=5.0):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for current, _dirs, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(current, name)
                 try:
-                    print(f"Trying API {i+1} for location: {latitude}, {longitude}")
-                    
-                    # Create request
-                    req = urllib.request.Request(api['url'])
-                    for header, value in api['headers'].items():
-                        req.add_header(header, value)
-                    
-                    # Make the request
-                    with urllib.request.urlopen(req, timeout=15) as response:
-                        data = json.loads(response.read().decode('utf-8'))
-                        print(f"API {i+1} response: {data}")
-                        
-                        if i == 0 or i == 2:  # OpenStreetMap APIs
-                            if data and data.get('display_name') and not data.get('error'):
-                                # Extract location name
-                                if data.get('address'):
-                                    addr = data['address']
-                                    if addr.get('city') or addr.get('town') or addr.get('village'):
-                                        location_name = addr.get('city') or addr.get('town') or addr.get('village')
-                                        if addr.get('state'):
-                                            location_name += f", {addr['state']}"
-                                        elif addr.get('country'):
-                                            location_name += f", {addr['country']}"
-                                    elif addr.get('state'):
-                                        location_name = addr['state']
-                                        if addr.get('country'):
-                                            location_name += f", {addr['country']}"
-                                    elif addr.get('country'):
-                                        location_name = addr['country']
-                                    else:
-                                        location_name = data['display_name'].split(',')[0]
-                                else:
-                                    location_name = data['display_name'].split(',')[0]
-                                
-                                print(f"Location found: {location_name}")
-                                return location_name
-                        
-                        elif i == 1:  # BigDataCloud API
-                            if data and not data.get('error'):
-                                city = data.get('city', '')
-                                state = data.get('principalSubdivision', '')
-                                country = data.get('countryName', '')
-                                locality = data.get('locality', '')
-                                
-                                # Build location name from available data
-                                if city:
-                                    location_name = city
-                                    if state:
-                                        location_name += f", {state}"
-                                    elif country:
-                                        location_name += f", {country}"
-                                elif state:
-                                    location_name = state
-                                    if country:
-                                        location_name += f", {country}"
-                                elif country:
-                                    location_name = country
-                                elif locality:
-                                    # Special handling for ocean locations
-                                    if "sea" in locality.lower() or "ocean" in locality.lower():
-                                        location_name = f"Near {locality}"
-                                    else:
-                                        location_name = f"Near {locality}"
-                                else:
-                                    # If all else fails, use coordinates
-                                    location_name = f"{latitude:.4f}, {longitude:.4f}"
-                                
-                                print(f"Location found: {location_name}")
-                                return location_name
-                    
-                    # Add delay between API calls to avoid rate limiting
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    print(f"API {i+1} failed: {e}")
+                    stat = os.stat(path)
+                except OSError:
                     continue
-            
-            # If all APIs fail, return coordinates
-            print("All reverse geocoding APIs failed")
-            return f"{latitude:.4f}, {longitude:.4f}"
-                    
+                snapshot[path] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    def events(self, timeout):
+        wait = self._next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait))
+        self._next_scan = time.monotonic() + self.interval
+
+        snapshot = self._scan()
+        results = [('changed', path) for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        results.extend(('removed', path) for path in self._snapshot if path not in snapshot)
+        self._snapshot = snapshot
+        return results
+
+    def close(self):
+        pass
+
+
+def watch_directory(root, index, workers=4, debounce=2.0, poll=False, poll_interval=5.0):
+    """Keep the photo index current for everything under root until interrupted.
+
+    Bursts of events for the same file (a camera import writes, closes and renames)
+    are debounced: a file is only handed to the worker pool once it has been quiet
+    for `debounce` seconds.
+    """
+    root = os.path.abspath(root)
+    watcher = None
+    if not poll:
+        try:
+            watcher = InotifyWatcher(root)
+            logger.info("Watching %s with inotify", root)
+        except OSError as e:
+            logger.info("inotify unavailable (%s), falling back to polling", e)
+    if watcher is None:
+        watcher = PollingWatcher(root, poll_interval)
+        logger.info("Watching %s by polling every %.1fs", root, poll_interval)
+
+    pending = {}
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='indexer')
+
+    def index_safely(path):
+        try:
+            index_photo(index, path)
         except Exception as e:
-            print(f"Error getting location name: {e}")
-            return f"{latitude:.4f}, {longitude:.4f}"
+            logger.error("Indexing %s failed: %s", path, e)
+
+    def submit(path):
+        pool.submit(index_safely, path)
+
+    # Catch up with anything that changed while we were not running
+    for current, _dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(current, name)
+            if is_photo(path):
+                submit(path)
+
+    try:
+        while True:
+            for kind, path in watcher.events(timeout=min(debounce, 1.0)):
+                if kind == 'removed':
+                    pending.pop(path, None)
+                    index.remove(path)
+                elif is_photo(path):
+                    pending[path] = time.monotonic()
+
+            quiet_before = time.monotonic() - debounce
+            ready = [path for path, last_event in pending.items() if last_event <= quiet_before]
+            for path in ready:
+                del pending[path]
+                submit(path)
+    except KeyboardInterrupt:
+        logger.info("Stopping watcher; %d photos indexed", index.count())
+    finally:
+        watcher.close()
+        pool.shutdown(wait=True)
+
 
-def run_server(port):
+TRIP_GAP_HOURS = float(os.environ.get('GPS_TRIP_GAP_HOURS', '12'))
+TRIP_DISTANCE_KM = float(os.environ.get('GPS_TRIP_DISTANCE_KM', '100'))
+
+
+def segment_trips(timestamps, latitudes, longitudes, max_gap_hours=TRIP_GAP_HOURS,
+                  max_distance_km=TRIP_DISTANCE_KM):
+    """Split photos into trips by time gap and distance jump in one vectorized pass.
+
+    Inputs are equal-length sequences (epoch seconds, degrees); missing values are
+    None/NaN. Photos are ordered by capture time once (O(n log n)), and a new trip
+    starts wherever consecutive photos are more than `max_gap_hours` apart or more
+    than `max_distance_km` apart. Photos without GPS inherit the previous position,
+    and photos without a timestamp get trip id -1.
+
+    Returns (trip_ids, trips): trip ids aligned with the input order, and one
+    summary per trip with its time span, photo count and representative coordinate
+    (the spherical mean of its located photos), so each trip needs one geocode.
+    """
+    import numpy as np
+
+    timestamps = np.asarray(timestamps, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    trip_ids = np.full(timestamps.shape, -1, dtype=np.int64)
+
+    dated = np.flatnonzero(~np.isnan(timestamps))
+    if dated.size == 0:
+        return trip_ids, []
+    order = dated[np.argsort(timestamps[dated], kind='stable')]
+    ts = timestamps[order]
+    lat = np.radians(latitudes[order])
+    lng = np.radians(longitudes[order])
+
+    # Carry the last known position forward over photos without GPS
+    located = ~np.isnan(lat)
+    last_located = np.maximum.accumulate(np.where(located, np.arange(lat.size), -1))
+    has_position = last_located >= 0
+    lat_ff = np.where(has_position, lat[np.maximum(last_located, 0)], np.nan)
+    lng_ff = np.where(has_position, lng[np.maximum(last_located, 0)], np.nan)
+
+    # Haversine distance between consecutive photos
+    dlat = np.diff(lat_ff)
+    dlng = np.diff(lng_ff)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_ff[:-1]) * np.cos(lat_ff[1:]) * np.sin(dlng / 2) ** 2
+    distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    # NaN distances (no position yet) compare False and never split a trip
+    with np.errstate(invalid='ignore'):
+        breaks = (np.diff(ts) > max_gap_hours * 3600) | (distance_km > max_distance_km)
+    sorted_ids = np.concatenate(([0], np.cumsum(breaks)))
+    trip_ids[order] = sorted_ids
+
+    trip_count = int(sorted_ids[-1]) + 1
+    starts = np.flatnonzero(np.concatenate(([True], breaks)))
+    ends = np.concatenate((starts[1:], [ts.size])) - 1
+
+    # Spherical mean: average unit vectors of located photos per trip
+    cos_lat = np.cos(lat)
+    weights = located.astype(float)
+    x = np.bincount(sorted_ids, np.where(located, cos_lat * np.cos(lng), 0.0), trip_count)
+    y = np.bincount(sorted_ids, np.where(located, cos_lat * np.sin(lng), 0.0), trip_count)
+    z = np.bincount(sorted_ids, np.where(located, np.sin(lat), 0.0), trip_count)
+    located_counts = np.bincount(sorted_ids, weights, trip_count)
+    with np.errstate(invalid='ignore'):
+        rep_lat = np.degrees(np.arctan2(z, np.hypot(x, y)))
+        rep_lng = np.degrees(np.arctan2(y, x))
+
+    counts = (ends - starts + 1).tolist()
+    located_list = located_counts.astype(np.int64).tolist()
+    trips = []
+    for trip_id, (start, end, count, located_count, trip_lat, trip_lng) in enumerate(zip(
+            ts[starts].tolist(), ts[ends].tolist(), counts, located_list,
+            np.round(rep_lat, 6).tolist(), np.round(rep_lng, 6).tolist())):
+        trips.append({
+            'trip_id': trip_id,
+            'start': start,
+            'end': end,
+            'photo_count': count,
+            'located_count': located_count,
+            'latitude': trip_lat if located_count else None,
+            'longitude': trip_lng if located_count else None,
+        })
+    return trip_ids, trips
+
+
+def trips_from_index(index, max_gap_hours=TRIP_GAP_HOURS, max_distance_km=TRIP_DISTANCE_KM,
+                     geocode=False, include_photos=False):
+    """Segment every photo in the index into trips, optionally naming each trip once"""
+    rows = index.records()
+    nan = float('nan')
+    trip_ids, trips = segment_trips(
+        [nan if r[1] is None else r[1] for r in rows],
+        [nan if r[2] is None else r[2] for r in rows],
+        [nan if r[3] is None else r[3] for r in rows],
+        max_gap_hours, max_distance_km,
+    )
+    for trip in trips:
+        trip['start'] = datetime.fromtimestamp(trip['start'], timezone.utc).replace(tzinfo=None).isoformat()
+        trip['end'] = datetime.fromtimestamp(trip['end'], timezone.utc).replace(tzinfo=None).isoformat()
+        if geocode and trip['latitude'] is not None:
+            trip['location_name'] = get_location_name(trip['latitude'], trip['longitude'])
+
+    result = {'trips': trips, 'undated': int((trip_ids < 0).sum())}
+    if include_photos:
+        result['photos'] = {row[0]: int(trip_id) for row, trip_id in zip(rows, trip_ids)}
+    return result
+
+
+class PlanError(Exception):
+    """A sort plan that cannot be applied as given"""
+
+
+FICLONE = 0x40049409
+
+
+def reflink(source, target):
+    """Copy-on-write clone of source at target (Btrfs, XFS, bcachefs); raises OSError if unsupported"""
+    with open(source, 'rb') as src:
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except OSError:
+            os.close(fd)
+            os.unlink(target)
+            raise
+        os.close(fd)
+    shutil.copystat(source, target)
+
+
+def copy_atomic(source, target):
+    """Byte copy of source at target that never leaves a partial file at target
+
+    The copy is written and fsynced under a hidden name in the target directory,
+    then renamed into place; the temporary file is removed if anything fails.
+    """
+    temp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.photosorter-partial")
+    try:
+        shutil.copy2(source, temp)
+        with open(temp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.rename(temp, target)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+
+
+class PlanExecutor:
+    """Applies a sort plan by renaming, hard-linking or cloning files into place.
+
+    A plan is {"mode": ..., "operations": [{"source": ..., "target": ...}]} with paths
+    relative to (or inside) the library root. Modes:
+
+        move      rename; a byte copy plus unlink only when crossing filesystems
+        hardlink  os.link, leaving the source in place
+        reflink   FICLONE copy-on-write clone, leaving the source in place
+        auto      reflink, then hardlink, then copy
+
+    Operations are grouped by target directory and the groups run in parallel.
+    Directory fsyncs are batched once per group. Every step is recorded in a
+    JSON-lines journal so an interrupted run can be resumed or rolled back.
+    """
+
+    MODES = ('move', 'hardlink', 'reflink', 'auto')
+
+    def __init__(self, plan, root, journal_path=None, workers=8):
+        self.root = os.path.realpath(root)
+        self.mode = plan.get('mode', 'move')
+        if self.mode not in self.MODES:
+            raise PlanError(f"Unknown mode {self.mode!r}")
+        self.operations = [
+            (self._resolve(op['source']), self._resolve(op['target']))
+            for op in plan.get('operations', [])
+        ]
+        digest = hashlib.sha1(json.dumps([self.mode, self.operations]).encode('utf-8')).hexdigest()[:16]
+        self.plan_id = digest
+        self.journal_path = journal_path or os.path.join(self.root, f".photosorter-plan-{digest}.journal")
+        self.workers = workers
+        self._journal_lock = threading.Lock()
+
+    def _resolve(self, path):
+        # Check the containing directory so symlinked files are moved, not followed
+        resolved = os.path.normpath(os.path.join(self.root, path))
+        parent = os.path.realpath(os.path.dirname(resolved))
+        if os.path.commonpath([self.root, parent]) != self.root:
+            raise PlanError(f"{path} is outside the library root")
+        return os.path.join(parent, os.path.basename(resolved))
+
+    # -- journal -------------------------------------------------------------
+
+    def _read_journal(self):
+        entries = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        break
+        return entries
+
+    def _write_journal(self, journal, entries, sync=False):
+        with self._journal_lock:
+            journal.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            journal.flush()
+            if sync:
+                os.fsync(journal.fileno())
+
+    # -- applying ------------------------------------------------------------
+
+    def _place(self, source, target):
+        """Put source at target using the plan mode; returns the method actually used"""
+        if self.mode == 'move':
+            try:
+                os.rename(source, target)
+                return 'rename'
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+            copy_atomic(source, target)
+            os.unlink(source)
+            return 'copy'
+
+        if self.mode in ('reflink', 'auto'):
+            try:
+                reflink(source, target)
+                return 'reflink'
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                    raise
+        if self.mode in ('hardlink', 'auto'):
+            try:
+                os.link(source, target)
+                return 'hardlink'
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        copy_atomic(source, target)
+        return 'copy'
+
+    def _placed(self, source, target):
+        """Whether a target left by an interrupted run is complete; finishes a move that stopped before unlinking"""
+        if not os.path.exists(source) or os.path.samefile(source, target):
+            return True
+        if os.path.getsize(target) != os.path.getsize(source):
+            return False
+        if self.mode == 'move':
+            # The copy across filesystems finished but the source was not removed yet
+            os.unlink(source)
+        return True
+
+    def _run_group(self, journal, target_dir, ops, started_ops):
+        """Apply every operation for one target directory, then fsync its directories once"""
+        results = []
+        created = []
+        if not os.path.isdir(target_dir):
+            missing = target_dir
+            while not os.path.isdir(os.path.dirname(missing)):
+                missing = os.path.dirname(missing)
+            os.makedirs(target_dir, exist_ok=True)
+            created.append(missing)
+            self._write_journal(journal, [{'event': 'mkdir', 'path': missing}])
+
+        touched_dirs = {target_dir}
+        for op_id, source, target in ops:
+            if os.path.lexists(target):
+                if op_id not in started_ops:
+                    results.append((op_id, 'skipped', 'target exists'))
+                    continue
+                try:
+                    if self._placed(source, target):
+                        if self.mode == 'move':
+                            touched_dirs.add(os.path.dirname(source))
+                        results.append((op_id, 'done', started_ops[op_id]))
+                        continue
+                    # A partial copy left by an interrupted run; place it again
+                    os.unlink(target)
+                except OSError as e:
+                    results.append((op_id, 'failed', str(e)))
+                    continue
+            if not os.path.exists(source):
+                results.append((op_id, 'failed', 'source missing'))
+                continue
+            self._write_journal(journal, [{'event': 'begin', 'op': op_id, 'source': source, 'target': target}])
+            try:
+                method = self._place(source, target)
+            except OSError as e:
+                results.append((op_id, 'failed', str(e)))
+                continue
+            if method in ('rename', 'copy') and self.mode == 'move':
+                touched_dirs.add(os.path.dirname(source))
+            results.append((op_id, 'done', method))
+
+        for directory in touched_dirs:
+            fsync_directory(directory)
+        self._write_journal(journal, [
+            {'event': 'done', 'op': op_id, 'method': detail}
+            for op_id, status, detail in results if status == 'done'
+        ], sync=True)
+        return results
+
+    def apply(self, resume=False):
+        """Apply the plan; with resume=True operations already journaled as done are skipped"""
+        entries = self._read_journal()
+        if entries and not resume:
+            raise PlanError(f"Journal {self.journal_path} exists; resume or roll back first")
+        done = {e['op'] for e in entries if e.get('event') == 'done'}
+        started_ops = {e['op']: 'resumed' for e in entries if e.get('event') == 'begin'}
+
+        groups = {}
+        for op_id, (source, target) in enumerate(self.operations):
+            if op_id not in done:
+                groups.setdefault(os.path.dirname(target), []).append((op_id, source, target))
+
+        summary = {'plan_id': self.plan_id, 'journal': self.journal_path, 'applied': 0,
+                   'skipped': 0, 'failed': 0, 'already_done': len(done), 'methods': {}, 'errors': []}
+        with open(self.journal_path, 'a', encoding='utf-8') as journal:
+            if not entries:
+                self._write_journal(journal, [{'event': 'plan', 'plan_id': self.plan_id, 'mode': self.mode,
+                                               'root': self.root, 'operations': len(self.operations)}], sync=True)
+            fsync_directory(self.root)
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='plan') as pool:
+                futures = [pool.submit(self._run_group, journal, target_dir, ops, started_ops)
+                           for target_dir, ops in groups.items()]
+                for future in futures:
+                    for op_id, status, detail in future.result():
+                        if status == 'done':
+                            summary['applied'] += 1
+                            summary['methods'][detail] = summary['methods'].get(detail, 0) + 1
+                        else:
+                            summary[status] += 1
+                            summary['errors'].append({'op': op_id, 'status': status, 'reason': detail})
+        return summary
+
+    def rollback(self):
+        """Undo every journaled operation in reverse order and remove directories we created"""
+        entries = self._read_journal()
+        if not entries:
+            raise PlanError(f"No journal at {self.journal_path}")
+        mode = entries[0].get('mode', self.mode)
+        begun = {e['op']: e for e in entries if e.get('event') == 'begin'}
+        undone = 0
+        errors = []
+        for op_id in sorted(begun, reverse=True):
+            source, target = begun[op_id]['source'], begun[op_id]['target']
+            try:
+                if not os.path.lexists(target):
+                    continue
+                if mode == 'move' and not os.path.exists(source):
+                    os.makedirs(os.path.dirname(source), exist_ok=True)
+                    try:
+                        os.rename(target, source)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        copy_atomic(target, source)
+                        os.unlink(target)
+                else:
+                    # Links and clones leave the source untouched; just drop the new name
+                    os.unlink(target)
+                undone += 1
+            except OSError as e:
+                errors.append({'op': op_id, 'reason': str(e)})
+
+        for entry in reversed(entries):
+            if entry.get('event') == 'mkdir':
+                # Only prune directories that are empty again
+                for current, _dirs, _files in os.walk(entry['path'], topdown=False):
+                    try:
+                        os.rmdir(current)
+                    except OSError:
+                        pass
+        if not errors:
+            os.unlink(self.journal_path)
+        return {'plan_id': self.plan_id, 'journal': self.journal_path, 'rolled_back': undone, 'errors': errors}
+
+
+def fsync_directory(directory):
+    """Persist directory entries (renames, new links) to disk"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def run_server(port, workers=1, index_path=GEOCODER_INDEX_PATH,
+               countries_path=COUNTRIES_GEOJSON_PATH, admin1_path=ADMIN1_GEOJSON_PATH,
+               library_root=LIBRARY_ROOT):
     """Run the GPS extractor server"""
+    global LIBRARY_ROOT
+    LIBRARY_ROOT = library_root
+    children = []
     try:
+        if index_path:
+            started = time.perf_counter()
+            geocoder = load_offline_geocoder(index_path)
+            print(f"Offline geocoder: {geocoder.count} places mapped from {index_path} "
+                  f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        if countries_path or admin1_path:
+            started = time.perf_counter()
+            boundaries = load_boundaries(countries_path, admin1_path)
+            print(f"Boundaries: {len(boundaries.regions)} regions in {len(boundaries.grid)} grid cells "
+                  f"loaded in {time.perf_counter() - started:.2f}s")
+
         server = HTTPServer(('localhost', port), GPSExtractorHandler)
-        print(f"GPS Extractor Server running on http://localhost:{port}")
+
+        # Pre-fork workers after the index is mapped so they all share its pages
+        for _ in range(max(0, workers - 1)):
+            pid = os.fork()
+            if pid == 0:
+                children = []
+                break
+            children.append(pid)
+
+        print(f"GPS Extractor Server running on http://localhost:{port} (pid {os.getpid()})")
         print("Press Ctrl+C to stop")
         server.serve_forever()
     except KeyboardInterrupt:
@@ -306,7 +1948,111 @@ def run_server(port):
         server.shutdown()
     except Exception as e:
         print(f"Server error: {e}")
+    finally:
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+def main(argv):
+    """Command line entry point; a bare port number keeps the original usage working"""
+    if not argv or argv[0].isdigit():
+        logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+        port = int(argv[0]) if argv else 8088
+        run_server(port)
+        return 0
+
+    parser = argparse.ArgumentParser(prog='gps-extractor.py', description=__doc__.strip())
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    serve = subcommands.add_parser('serve', help='Run the GPS extraction server')
+    serve.add_argument('port', type=int, nargs='?', default=8088)
+    serve.add_argument('--workers', type=int, default=1, help='Number of pre-forked worker processes')
+    serve.add_argument('--index', default=GEOCODER_INDEX_PATH, help='Offline geocoder index to mmap')
+    serve.add_argument('--countries', default=COUNTRIES_GEOJSON_PATH, help='Country boundaries GeoJSON')
+    serve.add_argument('--admin1', default=ADMIN1_GEOJSON_PATH, help='State/province boundaries GeoJSON')
+    serve.add_argument('--library-root', default=LIBRARY_ROOT, help='Folder /apply-plan may reorganize')
+
+    build_index = subcommands.add_parser('build-index', help='Compile a gazetteer into an offline geocoder index')
+    build_index.add_argument('source', help='GeoNames dump or CSV of latitude,longitude,name')
+    build_index.add_argument('output', help='Index file to write')
+    build_index.add_argument('--admin1-codes', help='GeoNames admin1CodesASCII.txt for state names')
+    build_index.add_argument('--country-info', help='GeoNames countryInfo.txt for country names')
+
+    watch = subcommands.add_parser('watch', help='Keep the photo index current as files arrive in a folder')
+    watch.add_argument('directory', help='Folder to watch recursively')
+    watch.add_argument('--db', default=PHOTO_INDEX_PATH, help='SQLite photo index to update')
+    watch.add_argument('--workers', type=int, default=4, help='Extraction worker threads')
+    watch.add_argument('--debounce', type=float, default=2.0, help='Seconds a file must be quiet before indexing')
+    watch.add_argument('--poll', action='store_true', help='Poll instead of using inotify')
+    watch.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between polling scans')
+    watch.add_argument('--index', default=GEOCODER_INDEX_PATH, help='Offline geocoder index to mmap')
+    watch.add_argument('--countries', default=COUNTRIES_GEOJSON_PATH, help='Country boundaries GeoJSON')
+    watch.add_argument('--admin1', default=ADMIN1_GEOJSON_PATH, help='State/province boundaries GeoJSON')
+
+    trips = subcommands.add_parser('trips', help='Group indexed photos into trips')
+    trips.add_argument('--db', default=PHOTO_INDEX_PATH, help='SQLite photo index to read')
+    trips.add_argument('--gap-hours', type=float, default=TRIP_GAP_HOURS, help='Time gap that starts a new trip')
+    trips.add_argument('--distance-km', type=float, default=TRIP_DISTANCE_KM, help='Jump between photos that starts a new trip')
+    trips.add_argument('--geocode', action='store_true', help='Name each trip from its representative coordinate')
+    trips.add_argument('--photos', action='store_true', help='Include the trip id of every photo')
+    trips.add_argument('--output', help='Write the JSON here instead of stdout')
+
+    apply_plan = subcommands.add_parser('apply-plan', help='Move files into place according to a sort plan')
+    apply_plan.add_argument('plan', help='Plan JSON: {"mode": ..., "operations": [{"source", "target"}]}')
+    apply_plan.add_argument('--root', default=LIBRARY_ROOT or '.', help='Library root the plan paths are inside')
+    apply_plan.add_argument('--journal', help='Journal file (default: inside the library root)')
+    apply_plan.add_argument('--workers', type=int, default=8, help='Target directories processed in parallel')
+    action = apply_plan.add_mutually_exclusive_group()
+    action.add_argument('--resume', action='store_true', help='Continue an interrupted run')
+    action.add_argument('--rollback', action='store_true', help='Undo a finished or interrupted run')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    if args.command == 'serve':
+        run_server(args.port, workers=args.workers, index_path=args.index,
+                   countries_path=args.countries, admin1_path=args.admin1, library_root=args.library_root)
+    elif args.command == 'watch':
+        if args.index:
+            load_offline_geocoder(args.index)
+        if args.countries or args.admin1:
+            load_boundaries(args.countries, args.admin1)
+        index = PhotoIndex(args.db)
+        try:
+            watch_directory(args.directory, index, workers=args.workers, debounce=args.debounce,
+                            poll=args.poll, poll_interval=args.poll_interval)
+        finally:
+            index.close()
+    elif args.command == 'trips':
+        index = PhotoIndex(args.db)
+        try:
+            result = trips_from_index(index, args.gap_hours, args.distance_km, geocode=args.geocode,
+                                      include_photos=args.photos)
+        finally:
+            index.close()
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+        else:
+            print(json.dumps(result, indent=2))
+    elif args.command == 'apply-plan':
+        with open(args.plan, encoding='utf-8') as f:
+            plan = json.load(f)
+        try:
+            executor = PlanExecutor(plan, args.root, journal_path=args.journal, workers=args.workers)
+            summary = executor.rollback() if args.rollback else executor.apply(resume=args.resume)
+        except PlanError as e:
+            print(f"Cannot apply plan: {e}", file=sys.stderr)
+            return 2
+        print(json.dumps(summary, indent=2))
+        return 1 if summary.get('errors') else 0
+    elif args.command == 'build-index':
+        started = time.perf_counter()
+        places, names = build_geocoder_index(args.source, args.output, args.admin1_codes, args.country_info)
+        print(f"Indexed {places} places ({names} unique names) into {args.output} "
+              f"in {time.perf_counter() - started:.1f}s")
+    return 0
 
 if __name__ == '__main__':
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8088
-    run_server(port)
\ No newline at end of file
+    sys.exit(main(sys.argv[1:]))
@@ -25,6 +25,28 @@ class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379"
     redis_db: int = 0
     
+    # Market Data Cache (seconds; stale entries are served while one refresh runs)
+    quote_cache_ttl: int = 15
+    quote_cache_stale_ttl: int = 60
+    price_cache_ttl: int = 60
+    price_cache_stale_ttl: int = 300
+    history_cache_ttl: int = 900
+    history_cache_stale_ttl: int = 86400
+    market_cache_max_entries: int = 2048
+    market_cache_redis_enabled: bool = True
+    market_cache_redis_timeout: float = 0.25
+    market_overview_refresh_interval: int = 30
+    market_overview_stale_ttl: int = 600
+    
+    # Local price store: seconds between incremental backfills of a stock's daily bars
+    price_sync_interval: int = 900
+    price_cache_dir: str = "data/price_cache"
+    price_cache_max_segments: int = 8
+    
+    # Indicators written to stock_indicators after each sync, and how many bars a stock's first run covers
+    materialized_indicators: List[str] = ["sma_20", "ema_12", "rsi", "macd", "bollinger_bands"]
+    indicator_history_bars: int = 500
+    
     # API Keys
     yahoo_finance_api_key: Optional[str] = None
     alpha_vantage_api_key: Optional[str] = None
@@ -37,6 +59,14 @@ class Settings(BaseSettings):
     reddit_client_secret: Optional[str] = None
     reddit_user_agent: Optional[str] = None
     
+    # Blocking call executor (upstream providers, DB sessions, CPU-bound work)
+    executor_max_workers: int = 32
+    yfinance_max_concurrency: int = 8
+    yfinance_timeout: float = 15.0
+    database_timeout: float = 30.0
+    compute_max_concurrency: int = 4
+    compute_timeout: float = 60.0
+    
     # Security
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
@@ -86,6 +116,23 @@ class Settings(BaseSettings):
     # Portfolio
     max_portfolio_size: int = 50
     max_watchlist_size: int = 100
+    max_batch_quote_symbols: int = 100
+    max_batch_indicator_symbols: int = 1000
+    max_batch_indicator_bars: int = 1000
+    max_screener_symbols: int = 5000
+    max_screener_results: int = 500
+
+    # Backtesting: sweeps are split into chunks of combinations, spread over worker processes
+    backtest_processes: Optional[int] = None  # None: one per CPU
+    backtest_chunk_size: int = 250
+    max_backtest_combinations: int = 20000
+
+    # Bulk price refresh: symbols per download and COPY, and the timeout for one download or COPY
+    price_refresh_chunk_size: int = 200
+    price_refresh_timeout: float = 300.0
+
+    # Coarser bars aggregated from the stored daily bars after each sync
+    price_rollup_intervals: List[str] = ["1wk", "1mo"]
     
     # Alerts
     max_alerts_per_user: int = 20
@@ -1,8 +1,10 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
 from contextlib import contextmanager
+from typing import Any, Dict, List
 import logging
 
 from .config import settings
@@ -25,6 +27,9 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create base class for models
 Base = declarative_base()
 
+# Rows per INSERT statement in upsert_rows
+INSERT_CHUNK_SIZE = 1000
+
 def get_db() -> Session:
     """Get database session."""
     db = SessionLocal()
@@ -51,6 +56,61 @@ def create_tables():
         logger.error(f"Failed to create database tables: {e}")
         raise
 
+def upsert_rows(model, rows: List[Dict[str, Any]], index_elements: List[str], update: List[str]) -> int:
+    """Insert rows, updating the `update` columns of rows that conflict on index_elements; returns len(rows).
+
+    Opens its own session and commits once, so it can run on the database executor.
+    """
+    db = SessionLocal()
+    try:
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            statement = insert(model).values(rows[start:start + INSERT_CHUNK_SIZE])
+            db.execute(statement.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={column: statement.excluded[column] for column in update}
+            ))
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+def upgrade_schema():
+    """Apply changes create_all cannot make to tables created by earlier versions.
+
+    Each step checks the catalog first, so this is a no-op on an up-to-date database.
+    """
+    try:
+        with engine.begin() as connection:
+            # Full Yahoo histories have daily volumes above the 32-bit range
+            volume_type = connection.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'stock_prices' AND column_name = 'volume'"
+            )).scalar()
+            if volume_type == "integer":
+                connection.execute(text("ALTER TABLE stock_prices ALTER COLUMN volume TYPE BIGINT"))
+                logger.info("Widened stock_prices.volume to BIGINT")
+
+            # Price and indicator upserts use ON CONFLICT on these indexes, which must be unique
+            _make_unique(connection, "stock_prices", "ix_stock_prices_stock_date", ["stock_id", "date"])
+            _make_unique(connection, "stock_indicators", "ix_stock_indicators_stock_date_type",
+                         ["stock_id", "date", "indicator_type"])
+    except Exception as e:
+        logger.error(f"Failed to upgrade database schema: {e}")
+        raise
+
+def _make_unique(connection, table: str, index: str, columns: List[str]):
+    """Recreate a non-unique index as unique, keeping the newest row (highest id) of any duplicates."""
+    unique = connection.execute(text(
+        "SELECT i.indisunique FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :index"
+    ), {"index": index}).scalar()
+    if unique is not False:
+        return
+    matching = " AND ".join(f"a.{column} = b.{column}" for column in columns)
+    connection.execute(text(f"DELETE FROM {table} a USING {table} b WHERE {matching} AND a.id < b.id"))
+    connection.execute(text(f"DROP INDEX {index}"))
+    connection.execute(text(f"CREATE UNIQUE INDEX {index} ON {table} ({', '.join(columns)})"))
+    logger.info(f"Recreated {index} as a unique index")
+
 def check_database_connection():
     """Check if database connection is working."""
     try:
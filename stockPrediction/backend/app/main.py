@@ -12,10 +12,13 @@ import os
 from contextlib import asynccontextmanager
 
 from .config import settings, get_cors_config
-from .database import create_tables, check_database_connection, get_db_context
+from .database import create_tables, upgrade_schema, check_database_connection, get_db_context
 from .utils.auth import get_password_hash
 from .utils.audit import audit_middleware
-from .routes import stocks, sentiment, predictions, portfolio, health
+from .routes import stocks, sentiment, predictions, portfolio, health, backtest
+from .services.executor import blocking_executor
+from .services.backtest import shutdown_process_pool
+from .services.stock_service import market_overview_refresher
 
 # Configure logging
 logging.basicConfig(
@@ -48,6 +51,7 @@ async def lifespan(app: FastAPI):
     # Create tables if they don't exist
     try:
         create_tables()
+        upgrade_schema()
         logger.info("Database tables created/verified successfully")
         
         # Initialize ML models
@@ -66,6 +70,9 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down StockPrediction System...")
+    await market_overview_refresher.stop()
+    blocking_executor.shutdown()
+    shutdown_process_pool()
 
 def initialize_ml_models():
     """Initialize machine learning models."""
@@ -84,6 +91,7 @@ def start_background_tasks():
         logger.info("Starting background tasks...")
         # Start sentiment data collection
         # Start stock data updates
+        market_overview_refresher.start()
         # Start model retraining tasks
         logger.info("Background tasks started successfully")
     except Exception as e:
@@ -188,6 +196,7 @@ app.include_router(stocks.router, prefix="/api/v1/stocks", tags=["Stocks"])
 app.include_router(sentiment.router, prefix="/api/v1/sentiment", tags=["Sentiment Analysis"])
 app.include_router(predictions.router, prefix="/api/v1/predictions", tags=["Predictions"])
 app.include_router(portfolio.router, prefix="/api/v1/portfolio", tags=["Portfolio"])
+app.include_router(backtest.router, prefix="/api/v1/backtest", tags=["Backtesting"])
 app.include_router(health.router, prefix="/api/v1/health", tags=["Health"])
 
 # Check for React frontend build first
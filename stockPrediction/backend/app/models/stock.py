@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Text, ForeignKey, Index
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, Boolean, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from .base import Base
@@ -35,7 +35,7 @@ class StockPrice(Base):
     high_price = Column(Float, nullable=False)
     low_price = Column(Float, nullable=False)
     close_price = Column(Float, nullable=False)
-    volume = Column(Integer)
+    volume = Column(BigInteger)
     adjusted_close = Column(Float)
     
     # Relationships
@@ -43,7 +43,29 @@ class StockPrice(Base):
     
     # Indexes
     __table_args__ = (
-        Index('ix_stock_prices_stock_date', 'stock_id', 'date'),
+        Index('ix_stock_prices_stock_date', 'stock_id', 'date', unique=True),
+    )
+
+class StockPriceRollup(Base):
+    """Coarser bars (1wk, 1mo) aggregated from the stored daily bars, one row per period."""
+    __tablename__ = "stock_price_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    stock_id = Column(Integer, ForeignKey("stocks.id"), nullable=False)
+    interval = Column(String(10), nullable=False)
+    date = Column(DateTime, nullable=False)  # start of the period
+    open_price = Column(Float, nullable=False)
+    high_price = Column(Float, nullable=False)
+    low_price = Column(Float, nullable=False)
+    close_price = Column(Float, nullable=False)
+    volume = Column(BigInteger)  # summed over the period, may exceed 32 bits
+    adjusted_close = Column(Float)
+    bar_count = Column(Integer, nullable=False)  # daily bars aggregated so far
+    last_bar_at = Column(DateTime, nullable=False)  # newest daily bar included
+    
+    # Indexes
+    __table_args__ = (
+        Index('ix_stock_price_rollups_stock_interval_date', 'stock_id', 'interval', 'date', unique=True),
     )
 
 class StockIndicator(Base):
@@ -55,12 +77,30 @@ class StockIndicator(Base):
     date = Column(DateTime, nullable=False)
     indicator_type = Column(String(50), nullable=False)
     value = Column(Float, nullable=False)
-    metadata = Column(JSONB)
+    # "metadata" is reserved on declarative models, so the attribute is renamed but the column is not
+    indicator_metadata = Column("metadata", JSONB)
     
     # Relationships
     stock = relationship("Stock", back_populates="indicators")
     
     # Indexes
     __table_args__ = (
-        Index('ix_stock_indicators_stock_date_type', 'stock_id', 'date', 'indicator_type'),
+        Index('ix_stock_indicators_stock_date_type', 'stock_id', 'date', 'indicator_type', unique=True),
+    )
+
+class IndicatorState(Base):
+    """Persisted streaming indicator state, so indicators resume incrementally after a restart."""
+    __tablename__ = "indicator_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    stock_id = Column(Integer, ForeignKey("stocks.id"), nullable=False)
+    interval = Column(String(10), nullable=False, default="1d")
+    name = Column(String(50), nullable=False)
+    state = Column(JSONB, nullable=False)
+    last_bar_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime)
+    
+    # Indexes
+    __table_args__ = (
+        Index('ix_indicator_states_stock_interval_name', 'stock_id', 'interval', 'name', unique=True),
     )
@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..schemas.backtest import BacktestRequest, SweepRequest, SweepResponse
+from ..services.backtest import BacktestService
+from ..utils.serialization import NumpyJSONResponse
+
+router = APIRouter()
+
+@router.post("/{symbol}")
+async def run_backtest(
+    symbol: str,
+    request: BacktestRequest,
+    db: Session = Depends(get_db)
+):
+    """Backtest one signal on daily bars.
+
+    Returns summary metrics plus position, equity and drawdown arrays aligned
+    with "date". Positions are taken on a bar's close and earn the next bar's return.
+    """
+    try:
+        backtest_service = BacktestService(db)
+        result = await backtest_service.run(
+            symbol.upper(),
+            strategy=request.strategy,
+            params=request.params,
+            entry=request.entry,
+            exit=request.exit,
+            model_id=request.model_id,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            fee_bps=request.fee_bps,
+            slippage_bps=request.slippage_bps
+        )
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Stock {symbol} not found"
+            )
+        return NumpyJSONResponse(result)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to run backtest: {str(e)}"
+        )
+
+@router.post("/{symbol}/sweep", response_model=SweepResponse)
+async def run_parameter_sweep(
+    symbol: str,
+    request: SweepRequest,
+    db: Session = Depends(get_db)
+):
+    """Backtest every combination of a strategy's parameter grid and return the best ones."""
+    try:
+        backtest_service = BacktestService(db)
+        result = await backtest_service.sweep(
+            symbol.upper(),
+            request.strategy,
+            request.grid,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            fee_bps=request.fee_bps,
+            slippage_bps=request.slippage_bps,
+            sort_by=request.sort_by,
+            top=request.top
+        )
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Stock {symbol} not found"
+            )
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to run parameter sweep: {str(e)}"
+        )
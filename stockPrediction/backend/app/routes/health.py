@@ -6,6 +6,8 @@ import os
 
 from ..database import get_db, check_database_connection
 from ..config import settings
+from ..services.market_data_cache import cache_stats
+from ..services.executor import blocking_executor
 
 router = APIRouter()
 
@@ -94,3 +96,19 @@ async def liveness_check():
         "status": "alive",
         "timestamp": datetime.utcnow().isoformat()
     }
+
+@router.get("/cache")
+async def market_data_cache_stats():
+    """Hit rates and sizes of the market data caches."""
+    return {
+        "caches": cache_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@router.get("/executor")
+async def executor_stats():
+    """Concurrency, queue time and timeouts per blocking-call provider."""
+    return {
+        "providers": blocking_executor.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
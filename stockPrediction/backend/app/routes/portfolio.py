@@ -6,10 +6,21 @@ from datetime import datetime
 from ..database import get_db
 from ..models.portfolio import Portfolio, Watchlist, Alert
 from ..schemas.portfolio import PortfolioResponse, WatchlistResponse, AlertResponse
+from ..services.executor import run_db_session
 from ..utils.auth import get_current_user_optional
 
 router = APIRouter()
 
+def _save(db: Session, item):
+    """Insert a row and reload it; runs on the database executor."""
+    db.add(item)
+    db.commit()
+    db.refresh(item)
+
+def _delete(db: Session, item):
+    db.delete(item)
+    db.commit()
+
 @router.get("/", response_model=List[PortfolioResponse])
 async def get_user_portfolio(
     db: Session = Depends(get_db),
@@ -19,7 +30,7 @@ async def get_user_portfolio(
     try:
         # For demo purposes, return mock portfolio
         # In real implementation, filter by user_id
-        portfolio_items = db.query(Portfolio).all()
+        portfolio_items = await run_db_session(lambda: db.query(Portfolio).all())
         
         return [PortfolioResponse.from_orm(item) for item in portfolio_items]
     except Exception as e:
@@ -47,9 +58,7 @@ async def add_to_portfolio(
             purchase_date=datetime.utcnow()
         )
         
-        db.add(portfolio_item)
-        db.commit()
-        db.refresh(portfolio_item)
+        await run_db_session(_save, db, portfolio_item)
         
         return {
             "message": f"Added {quantity} shares of {symbol} to portfolio",
@@ -69,7 +78,7 @@ async def get_watchlist(
     """Get user's watchlist."""
     try:
         user_id = current_user.get("id", 1) if current_user else 1
-        watchlist_items = db.query(Watchlist).filter(Watchlist.user_id == user_id).all()
+        watchlist_items = await run_db_session(lambda: db.query(Watchlist).filter(Watchlist.user_id == user_id).all())
         
         return [WatchlistResponse.from_orm(item) for item in watchlist_items]
     except Exception as e:
@@ -89,10 +98,10 @@ async def add_to_watchlist(
         user_id = current_user.get("id", 1) if current_user else 1
         
         # Check if already in watchlist
-        existing = db.query(Watchlist).filter(
+        existing = await run_db_session(lambda: db.query(Watchlist).filter(
             Watchlist.user_id == user_id,
             Watchlist.symbol == symbol.upper()
-        ).first()
+        ).first())
         
         if existing:
             raise HTTPException(
@@ -106,9 +115,7 @@ async def add_to_watchlist(
             added_date=datetime.utcnow()
         )
         
-        db.add(watchlist_item)
-        db.commit()
-        db.refresh(watchlist_item)
+        await run_db_session(_save, db, watchlist_item)
         
         return {
             "message": f"Added {symbol} to watchlist",
@@ -132,10 +139,10 @@ async def remove_from_watchlist(
     try:
         user_id = current_user.get("id", 1) if current_user else 1
         
-        watchlist_item = db.query(Watchlist).filter(
+        watchlist_item = await run_db_session(lambda: db.query(Watchlist).filter(
             Watchlist.user_id == user_id,
             Watchlist.symbol == symbol.upper()
-        ).first()
+        ).first())
         
         if not watchlist_item:
             raise HTTPException(
@@ -143,8 +150,7 @@ async def remove_from_watchlist(
                 detail=f"{symbol} not found in watchlist"
             )
         
-        db.delete(watchlist_item)
-        db.commit()
+        await run_db_session(_delete, db, watchlist_item)
         
         return {"message": f"Removed {symbol} from watchlist"}
     except HTTPException:
@@ -163,7 +169,7 @@ async def get_alerts(
     """Get user's alerts."""
     try:
         user_id = current_user.get("id", 1) if current_user else 1
-        alerts = db.query(Alert).filter(Alert.user_id == user_id).all()
+        alerts = await run_db_session(lambda: db.query(Alert).filter(Alert.user_id == user_id).all())
         
         return [AlertResponse.from_orm(alert) for alert in alerts]
     except Exception as e:
@@ -195,9 +201,7 @@ async def create_alert(
             created_date=datetime.utcnow()
         )
         
-        db.add(alert)
-        db.commit()
-        db.refresh(alert)
+        await run_db_session(_save, db, alert)
         
         return {
             "message": f"Alert created for {symbol}",
@@ -219,7 +223,7 @@ async def get_portfolio_performance(
         user_id = current_user.get("id", 1) if current_user else 1
         
         # Get portfolio items
-        portfolio_items = db.query(Portfolio).filter(Portfolio.user_id == user_id).all()
+        portfolio_items = await run_db_session(lambda: db.query(Portfolio).filter(Portfolio.user_id == user_id).all())
         
         if not portfolio_items:
             return {"message": "No portfolio items found"}
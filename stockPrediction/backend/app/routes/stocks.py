@@ -7,10 +7,14 @@ from datetime import datetime, timedelta
 
 from ..database import get_db
 from ..models.stock import Stock, StockPrice, StockIndicator
-from ..schemas.stock import StockResponse, StockPriceResponse, StockIndicatorResponse
+from ..config import settings
+from ..schemas.stock import StockResponse, StockPriceResponse, StockIndicatorResponse, BatchQuoteResponse, BatchIndicatorRequest, ScreenerRequest, ScreenerResponse
 from ..services.stock_service import StockService
 from ..services.technical_analysis import TechnicalAnalysisService
+from ..services.batch_indicators import BatchIndicatorService
+from ..services.screener import ScreenerService
 from ..utils.auth import get_current_user
+from ..utils.serialization import NumpyJSONResponse, price_columns_payload, price_rows_payload
 
 router = APIRouter()
 
@@ -31,6 +35,159 @@ async def search_stocks(
             detail=f"Failed to search stocks: {str(e)}"
         )
 
+@router.get("/quotes", response_model=BatchQuoteResponse)
+async def get_batch_quotes(
+    symbols: str = Query(..., min_length=1, description="Comma-separated list of symbols"),
+    db: Session = Depends(get_db)
+):
+    """Get real-time quotes for many symbols in one request."""
+    symbol_list = [symbol for symbol in symbols.split(",") if symbol.strip()]
+    if not symbol_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No symbols given"
+        )
+    if len(symbol_list) > settings.max_batch_quote_symbols:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.max_batch_quote_symbols} symbols per request"
+        )
+    
+    try:
+        stock_service = StockService(db)
+        return await stock_service.get_batch_quotes(symbol_list)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get quotes: {str(e)}"
+        )
+
+@router.post("/prices/refresh", status_code=status.HTTP_202_ACCEPTED)
+async def refresh_prices(
+    symbols: Optional[str] = Query(None, description="Comma-separated list of symbols; all active stocks if omitted"),
+    db: Session = Depends(get_db)
+):
+    """Start a bulk refresh of stored daily bars in the background, e.g. from a nightly job.
+
+    Bars are downloaded in chunks and written with COPY through a staging
+    table. The response is the refresh job; poll GET /prices/refresh/{job_id}
+    for its report of rows written and ingestion rows/s.
+    """
+    symbol_list = [symbol for symbol in symbols.split(",") if symbol.strip()] if symbols else None
+    if symbol_list is not None and not symbol_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No symbols given"
+        )
+
+    try:
+        stock_service = StockService(db)
+        return await stock_service.refresh_prices(symbol_list)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to refresh prices: {str(e)}"
+        )
+
+@router.get("/prices/refresh/{job_id}")
+async def get_price_refresh(
+    job_id: str,
+    db: Session = Depends(get_db)
+):
+    """Get the status and, once finished, the report of a bulk price refresh."""
+    job = StockService(db).get_price_refresh(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Price refresh {job_id} not found"
+        )
+    return job
+
+@router.post("/indicators/batch")
+async def get_batch_indicators(
+    request: BatchIndicatorRequest,
+    db: Session = Depends(get_db)
+):
+    """Compute technical indicators for many symbols at once.
+
+    Each indicator is a symbols x dates matrix aligned with "symbols" and "date";
+    values are null until an indicator has enough history for that symbol.
+    """
+    if request.symbols is not None and not 0 < len(request.symbols) <= settings.max_batch_indicator_symbols:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Give between 1 and {settings.max_batch_indicator_symbols} symbols"
+        )
+    if request.bars > settings.max_batch_indicator_bars:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.max_batch_indicator_bars} bars per request"
+        )
+    
+    try:
+        batch_service = BatchIndicatorService(db)
+        result = await batch_service.compute(
+            request.symbols,
+            request.indicators,
+            end_date=request.end_date,
+            bars=request.bars
+        )
+        return NumpyJSONResponse(result)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to compute batch indicators: {str(e)}"
+        )
+
+@router.post("/screener", response_model=ScreenerResponse)
+async def screen_stocks(
+    request: ScreenerRequest,
+    db: Session = Depends(get_db)
+):
+    """Find stocks whose latest bar satisfies a condition.
+
+    Conditions combine price fields (open, high, low, close, volume) and
+    indicator series (sma_50, rsi, macd_signal, bollinger_bands_lower, ...) with
+    arithmetic, comparisons, and/or/not, and the functions sma, ema, std,
+    highest, lowest (x, window), prev, change, pct_change (x, bars=1) and abs.
+    """
+    if request.symbols is not None and not 0 < len(request.symbols) <= settings.max_screener_symbols:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Give between 1 and {settings.max_screener_symbols} symbols"
+        )
+    if request.limit > settings.max_screener_results:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.max_screener_results} results per request"
+        )
+
+    try:
+        screener = ScreenerService(db)
+        return await screener.screen(
+            request.condition,
+            symbols=request.symbols,
+            rank_by=request.rank_by,
+            descending=request.descending,
+            limit=request.limit,
+            end_date=request.end_date
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to run screener: {str(e)}"
+        )
+
 @router.get("/{symbol}", response_model=StockResponse)
 async def get_stock(
     symbol: str,
@@ -89,9 +246,15 @@ async def get_stock_history(
     start_date: Optional[str] = Query(None, regex="^\d{4}-\d{2}-\d{2}$"),
     end_date: Optional[str] = Query(None, regex="^\d{4}-\d{2}-\d{2}$"),
     limit: int = Query(100, ge=1, le=1000),
+    interval: str = Query("1d", regex="^(1d|1wk|1mo)$", description="1wk and 1mo bars are aggregated from the daily bars and dated by period start"),
+    format: str = Query("rows", regex="^(rows|columns)$", description="rows: list of prices; columns: one array per field"),
     db: Session = Depends(get_db)
 ):
-    """Get historical price data for a stock."""
+    """Get historical price data for a stock.
+
+    Serialized straight from the price columns with orjson; rows have the
+    StockPriceResponse shape but are not validated one by one.
+    """
     try:
         stock_service = StockService(db)
         
@@ -99,14 +262,18 @@ async def get_stock_history(
         start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
         end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
         
-        history = await stock_service.get_stock_history(
+        history = await stock_service.get_stock_history_columns(
             symbol.upper(), 
             start_date=start, 
             end_date=end, 
-            limit=limit
+            limit=limit,
+            interval=interval
         )
+        stock_id, columns = history if history else (None, None)
         
-        return history
+        if format == "columns":
+            return NumpyJSONResponse(price_columns_payload(columns, stock_id))
+        return NumpyJSONResponse(price_rows_payload(columns, stock_id))
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -121,7 +288,7 @@ async def get_stock_history(
 @router.get("/{symbol}/indicators", response_model=List[StockIndicatorResponse])
 async def get_stock_indicators(
     symbol: str,
-    indicators: Optional[str] = Query(None, description="Comma-separated list of indicators"),
+    indicators: Optional[str] = Query(None, description="Comma-separated list of indicators: sma, ema, rsi, macd, bollinger_bands, stochastic, williams_r, atr, optionally with parameters (sma_50)"),
     db: Session = Depends(get_db)
 ):
     """Get technical indicators for a stock."""
@@ -145,6 +312,64 @@ async def get_stock_indicators(
             detail=f"Failed to get stock indicators: {str(e)}"
         )
 
+@router.get("/{symbol}/indicators/series")
+async def get_stock_indicator_series(
+    symbol: str,
+    indicators: Optional[str] = Query(None, description="Comma-separated list of indicators, e.g. sma_50,ema_12,rsi_14,macd"),
+    start_date: Optional[str] = Query(None, regex="^\d{4}-\d{2}-\d{2}$"),
+    end_date: Optional[str] = Query(None, regex="^\d{4}-\d{2}-\d{2}$"),
+    limit: int = Query(250, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """Get full technical indicator series for charting, one array per indicator.
+
+    Arrays are aligned with "date"; values are null where an indicator has not
+    got enough history yet.
+    """
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date format: {str(e)}"
+        )
+    
+    try:
+        technical_service = TechnicalAnalysisService(db)
+        
+        indicator_list = [name.strip() for name in indicators.split(",") if name.strip()] if indicators else [
+            "sma_20", "ema_12", "rsi", "macd", "bollinger_bands"
+        ]
+        
+        series = await technical_service.get_indicator_series(
+            symbol.upper(),
+            indicator_list,
+            start_date=start,
+            end_date=end,
+            limit=limit
+        )
+        
+        if series is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Stock {symbol} not found"
+            )
+        
+        return NumpyJSONResponse(series)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get indicator series: {str(e)}"
+        )
+
 @router.get("/{symbol}/quote")
 async def get_stock_quote(
     symbol: str,
@@ -0,0 +1,44 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
+from datetime import datetime
+
+class BacktestRequest(BaseModel):
+    # One signal: a named strategy, an entry (and optional exit) screener condition, or stored predictions
+    strategy: Optional[str] = None  # sma_crossover, rsi_reversion, breakout
+    params: Dict[str, float] = {}
+    entry: Optional[str] = None  # e.g. "rsi < 30"
+    exit: Optional[str] = None  # e.g. "rsi > 70"; without it the position is held while entry holds
+    model_id: Optional[int] = None  # with no strategy or entry: this model's stored 1d predictions, or every model's
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    fee_bps: float = Field(0.0, ge=0)
+    slippage_bps: float = Field(0.0, ge=0)
+
+class SweepRequest(BaseModel):
+    strategy: str
+    grid: Dict[str, List[float]]  # parameter -> values to try, e.g. {"fast": [5, 10, 20], "slow": [50, 100, 200]}
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    fee_bps: float = Field(0.0, ge=0)
+    slippage_bps: float = Field(0.0, ge=0)
+    sort_by: str = "sharpe"
+    top: int = Field(20, ge=1, le=1000)
+
+class BacktestMetrics(BaseModel):
+    total_return: Optional[float] = None
+    annual_return: Optional[float] = None
+    annual_volatility: Optional[float] = None
+    sharpe: Optional[float] = None
+    max_drawdown: Optional[float] = None
+    trades: int = 0
+    exposure: Optional[float] = None
+
+class SweepResult(BacktestMetrics):
+    params: Dict[str, float]
+
+class SweepResponse(BaseModel):
+    symbol: str
+    strategy: str
+    combinations: int
+    sort_by: str
+    results: List[SweepResult]
@@ -83,4 +83,37 @@ class MarketOverview(BaseModel):
     nasdaq: Optional[StockQuote] = None
     dow: Optional[StockQuote] = None
     vix: Optional[StockQuote] = None
+    as_of: Optional[datetime] = None  # when the indices were fetched
     timestamp: datetime
+
+class BatchQuoteResponse(BaseModel):
+    quotes: Dict[str, StockQuote]
+    errors: Dict[str, str] = {}
+    cached: int = 0
+    timestamp: datetime
+
+class BatchIndicatorRequest(BaseModel):
+    symbols: Optional[List[str]] = None  # None: every active stock
+    indicators: List[str] = ["sma_20", "ema_12", "rsi", "macd", "bollinger_bands"]
+    end_date: Optional[datetime] = None
+    bars: int = Field(1, ge=1)  # trailing dates to return; 1 gives the latest values
+
+class ScreenerRequest(BaseModel):
+    condition: str  # e.g. "rsi < 30 and close > sma_200"
+    symbols: Optional[List[str]] = None  # None: every active stock
+    rank_by: Optional[str] = None  # expression to sort matches by, e.g. "volume / sma(volume, 20)"
+    descending: bool = True
+    limit: int = Field(50, ge=1)
+    end_date: Optional[datetime] = None
+
+class ScreenerMatch(BaseModel):
+    symbol: str
+    rank_value: Optional[float] = None
+    values: Dict[str, Optional[float]] = {}  # every field the expressions read, on the screened date
+
+class ScreenerResponse(BaseModel):
+    matches: List[ScreenerMatch]
+    evaluated: int  # symbols with enough history to evaluate
+    matched: int  # matches before the limit
+    date: Optional[datetime] = None
+    missing: List[str] = []
@@ -0,0 +1,373 @@
+import asyncio
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.stock import Stock
+from ..models.prediction import Prediction
+from .executor import run_db_session, run_compute
+from .price_store import PriceStore
+from .indicator_registry import IndicatorGraph
+from .screener import compile_expression
+
+# Positions are decided on a bar's close and held until the next close, so the
+# return of bar t+1 is earned by the position chosen at t. Every array below
+# runs along the last axis, with one leading row per parameter combination.
+
+METRICS = ("total_return", "annual_return", "annual_volatility", "sharpe", "max_drawdown", "trades", "exposure")
+
+
+def hold(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    """Long (1) from each entry until the next exit, else flat (0); an entry wins a bar that is both."""
+    state = np.where(entries, 1.0, np.where(exits, 0.0, np.nan))
+    dates = np.arange(state.shape[-1])
+    # Forward-fill the last entry/exit by carrying the index of the last bar that had one
+    last = np.where(np.isnan(state), 0, dates)
+    np.maximum.accumulate(last, axis=-1, out=last)
+    filled = np.take_along_axis(state, last, axis=-1)
+    return np.nan_to_num(filled, nan=0.0)
+
+
+def backtest(close: np.ndarray, positions: np.ndarray, fee_bps: float = 0.0, slippage_bps: float = 0.0,
+             periods_per_year: int = 252) -> Dict[str, np.ndarray]:
+    """Returns, equity and drawdown curves for target positions (-1 short .. 1 long) on each bar's close.
+
+    Fees and slippage are charged in basis points of the traded notional,
+    |change in position|, on the bar the trade happens.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    bar_returns = close[..., 1:] / close[..., :-1] - 1
+
+    held = positions[..., :-1]
+    traded = np.abs(np.diff(positions, axis=-1, prepend=0.0))[..., :-1]
+    returns = held * bar_returns - traded * (fee_bps + slippage_bps) / 10_000
+
+    equity = np.cumprod(1 + returns, axis=-1)
+    peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=-1)
+    return {
+        "returns": returns,
+        "equity": equity,
+        "drawdown": equity / peak - 1,
+        "traded": traded,
+        "held": held,
+        "periods_per_year": periods_per_year,
+    }
+
+
+def metrics(result: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Summary statistics per leading row of a backtest() result; Sharpe assumes a zero risk-free rate."""
+    returns, equity = result["returns"], result["equity"]
+    periods, bars = result["periods_per_year"], returns.shape[-1]
+    if bars == 0:
+        empty = np.full(returns.shape[:-1], np.nan)
+        return {name: empty for name in METRICS}
+
+    std = returns.std(axis=-1, ddof=1) if bars > 1 else np.full(returns.shape[:-1], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, returns.mean(axis=-1) / std * np.sqrt(periods), np.nan)
+    return {
+        "total_return": equity[..., -1] - 1,
+        "annual_return": np.maximum(equity[..., -1], 0) ** (periods / bars) - 1,
+        "annual_volatility": std * np.sqrt(periods),
+        "sharpe": sharpe,
+        "max_drawdown": result["drawdown"].min(axis=-1),
+        "trades": np.count_nonzero(result["traded"], axis=-1),
+        "exposure": np.abs(result["held"]).mean(axis=-1),
+    }
+
+
+# Strategies turn price columns plus one array per parameter (one entry per
+# combination) into a combinations x dates matrix of positions. Indicators come
+# from a shared IndicatorGraph, so combinations that use the same period reuse
+# one computation.
+
+def _rows(graph: IndicatorGraph, kind: str, periods: np.ndarray) -> np.ndarray:
+    """One indicator row per combination, computing each distinct period once."""
+    unique, inverse = np.unique(periods, return_inverse=True)
+    return np.stack([graph.evaluate((kind, int(period))) for period in unique])[inverse]
+
+
+def _previous(values: np.ndarray) -> np.ndarray:
+    shifted = np.full(values.shape, np.nan)
+    shifted[..., 1:] = values[..., :-1]
+    return shifted
+
+
+def _sma_crossover(graph: IndicatorGraph, fast: np.ndarray, slow: np.ndarray) -> np.ndarray:
+    """Long while SMA(fast) is above SMA(slow)."""
+    with np.errstate(invalid="ignore"):
+        return (_rows(graph, "sma", fast) > _rows(graph, "sma", slow)).astype(np.float64)
+
+
+def _rsi_reversion(graph: IndicatorGraph, period: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """Buy when RSI drops below `lower`, sell when it rises above `upper`."""
+    rsi = _rows(graph, "rsi", period)
+    with np.errstate(invalid="ignore"):
+        return hold(rsi < lower[:, None], rsi > upper[:, None])
+
+
+def _breakout(graph: IndicatorGraph, entry: np.ndarray, exit: np.ndarray) -> np.ndarray:
+    """Buy a close above the prior `entry`-bar high, sell a close below the prior `exit`-bar low."""
+    close = graph.evaluate(("close",))
+    with np.errstate(invalid="ignore"):
+        return hold(close > _previous(_rows(graph, "highest", entry)), close < _previous(_rows(graph, "lowest", exit)))
+
+
+# name -> (position function, default parameters)
+STRATEGIES: Dict[str, Tuple[Callable[..., np.ndarray], Dict[str, float]]] = {
+    "sma_crossover": (_sma_crossover, {"fast": 20, "slow": 50}),
+    "rsi_reversion": (_rsi_reversion, {"period": 14, "lower": 30, "upper": 70}),
+    "breakout": (_breakout, {"entry": 20, "exit": 10}),
+}
+
+# Parameters that are window lengths and must be positive integers
+PERIODS = {"fast", "slow", "period", "entry", "exit"}
+
+
+def strategy_positions(prices: Dict[str, np.ndarray], strategy: str, combinations: List[Dict[str, float]]) -> np.ndarray:
+    """Positions for each parameter combination (missing parameters take the strategy defaults)."""
+    function, defaults = _strategy(strategy)
+    params = {}
+    for name, default in defaults.items():
+        values = np.array([combination.get(name, default) for combination in combinations], dtype=np.float64)
+        if name in PERIODS:
+            if np.any(values < 1) or np.any(values != np.round(values)):
+                raise ValueError(f"{strategy} parameter {name} must be a positive integer")
+            values = values.astype(np.int64)
+        params[name] = values
+    graph = IndicatorGraph({field: prices[field] for field in ("open", "close", "high", "low", "volume")})
+    return function(graph, **params)
+
+
+def expression_positions(prices: Dict[str, np.ndarray], entry: str, exit: Optional[str] = None) -> np.ndarray:
+    """Positions from screener conditions: long while `entry` holds, or from entry until `exit` if given."""
+    graph = IndicatorGraph({field: prices[field] for field in ("open", "close", "high", "low", "volume")})
+    entries = _condition(prices, graph, entry)
+    if exit is None:
+        return entries.astype(np.float64)
+    return hold(entries, _condition(prices, graph, exit))
+
+
+def prediction_positions(timestamps: np.ndarray, close: np.ndarray, prediction_dates: np.ndarray,
+                         predicted_prices: np.ndarray, allow_short: bool = False) -> np.ndarray:
+    """Long when the latest prediction is above the close it was acted on (short below if allowed).
+
+    A prediction is acted on at the close of the first bar dated at or after it,
+    so it never trades at a price from before it was made, and holds until the next one.
+    """
+    bars = np.searchsorted(timestamps, prediction_dates, "left")
+    keep = bars < len(timestamps)
+    bars, predicted_prices = bars[keep], predicted_prices[keep]
+
+    direction = np.where(predicted_prices > close[bars], 1.0, -1.0 if allow_short else 0.0)
+    signal = np.full(len(timestamps), np.nan)
+    signal[bars] = direction  # with several predictions for one bar the latest wins
+    dates = np.arange(len(timestamps))
+    last = np.where(np.isnan(signal), 0, dates)
+    np.maximum.accumulate(last, out=last)
+    return np.nan_to_num(signal[last], nan=0.0)
+
+
+def _condition(prices: Dict[str, np.ndarray], graph: IndicatorGraph, text: str) -> np.ndarray:
+    values = compile_expression(text).evaluate(graph)
+    if np.asarray(values).dtype != bool:
+        raise ValueError(f"Condition must be a comparison: {text}")
+    return np.broadcast_to(values, prices["close"].shape)
+
+
+def _strategy(name: str) -> Tuple[Callable[..., np.ndarray], Dict[str, float]]:
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {name}. Available: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name]
+
+
+def expand_grid(grid: Dict[str, List[float]]) -> List[Dict[str, float]]:
+    """Every combination of the listed parameter values, in grid order."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _sweep_chunk(prices: Dict[str, np.ndarray], strategy: str, combinations: List[Dict[str, float]],
+                 fee_bps: float, slippage_bps: float, start: int = 0) -> Dict[str, np.ndarray]:
+    """Metrics for one slice of a sweep, trading from bar `start` on; runs in a worker process."""
+    positions = strategy_positions(prices, strategy, combinations)[:, start:]
+    return metrics(backtest(prices["close"][start:], positions, fee_bps, slippage_bps))
+
+
+def sweep(prices: Dict[str, np.ndarray], strategy: str, combinations: List[Dict[str, float]],
+          fee_bps: float = 0.0, slippage_bps: float = 0.0, start: int = 0) -> Dict[str, np.ndarray]:
+    """Metrics for every combination in this process, in chunks to bound the matrices' memory.
+
+    Indicators warm up on the bars before `start`; trading begins flat at `start`.
+    """
+    size = settings.backtest_chunk_size
+    chunks = [_sweep_chunk(prices, strategy, combinations[first:first + size], fee_bps, slippage_bps, start)
+              for first in range(0, len(combinations), size)]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in METRICS}
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    # Created on first use so importing the app never forks
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.backtest_processes)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def parallel_sweep(prices: Dict[str, np.ndarray], strategy: str, combinations: List[Dict[str, float]],
+                         fee_bps: float = 0.0, slippage_bps: float = 0.0, start: int = 0) -> Dict[str, np.ndarray]:
+    """sweep() with chunks spread over the process pool; small sweeps stay on the compute executor."""
+    size = settings.backtest_chunk_size
+    if len(combinations) <= size:
+        return await run_compute(sweep, prices, strategy, combinations, fee_bps, slippage_bps, start)
+
+    # Workers get plain arrays, not views into the memory-mapped cache
+    prices = {field: np.ascontiguousarray(prices[field]) for field in ("open", "close", "high", "low", "volume")}
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(_pool(), _sweep_chunk, prices, strategy, combinations[first:first + size],
+                             fee_bps, slippage_bps, start)
+        for first in range(0, len(combinations), size)
+    ))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in METRICS}
+
+
+def _summary(values: Dict[str, np.ndarray], row: int) -> Dict[str, Optional[float]]:
+    summary = {}
+    for name in METRICS:
+        value = values[name][row]
+        summary[name] = int(value) if name == "trades" else (None if np.isnan(value) else float(value))
+    return summary
+
+
+class BacktestService:
+    """Backtests of indicator strategies, screener conditions and stored predictions on daily bars."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def run(self, symbol: str, strategy: Optional[str] = None, params: Optional[Dict[str, float]] = None,
+                  entry: Optional[str] = None, exit: Optional[str] = None, model_id: Optional[int] = None,
+                  start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                  fee_bps: float = 0.0, slippage_bps: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Metrics and equity/drawdown curves for one signal; None if the stock is unknown.
+
+        The signal is a named strategy, an `entry` (and optional `exit`) screener
+        condition, or, with neither, the stored 1d predictions (of `model_id` if
+        given, else of every model, the latest prediction winning on each bar).
+        """
+        stock = await run_db_session(lambda: self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first())
+        if not stock:
+            return None
+        prices = await PriceStore().get_columns(stock.id, stock.symbol, end_date=end_date)
+        if prices is None or len(prices["timestamp"]) < 2:
+            raise ValueError(f"Not enough price history for {stock.symbol}")
+
+        predictions = None
+        if strategy is None and entry is None:
+            predictions = await run_db_session(self._predictions, stock.id, model_id)
+        return await run_compute(self._run, stock.symbol, prices, strategy, params or {}, entry, exit,
+                                 predictions, start_date, fee_bps, slippage_bps)
+
+    async def sweep(self, symbol: str, strategy: str, grid: Dict[str, List[float]],
+                    start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                    fee_bps: float = 0.0, slippage_bps: float = 0.0, sort_by: str = "sharpe",
+                    top: int = 20) -> Optional[Dict[str, Any]]:
+        """Metrics for every combination of the grid, best `top` first by `sort_by`; None if the stock is unknown."""
+        _, defaults = _strategy(strategy)
+        unknown = set(grid) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown {strategy} parameters: {', '.join(sorted(unknown))}")
+        if sort_by not in METRICS:
+            raise ValueError(f"sort_by must be one of {', '.join(METRICS)}")
+        combinations = expand_grid(grid)
+        if not 0 < len(combinations) <= settings.max_backtest_combinations:
+            raise ValueError(f"A sweep needs between 1 and {settings.max_backtest_combinations} combinations")
+
+        stock = await run_db_session(lambda: self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first())
+        if not stock:
+            return None
+        prices = await PriceStore().get_columns(stock.id, stock.symbol, end_date=end_date)
+        if prices is None or len(prices["timestamp"]) < 2:
+            raise ValueError(f"Not enough price history for {stock.symbol}")
+
+        # Indicators warm up on the whole history; only bars from start_date are traded
+        lo = self._start(prices, start_date)
+        values = await parallel_sweep(prices, strategy, combinations, fee_bps, slippage_bps, lo)
+
+        scores = values[sort_by].astype(np.float64)
+        # Drawdown is negative, so the best is the largest for every metric
+        order = np.argsort(np.where(np.isnan(scores), -np.inf, scores), kind="stable")[::-1][:top]
+        return {
+            "symbol": stock.symbol,
+            "strategy": strategy,
+            "combinations": len(combinations),
+            "sort_by": sort_by,
+            "results": [{"params": combinations[row], **_summary(values, row)} for row in order.tolist()],
+        }
+
+    def _run(self, symbol: str, prices: Dict[str, np.ndarray], strategy: Optional[str], params: Dict[str, float],
+             entry: Optional[str], exit: Optional[str], predictions: Optional[Tuple[np.ndarray, np.ndarray]],
+             start_date: Optional[datetime], fee_bps: float, slippage_bps: float) -> Dict[str, Any]:
+        """CPU-bound part of run; runs on the compute executor."""
+        if strategy is not None:
+            unknown = set(params) - set(_strategy(strategy)[1])
+            if unknown:
+                raise ValueError(f"Unknown {strategy} parameters: {', '.join(sorted(unknown))}")
+            positions = strategy_positions(prices, strategy, [params])[0]
+        elif entry is not None:
+            positions = expression_positions(prices, entry, exit)
+        else:
+            positions = prediction_positions(prices["timestamp"], prices["close"], *predictions)
+
+        # Indicators use the whole history; trading starts flat at start_date
+        lo = self._start(prices, start_date)
+        close, positions = prices["close"][lo:], positions[lo:]
+        result = backtest(close, positions, fee_bps, slippage_bps)
+        benchmark = backtest(close, np.ones_like(close))
+        summary = metrics(result)
+        return {
+            "symbol": symbol,
+            "strategy": strategy or ("condition" if entry is not None else "predictions"),
+            "params": params if strategy is not None else {"entry": entry, "exit": exit} if entry is not None else {},
+            "metrics": {name: summary[name].item() for name in METRICS},
+            "buy_and_hold_return": float(benchmark["equity"][-1] - 1) if len(close) > 1 else None,
+            "date": prices["timestamp"][lo + 1:].view("datetime64[ns]").astype("datetime64[s]"),
+            "position": result["held"],
+            "equity": result["equity"],
+            "drawdown": result["drawdown"],
+        }
+
+    def _start(self, prices: Dict[str, np.ndarray], start_date: Optional[datetime]) -> int:
+        if start_date is None:
+            return 0
+        lo = int(np.searchsorted(prices["timestamp"], np.datetime64(start_date, "ns").astype(np.int64)))
+        if lo >= len(prices["timestamp"]) - 1:
+            raise ValueError("start_date leaves fewer than two bars to trade")
+        return lo
+
+    def _predictions(self, stock_id: int, model_id: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        query = self.db.query(Prediction.date, Prediction.predicted_price).filter(
+            Prediction.stock_id == stock_id,
+            Prediction.timeframe == "1d"
+        )
+        if model_id is not None:
+            query = query.filter(Prediction.model_id == model_id)
+        rows = query.order_by(Prediction.date).all()
+        if not rows:
+            raise ValueError("No stored 1d predictions to backtest")
+        dates, prices = zip(*rows)
+        return (np.array(dates, dtype="datetime64[ns]").astype(np.int64), np.array(prices, dtype=np.float64))
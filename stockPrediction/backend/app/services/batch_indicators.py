@@ -0,0 +1,136 @@
+import asyncio
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from ..models.stock import Stock
+from .executor import run_db_session, run_compute
+from .price_store import PriceStore
+from .columnar_cache import columnar_prices
+from . import indicator_registry
+
+# Price columns loaded into the symbols x dates matrices
+MATRIX_FIELDS = ("open", "close", "high", "low", "volume")
+
+
+def align_columns(columns: Dict[str, Dict[str, np.ndarray]]
+                  ) -> Tuple[List[str], np.ndarray, Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+    """Stack per-symbol price columns into symbols x dates matrices on the union of their dates.
+
+    Gaps (a date another symbol traded on) are forward-filled along each row, and
+    dates before a symbol's first bar repeat that bar, so every row is NaN-free
+    for the kernels. Returns (symbols, timestamps, matrices, index of each
+    row's first real bar, index of its last); outputs before the first bar and
+    after the last (a stale symbol filled up to newer dates) must be masked by
+    the caller.
+    """
+    symbols = list(columns)
+    reference = columns[symbols[0]]["timestamp"]
+    if all(np.array_equal(columns[symbol]["timestamp"], reference) for symbol in symbols):
+        # Every symbol traded on the same dates: plain stacking, nothing to fill
+        matrices = {field: np.stack([columns[symbol][field] for symbol in symbols]).astype(np.float64)
+                    for field in MATRIX_FIELDS}
+        first = np.zeros(len(symbols), dtype=np.int64)
+        return symbols, np.asarray(reference), matrices, first, np.full(len(symbols), len(reference) - 1)
+
+    timestamps = np.unique(np.concatenate([columns[symbol]["timestamp"] for symbol in symbols]))
+    rows, dates = len(symbols), len(timestamps)
+
+    matrices = {field: np.full((rows, dates), np.nan) for field in MATRIX_FIELDS}
+    for row, symbol in enumerate(symbols):
+        positions = np.searchsorted(timestamps, columns[symbol]["timestamp"])
+        for field in MATRIX_FIELDS:
+            matrices[field][row, positions] = columns[symbol][field]
+
+    # Close is never missing on a stored bar, so it marks where each row has data
+    present = ~np.isnan(matrices["close"])
+    first = present.argmax(axis=1)
+    last = dates - 1 - present[:, ::-1].argmax(axis=1)
+    source = np.where(present, np.arange(dates), 0)
+    np.maximum.accumulate(source, axis=1, out=source)
+    source = np.maximum(source, first[:, None])
+    row_index = np.arange(rows)[:, None]
+    for field in MATRIX_FIELDS:
+        matrices[field] = matrices[field][row_index, source]
+    return symbols, timestamps, matrices, first, last
+
+
+def compute_batch(columns: Dict[str, Dict[str, np.ndarray]], indicators: List[str], bars: int) -> Dict[str, Any]:
+    """Indicators for every symbol at once over aligned matrices; the last `bars` dates are returned.
+
+    Values are null until an indicator has warmed up on the symbol's own bars,
+    and after the symbol's last bar.
+    """
+    if not columns:
+        return {"symbols": [], "date": np.empty(0, dtype="datetime64[s]"), "indicators": {}}
+    symbols, timestamps, matrices, first, last = align_columns(columns)
+    lo = max(0, len(timestamps) - bars)
+    positions = np.arange(lo, len(timestamps))
+    stale = positions[None, :] > last[:, None]
+
+    series = {}
+    graph = indicator_registry.IndicatorGraph(matrices)
+    for name in indicators:
+        warm = max(indicator_registry.warmup_bars([name]) - 1, 0)
+        masked = (positions[None, :] < (first + warm)[:, None]) | stale
+        for key, values in graph.series([name]).items():
+            series[key] = np.where(masked, np.nan, values[:, lo:])
+
+    return {
+        "symbols": symbols,
+        "date": timestamps[lo:].view("datetime64[ns]").astype("datetime64[s]"),
+        "indicators": series,
+    }
+
+
+class BatchIndicatorService:
+    """Indicators for many symbols in one pass over symbols x dates price matrices."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def compute(self, symbols: Optional[List[str]], indicators: List[str], end_date: Optional[datetime] = None,
+                      bars: int = 1) -> Dict[str, Any]:
+        """Aligned indicator matrices (one row per symbol) plus the symbols that had no price data.
+
+        With symbols None, every active stock is included. Unknown indicators raise ValueError.
+        """
+        for name in indicators:
+            indicator_registry.resolve(name)
+
+        columns, missing = await load_universe(self.db, symbols, end_date,
+                                               bars + indicator_registry.warmup_bars(indicators))
+        result = await run_compute(compute_batch, columns, indicators, bars)
+        result["missing"] = missing
+        return result
+
+
+async def load_universe(db: Session, symbols: Optional[List[str]], end_date: Optional[datetime], limit: int,
+                        refresh: bool = True) -> Tuple[Dict[str, Dict[str, np.ndarray]], List[str]]:
+    """Price columns for the given symbols (every active stock if None), at most `limit` bars each up to end_date.
+
+    Returns (columns by symbol, symbols that are unknown or have no bars). Each
+    symbol's columns are a slice of its memory-mapped cache. With
+    refresh False the cache is read as the last sync left it, skipping the
+    per-stock freshness check.
+    """
+    if symbols is None:
+        stocks = await run_db_session(lambda: db.query(Stock.id, Stock.symbol).filter(Stock.is_active == True).all())
+    else:
+        wanted = sorted({symbol.strip().upper() for symbol in symbols if symbol.strip()})
+        stocks = await run_db_session(lambda: db.query(Stock.id, Stock.symbol).filter(Stock.symbol.in_(wanted)).all())
+
+    if refresh:
+        store = PriceStore()
+        loaded = await asyncio.gather(*(
+            store.get_columns(stock_id, symbol, end_date=end_date, limit=limit) for stock_id, symbol in stocks
+        ))
+    else:
+        loaded = [columnar_prices.read(symbol, "1d", end=end_date, limit=limit) for _, symbol in stocks]
+    columns = {symbol: prices for (_, symbol), prices in zip(stocks, loaded)
+               if prices is not None and len(prices["timestamp"])}
+
+    found = {symbol for _, symbol in stocks}
+    unknown = set(wanted) - found if symbols is not None else set()
+    return columns, sorted(unknown | (found - set(columns)))
@@ -0,0 +1,231 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import uuid
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from ..config import settings
+
+# Column name -> dtype; timestamps are datetime64[ns] stored as int64
+COLUMNS = {
+    "timestamp": np.int64,
+    "id": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "adjusted_close": np.float64,
+    "volume": np.float64,  # float so missing volume can be NaN
+}
+
+MANIFEST = "manifest.json"
+
+
+class ColumnarPriceCache:
+    """Per-symbol, per-interval OHLCV columns stored as .npy files and read via mmap.
+
+    Each dataset is a directory of immutable segments (one .npy file per column)
+    plus a manifest listing them. Appends write a new segment and then atomically
+    replace the manifest, so readers always see a consistent set of files. A
+    segment's "rows" in the manifest is its logical length, which lets an append
+    supersede the last stored bar (a completed intraday bar) without rewriting
+    anything. Compaction merges segments back into one so that reads are
+    zero-copy slices of a single memory map.
+
+    Readers take no lock, so segment files dropped from the manifest are only
+    deleted by the compaction after next; a reader that loaded the manifest
+    just before a compaction can still map them.
+    """
+
+    def __init__(self, root: str, max_segments: int = 8):
+        self.root = root
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        # dataset dir -> (manifest version, column arrays); arrays are read-only memory maps
+        self._open: Dict[str, tuple] = {}
+
+    def read(self, symbol: str, interval: str = "1d", start: Optional[np.datetime64] = None,
+             end: Optional[np.datetime64] = None, limit: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Columns for bars in [start, end], most recent `limit` of them; None if nothing is cached.
+
+        Timestamps come back as int64 nanoseconds since the epoch. With a single segment
+        the arrays are views into the memory map, so nothing is copied.
+        """
+        columns = self._columns(self._dataset(symbol, interval))
+        if columns is None:
+            return None
+        timestamps = columns["timestamp"]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, np.datetime64(start, "ns").astype(np.int64), "left"))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, np.datetime64(end, "ns").astype(np.int64), "right"))
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return {name: array[lo:hi] for name, array in columns.items()}
+
+    def last_timestamp(self, symbol: str, interval: str = "1d") -> Optional[np.datetime64]:
+        columns = self._columns(self._dataset(symbol, interval))
+        if columns is None or len(columns["timestamp"]) == 0:
+            return None
+        return np.datetime64(int(columns["timestamp"][-1]), "ns")
+
+    def append(self, symbol: str, interval: str, columns: Dict[str, np.ndarray]) -> int:
+        """Append bars sorted by timestamp; returns how many were written.
+
+        Bars older than the last cached bar are ignored. A bar with the same timestamp
+        as the last cached bar replaces it.
+        """
+        path = self._dataset(symbol, interval)
+        os.makedirs(path, exist_ok=True)
+        with self._writer(path):
+            manifest = self._load_manifest(path)
+            timestamps = np.asarray(columns["timestamp"]).astype("datetime64[ns]").astype(np.int64)
+            segments = manifest["segments"]
+            if segments:
+                last = segments[-1]["last"]
+                keep = timestamps >= last
+                timestamps = timestamps[keep]
+                columns = {name: np.asarray(columns[name])[keep] for name in COLUMNS if name != "timestamp"}
+                if len(timestamps) and timestamps[0] == last:
+                    # Supersede the last stored bar by shortening its segment's logical length
+                    segments[-1]["rows"] -= 1
+                    if segments[-1]["rows"] == 0:
+                        manifest.setdefault("retired", []).append(segments.pop()["name"])
+                    else:
+                        segments[-1]["last"] = self._segment_timestamp(path, segments[-1], -1)
+            if len(timestamps) == 0:
+                return 0
+
+            data = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in COLUMNS.items() if name != "timestamp"}
+            data["timestamp"] = timestamps
+            segments.append(self._write_segment(path, data))
+            self._write_manifest(path, manifest)
+            if len(segments) > self.max_segments:
+                self._compact(path, manifest)
+            return len(timestamps)
+
+    def compact(self, symbol: str, interval: str = "1d"):
+        """Merge all segments of a dataset into one."""
+        path = self._dataset(symbol, interval)
+        if not os.path.isdir(path):
+            return
+        with self._writer(path):
+            self._compact(path, self._load_manifest(path))
+
+    def _compact(self, path: str, manifest: dict):
+        if len(manifest["segments"]) <= 1:
+            return
+        expired = manifest.get("retired", [])
+        merged = {name: np.concatenate([self._load_segment(path, segment)[name]
+                                        for segment in manifest["segments"]]) for name in COLUMNS}
+        manifest["retired"] = [segment["name"] for segment in manifest["segments"]]
+        manifest["segments"] = [self._write_segment(path, merged)]
+        self._write_manifest(path, manifest)
+        # Retired by the previous compaction, so no current manifest has named them for a whole cycle
+        for name in expired:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def _columns(self, path: str, retry: bool = True) -> Optional[Dict[str, np.ndarray]]:
+        manifest_path = os.path.join(path, MANIFEST)
+        try:
+            # The manifest is replaced, never rewritten in place, so a new inode means a new version
+            stat = os.stat(manifest_path)
+            version = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._open.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        manifest = self._load_manifest(path)
+        try:
+            segments = [self._load_segment(path, segment) for segment in manifest["segments"]]
+        except FileNotFoundError:
+            # Deleted after the manifest was read by a reader that stalled across two compactions
+            if not retry:
+                raise
+            return self._columns(path, retry=False)
+        if not segments:
+            return None
+        if len(segments) == 1:
+            columns = segments[0]
+        else:
+            columns = {name: np.concatenate([segment[name] for segment in segments]) for name in COLUMNS}
+        with self._lock:
+            self._open[path] = (version, columns)
+        return columns
+
+    def _load_segment(self, path: str, segment: dict) -> Dict[str, np.ndarray]:
+        rows = segment["rows"]
+        return {
+            name: np.load(os.path.join(path, segment["name"], f"{name}.npy"), mmap_mode="r")[:rows]
+            for name in COLUMNS
+        }
+
+    def _segment_timestamp(self, path: str, segment: dict, index: int) -> int:
+        return int(self._load_segment(path, segment)["timestamp"][index])
+
+    def _write_segment(self, path: str, data: Dict[str, np.ndarray]) -> dict:
+        name = f"seg-{uuid.uuid4().hex[:12]}"
+        tmp = os.path.join(path, f".{name}.tmp")
+        os.makedirs(tmp)
+        for column, dtype in COLUMNS.items():
+            with open(os.path.join(tmp, f"{column}.npy"), "wb") as f:
+                np.save(f, np.ascontiguousarray(data[column], dtype=dtype))
+                f.flush()
+                os.fsync(f.fileno())
+        os.rename(tmp, os.path.join(path, name))
+        return {"name": name, "rows": int(len(data["timestamp"])),
+                "first": int(data["timestamp"][0]), "last": int(data["timestamp"][-1])}
+
+    def _load_manifest(self, path: str) -> dict:
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 1, "segments": []}
+
+    def _write_manifest(self, path: str, manifest: dict):
+        tmp = os.path.join(path, f".{MANIFEST}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, MANIFEST))
+        dir_fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    @contextmanager
+    def _writer(self, path: str):
+        """One writer per dataset across threads and worker processes."""
+        with open(os.path.join(path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _dataset(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, symbol.upper().replace("/", "_"), interval)
+
+
+def frame_columns(timestamps, ids, opens, highs, lows, closes, adjusted, volumes) -> Dict[str, np.ndarray]:
+    """Build an append-ready column dict from parallel sequences."""
+    return {
+        "timestamp": np.asarray(timestamps, dtype="datetime64[ns]"),
+        "id": np.asarray(ids, dtype=np.int64),
+        "open": np.asarray(opens, dtype=np.float64),
+        "high": np.asarray(highs, dtype=np.float64),
+        "low": np.asarray(lows, dtype=np.float64),
+        "close": np.asarray(closes, dtype=np.float64),
+        "adjusted_close": np.asarray([np.nan if v is None else v for v in adjusted], dtype=np.float64),
+        "volume": np.asarray([np.nan if v is None else v for v in volumes], dtype=np.float64),
+    }
+
+
+columnar_prices = ColumnarPriceCache(settings.price_cache_dir, max_segments=settings.price_cache_max_segments)
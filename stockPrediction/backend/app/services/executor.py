@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderTimeout(TimeoutError):
+    """A blocking call did not finish within its provider's timeout."""
+
+
+class ProviderStats:
+    def __init__(self):
+        self.calls = 0
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.running = 0
+        self.started = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "completed": self.completed,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "waiting": self.waiting,
+            "running": self.running,
+            "avg_queue_ms": round(self.queue_seconds / self.started * 1000, 3) if self.started else None,
+            "max_queue_ms": round(self.max_queue_seconds * 1000, 3),
+            "avg_run_ms": round(self.run_seconds / self.started * 1000, 3) if self.started else None,
+        }
+
+
+# Default for BlockingExecutor.run's timeout: the provider's configured one
+PROVIDER_TIMEOUT = object()
+
+
+class BlockingExecutor:
+    """Bounded thread pool for blocking calls made from async route handlers.
+
+    Each provider ("yfinance", "database", "compute", ...) has its own concurrency
+    limit and timeout, so a slow upstream can neither block the event loop nor
+    take every worker thread. A provider's slot is held until its thread really
+    finishes, even after the caller has given up on a timeout, so a hung upstream
+    never holds more threads than its limit.
+    """
+
+    def __init__(self, max_workers: int, limits: Dict[str, int], timeouts: Dict[str, float],
+                 default_limit: int = 4, default_timeout: Optional[float] = 30.0):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking")
+        self._limits = dict(limits)
+        self._timeouts = dict(timeouts)
+        self._default_limit = default_limit
+        self._default_timeout = default_timeout
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, ProviderStats] = {}
+
+    async def run(self, provider: str, fn: Callable[..., Any], *args,
+                  timeout: Optional[float] = PROVIDER_TIMEOUT, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool under the provider's limit and timeout.
+
+        The timeout covers both waiting for a slot and the call itself. With
+        timeout=None the caller waits for the call however long it takes.
+        """
+        if timeout is PROVIDER_TIMEOUT:
+            timeout = self._timeouts.get(provider, self._default_timeout)
+        stats = self._provider_stats(provider)
+        stats.calls += 1
+        try:
+            result = await asyncio.wait_for(self._run(provider, stats, fn, args, kwargs), timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise ProviderTimeout(f"{provider} call {getattr(fn, '__name__', fn)} timed out after {timeout}s")
+        except Exception:
+            stats.errors += 1
+            raise
+        stats.completed += 1
+        return result
+
+    async def _run(self, provider: str, stats: "ProviderStats", fn: Callable[..., Any], args, kwargs) -> Any:
+        # Slots are taken on the event loop so callers waiting on a busy provider hold no thread
+        semaphore = self._semaphore(provider)
+        queued_at = time.perf_counter()
+        stats.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.waiting -= 1
+
+        loop = asyncio.get_running_loop()
+        timing = {}
+
+        def call():
+            timing["started"] = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timing["finished"] = time.perf_counter()
+
+        def finished(_):
+            # Back on the loop once the thread is done, even if the caller already timed out
+            stats.running -= 1
+            if "started" in timing:
+                stats.started += 1
+                queue_time = timing["started"] - queued_at
+                stats.queue_seconds += queue_time
+                stats.max_queue_seconds = max(stats.max_queue_seconds, queue_time)
+                stats.run_seconds += timing["finished"] - timing["started"]
+            semaphore.release()
+
+        stats.running += 1
+        try:
+            submitted = self._pool.submit(call)
+        except Exception:
+            stats.running -= 1
+            semaphore.release()
+            raise
+        submitted.add_done_callback(lambda f: loop.call_soon_threadsafe(finished, f))
+        return await asyncio.wrap_future(submitted)
+
+    def bind(self, provider: str, **defaults) -> Callable[..., Any]:
+        """Shortcut so call sites read `await run_upstream(fn, ...)`."""
+        return functools.partial(self.run, provider, **defaults)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {**stats.to_dict(), "limit": self._limits.get(name, self._default_limit)}
+            for name, stats in self._stats.items()
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _provider_stats(self, provider: str) -> "ProviderStats":
+        if provider not in self._stats:
+            self._stats[provider] = ProviderStats()
+        return self._stats[provider]
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        # Created lazily so the semaphore belongs to the running event loop
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(self._limits.get(provider, self._default_limit))
+        return self._semaphores[provider]
+
+
+class CoalescedTasks:
+    """At most one running task per key; callers asking for a key that is running share its task.
+
+    With a `failure` description the tasks are fire-and-forget background work:
+    an exception is logged as a warning and the task returns None.
+    """
+
+    def __init__(self, failure: Optional[str] = None):
+        self.failure = failure
+        self._running: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._running
+
+    def __len__(self) -> int:
+        return len(self._running)
+
+    def run(self, key: Hashable, start: Callable[[], Awaitable[Any]], name: Optional[str] = None) -> asyncio.Task:
+        """The task running for key, or a new one from start(); `name` identifies it in failure logs."""
+        task = self._running.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._logged(start, name or key) if self.failure else start())
+            self._running[key] = task
+            task.add_done_callback(lambda _: self._running.pop(key, None))
+        return task
+
+    async def _logged(self, start: Callable[[], Awaitable[Any]], name: Hashable) -> Any:
+        try:
+            return await start()
+        except Exception as e:
+            logger.warning(f"{self.failure} failed for {name}: {e}")
+            return None
+
+
+blocking_executor = BlockingExecutor(
+    max_workers=settings.executor_max_workers,
+    limits={
+        "yfinance": settings.yfinance_max_concurrency,
+        "database": settings.database_pool_size + settings.database_max_overflow,
+        "compute": settings.compute_max_concurrency,
+    },
+    timeouts={
+        "yfinance": settings.yfinance_timeout,
+        "database": settings.database_timeout,
+        "compute": settings.compute_timeout,
+    },
+)
+
+run_upstream = blocking_executor.bind("yfinance")
+run_db = blocking_executor.bind("database")
+# For calls on a caller's Session (e.g. a request's, which get_db closes when the request ends). They are
+# never timed out: the caller must not move on, and close the Session, while a worker thread still uses it.
+run_db_session = blocking_executor.bind("database", timeout=None)
+run_compute = blocking_executor.bind("compute")
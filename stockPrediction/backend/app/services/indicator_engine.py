@@ -0,0 +1,191 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+from typing import Tuple
+
+# Every kernel works along the last axis, so the same code handles one series
+# (shape [dates]) or a whole universe (shape [symbols, dates]). Inputs must not
+# contain NaN (sma excepted); outputs are NaN until enough bars exist for the window.
+
+
+def _nan_prefix(result: np.ndarray, count: int) -> np.ndarray:
+    result[..., :min(count, result.shape[-1])] = np.nan
+    return result
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """Simple moving average from a running cumulative sum: O(n) regardless of period.
+
+    NaN stays local: only windows that contain one are NaN. NaN is summed as 0
+    and a running count of NaN marks those windows, so one undefined input
+    (e.g. %K over a flat range) does not poison the rest of the series.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] < period:
+        return result
+    missing = np.isnan(values)
+    sums = _window_sums(np.where(missing, 0.0, values), period)
+    gaps = _window_sums(missing.astype(np.int64), period)
+    result[..., period - 1:] = np.where(gaps > 0, np.nan, sums / period)
+    return result
+
+
+def rolling_std(values: np.ndarray, period: int, ddof: int = 1) -> np.ndarray:
+    """Rolling standard deviation from running sums of x and x**2: O(n) regardless of period.
+
+    Values are centred on each series' mean first, which keeps the running sums
+    small enough that the sum-of-squares formula does not lose precision.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] < period:
+        return result
+    centred = values - values.mean(axis=-1, keepdims=True)
+    sums = _window_sums(centred, period)
+    squares = _window_sums(centred * centred, period)
+    variance = (squares - sums * sums / period) / (period - ddof)
+    result[..., period - 1:] = np.sqrt(np.maximum(variance, 0))
+    return result
+
+
+def _window_sums(values: np.ndarray, period: int) -> np.ndarray:
+    """Sums of each full `period`-long window along the last axis."""
+    cumsum = np.cumsum(values, axis=-1)
+    sums = cumsum[..., period - 1:].copy()
+    sums[..., 1:] -= cumsum[..., :-period]
+    return sums
+
+
+def rolling_max(values: np.ndarray, period: int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] >= period:
+        result[..., period - 1:] = sliding_window_view(values, period, axis=-1).max(axis=-1)
+    return result
+
+
+def rolling_min(values: np.ndarray, period: int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] >= period:
+        result[..., period - 1:] = sliding_window_view(values, period, axis=-1).min(axis=-1)
+    return result
+
+
+def ema(values: np.ndarray, period: int = None, alpha: float = None) -> np.ndarray:
+    """Recursive exponential moving average, y[t] = a*x[t] + (1-a)*y[t-1], seeded with x[0].
+
+    The recursion runs as a first-order IIR filter (scipy lfilter) in C. This is
+    pandas' ewm(span=period, adjust=False).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if alpha is None:
+        alpha = 2.0 / (period + 1)
+    if values.shape[-1] == 0:
+        return values.copy()
+    zi = (1 - alpha) * values[..., :1]
+    result, _ = lfilter([alpha], [1.0, alpha - 1], values, axis=-1, zi=zi)
+    return result
+
+
+def wilder_smooth(values: np.ndarray, period: int) -> np.ndarray:
+    """Wilder's moving average: seeded with the mean of the first `period` values, then alpha = 1/period."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] < period:
+        return result
+    seed = values[..., :period].mean(axis=-1, keepdims=True)
+    result[..., period - 1:period] = seed
+    if values.shape[-1] > period:
+        alpha = 1.0 / period
+        zi = (1 - alpha) * seed
+        result[..., period:], _ = lfilter([alpha], [1.0, alpha - 1], values[..., period:], axis=-1, zi=zi)
+    return result
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Relative Strength Index with Wilder smoothing of gains and losses."""
+    close = np.asarray(close, dtype=np.float64)
+    result = np.full(close.shape, np.nan)
+    if close.shape[-1] <= period:
+        return result
+    delta = np.diff(close, axis=-1)
+    avg_gain = wilder_smooth(np.clip(delta, 0, None), period)
+    avg_loss = wilder_smooth(np.clip(-delta, 0, None), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # All-gain windows give 100, flat windows give 50
+        rs = avg_gain / avg_loss
+        values = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), 100 - 100 / (1 + rs))
+    result[..., 1:] = np.where(np.isnan(avg_gain), np.nan, values)
+    return result
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD line, signal line and histogram; NaN until the slow EMA has `slow` bars."""
+    return macd_from_emas(ema(close, fast), ema(close, slow), slow, signal)
+
+
+def macd_from_emas(fast_ema: np.ndarray, slow_ema: np.ndarray, slow: int = 26,
+                   signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD outputs from already computed fast and slow EMAs of the same series."""
+    macd_line = fast_ema - slow_ema
+    signal_line = ema(macd_line, signal)
+    histogram = macd_line - signal_line
+    return tuple(_nan_prefix(series, slow - 1) for series in (macd_line, signal_line, histogram))
+
+
+def bollinger_bands(close: np.ndarray, period: int = 20, std_dev: float = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Upper band, middle band (SMA) and lower band."""
+    return bands(sma(close, period), rolling_std(close, period), std_dev)
+
+
+def bands(middle: np.ndarray, std: np.ndarray, std_dev: float = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    width = std * std_dev
+    return middle + width, middle, middle - width
+
+
+def stochastic(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14,
+               smooth: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Stochastic oscillator %K and its `smooth`-bar average %D."""
+    return stochastic_from_extremes(close, rolling_max(high, period), rolling_min(low, period), period, smooth)
+
+
+def stochastic_from_extremes(close: np.ndarray, highest: np.ndarray, lowest: np.ndarray, period: int = 14,
+                             smooth: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = 100 * (np.asarray(close) - lowest) / (highest - lowest)
+    d = np.full(k.shape, np.nan)
+    if k.shape[-1] >= period - 1 + smooth:
+        d[..., period - 1:] = sma(k[..., period - 1:], smooth)
+    return k, d
+
+
+def williams_r(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    return williams_r_from_extremes(close, rolling_max(high, period), rolling_min(low, period))
+
+
+def williams_r_from_extremes(close: np.ndarray, highest: np.ndarray, lowest: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -100 * (highest - np.asarray(close)) / (highest - lowest)
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    previous = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    result = np.maximum(high - low, np.maximum(np.abs(high - previous), np.abs(low - previous)))
+    return _nan_prefix(result, 1)
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Average True Range: simple average of the true range over `period` bars."""
+    return atr_from_true_range(true_range(high, low, close), period)
+
+
+def atr_from_true_range(tr: np.ndarray, period: int = 14) -> np.ndarray:
+    result = np.full(tr.shape, np.nan)
+    if tr.shape[-1] > period:
+        result[..., 1:] = sma(tr[..., 1:], period)
+    return result
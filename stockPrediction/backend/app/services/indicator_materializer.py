@@ -0,0 +1,113 @@
+import asyncio
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func
+
+from ..config import settings
+from ..database import SessionLocal, upsert_rows
+from ..models.stock import StockIndicator
+from .executor import CoalescedTasks, run_db, run_compute
+from .columnar_cache import columnar_prices
+from . import indicator_registry
+
+# stock_id -> materialization currently running
+_materializing = CoalescedTasks("Indicator materialization")
+
+
+class IndicatorMaterializer:
+    """Precomputed indicator values in stock_indicators, one row per stock, bar date and indicator.
+
+    A row's date is the bar it was computed from, so the stored values for a
+    stock are fresh exactly when their date is the newest stored bar. Each run
+    recomputes from the newest materialized bar onwards (the sync may have
+    revised it), loading earlier bars only to warm the indicators up.
+    """
+
+    def schedule(self, stock_id: int, symbol: str) -> asyncio.Task:
+        """Materialize in the background; concurrent requests for the same stock share one run."""
+        return _materializing.run(stock_id, lambda: self.materialize(stock_id, symbol), symbol)
+
+    async def materialize(self, stock_id: int, symbol: str, names: Optional[List[str]] = None) -> int:
+        """Compute and upsert indicator rows for bars not yet materialized; returns rows written."""
+        names = names or settings.materialized_indicators
+        last = await run_db(_last_materialized, stock_id, [name.upper() for name in names])
+        prices = columnar_prices.read(symbol, "1d")
+        if prices is None or len(prices["timestamp"]) == 0:
+            return 0
+        rows = await run_compute(_indicator_rows, stock_id, prices, names, last)
+        if not rows:
+            return 0
+        return await run_db(upsert_rows, StockIndicator, rows, ['stock_id', 'date', 'indicator_type'],
+                            ['value', 'metadata'])
+
+    async def get_fresh(self, stock_id: int, last_bar_at: datetime, names: List[str]) -> Optional[List[StockIndicator]]:
+        """Stored rows for the newest bar, or None unless every requested indicator has one."""
+        types = [name.upper() for name in names]
+        rows = await run_db(_indicators_at, stock_id, last_bar_at, types)
+        return rows if len(rows) == len(set(types)) else None
+
+
+def _indicator_rows(stock_id: int, prices: Dict[str, np.ndarray], names: List[str],
+                    last: Optional[datetime]) -> List[Dict[str, Any]]:
+    """Rows for every bar from `last` (or the configured history) onwards, skipping warm-up values."""
+    timestamps = prices["timestamp"]
+    if last is None:
+        lo = max(0, len(timestamps) - settings.indicator_history_bars)
+    else:
+        lo = int(np.searchsorted(timestamps, np.datetime64(last, "ns").astype(np.int64), "left"))
+    warm = max(0, lo - indicator_registry.warmup_bars(names))
+
+    graph = indicator_registry.IndicatorGraph({name: prices[name][warm:] for name in indicator_registry.SOURCES})
+    dates = timestamps[lo:].view("datetime64[ns]").astype("datetime64[us]").tolist()
+    rows = []
+    for name in names:
+        definition, params = indicator_registry.resolve(name)
+        series = graph.series([name])
+        outputs = {
+            output: np.where(np.isnan(series[f"{name}{suffix}"][lo - warm:]), None, series[f"{name}{suffix}"][lo - warm:]).tolist()
+            for output, suffix in definition.outputs.items()
+        }
+        for i, date in enumerate(dates):
+            value = outputs[definition.value][i]
+            if value is None:
+                continue
+            row_outputs = {output: values[i] for output, values in outputs.items()}
+            rows.append({
+                "stock_id": stock_id,
+                "date": date,
+                "indicator_type": name.upper(),
+                "value": value,
+                "indicator_metadata": definition.metadata(params, row_outputs)
+            })
+    return rows
+
+
+def _last_materialized(stock_id: int, types: List[str]) -> Optional[datetime]:
+    """Oldest of the newest materialized dates across types; None if any type has no rows yet."""
+    db = SessionLocal()
+    try:
+        latest = db.query(StockIndicator.indicator_type, func.max(StockIndicator.date)).filter(
+            StockIndicator.stock_id == stock_id,
+            StockIndicator.indicator_type.in_(types)
+        ).group_by(StockIndicator.indicator_type).all()
+        if len(latest) < len(set(types)):
+            return None
+        return min(date for _, date in latest)
+    finally:
+        db.close()
+
+
+def _indicators_at(stock_id: int, date: datetime, types: List[str]) -> List[StockIndicator]:
+    db = SessionLocal()
+    try:
+        return db.query(StockIndicator).filter(
+            StockIndicator.stock_id == stock_id,
+            StockIndicator.date == date,
+            StockIndicator.indicator_type.in_(types)
+        ).all()
+    finally:
+        db.close()
+
+
+indicator_materializer = IndicatorMaterializer()
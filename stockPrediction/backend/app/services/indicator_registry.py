@@ -0,0 +1,221 @@
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import indicator_engine as engine
+
+# Graph nodes are keyed by (kind, *parameters), e.g. ("ema", 12) or ("highest", 14).
+# Price columns are the source nodes.
+SOURCES = ("close", "high", "low", "volume")
+CLOSE, HIGH, LOW = ("close",), ("high",), ("low",)
+
+
+class IndicatorDefinition:
+    """One node type in the indicator graph.
+
+    `defaults` names the parameters in the order they appear in an indicator
+    name ("macd_12_26_9"), `inputs` maps parameters to the keys of the nodes it
+    is computed from, and `compute` receives those arrays followed by the
+    parameters. Public definitions can be requested by name; the rest are
+    shared intermediates. `outputs` maps each output to its suffix in series
+    keys, in the order compute returns them.
+    """
+
+    def __init__(self, kind: str, compute: Callable, inputs: Callable[..., List[tuple]],
+                 defaults: Dict[str, Any], outputs: Optional[Dict[str, str]] = None, value: str = "value",
+                 warmup: Optional[Callable[..., int]] = None, metadata: Optional[Callable[..., dict]] = None,
+                 public: bool = True):
+        self.kind = kind
+        self.compute = compute
+        self.inputs = inputs
+        self.defaults = defaults
+        self.outputs = outputs or {"value": ""}
+        self.value = value
+        self.warmup = warmup or (lambda **params: max([0, *params.values()]))
+        self.metadata = metadata or (lambda params, outputs: dict(params))
+        self.public = public
+
+    def key(self, params: Dict[str, Any]) -> tuple:
+        return (self.kind, *params.values())
+
+
+INDICATORS: Dict[str, IndicatorDefinition] = {}
+
+
+def register(kind: str, inputs: Callable[..., List[tuple]], defaults: Dict[str, Any] = None, **options):
+    """Decorator adding a compute function to the registry under `kind`."""
+    def decorator(compute: Callable) -> Callable:
+        INDICATORS[kind] = IndicatorDefinition(kind, compute, inputs, defaults or {}, **options)
+        return compute
+    return decorator
+
+
+def parse_indicator_name(name: str) -> Tuple[str, List[int]]:
+    """'sma_20' -> ('sma', [20]); 'macd_12_26_9' -> ('macd', [12, 26, 9]); 'rsi' -> ('rsi', [])."""
+    parts = name.lower().split("_")
+    params = []
+    while parts and parts[-1].isdigit():
+        params.insert(0, int(parts.pop()))
+    return "_".join(parts), params
+
+
+def resolve(name: str) -> Tuple[IndicatorDefinition, Dict[str, Any]]:
+    """Definition and full parameters for a requested name; ValueError if it is not a public indicator."""
+    kind, values = parse_indicator_name(name)
+    definition = INDICATORS.get(kind)
+    if definition is None or not definition.public or len(values) > len(definition.defaults):
+        raise ValueError(f"Unknown indicator: {name}")
+    params = dict(definition.defaults)
+    params.update(zip(definition.defaults, values))
+    return definition, params
+
+
+def is_supported(name: str) -> bool:
+    try:
+        resolve(name)
+        return True
+    except ValueError:
+        return False
+
+
+def warmup_bars(names: List[str]) -> int:
+    """Bars to load before the first wanted value so every named indicator is defined and converged."""
+    return max([0, *(definition.warmup(**params) for definition, params in map(resolve, names))])
+
+
+class IndicatorGraph:
+    """Evaluates requested indicators over one set of price columns, computing each node exactly once.
+
+    Nodes are resolved depth first from the requested indicators through their
+    declared inputs, so the graph built for a request only contains what it
+    needs, and intermediates such as EMA(12) or the 14-bar high are shared
+    between every indicator that uses them.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        self.nodes: Dict[tuple, Any] = {}
+        self._resolving = set()
+
+    def evaluate(self, key: tuple):
+        if key in self.nodes:
+            return self.nodes[key]
+        kind, *args = key
+        if kind in SOURCES:
+            value = np.asarray(self.columns[kind], dtype=np.float64)
+        else:
+            if key in self._resolving:
+                raise ValueError(f"Indicator graph has a cycle at {key}")
+            self._resolving.add(key)
+            definition = INDICATORS[kind]
+            params = dict(zip(definition.defaults, args))
+            inputs = [self.evaluate(input_key) for input_key in definition.inputs(**params)]
+            value = definition.compute(*inputs, **params)
+            self._resolving.discard(key)
+        self.nodes[key] = value
+        return value
+
+    def series(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """Aligned output series keyed by name plus output suffix ('macd', 'macd_signal', ...)."""
+        series = {}
+        for name in names:
+            definition, params = resolve(name)
+            outputs = self.evaluate(definition.key(params))
+            if len(definition.outputs) == 1:
+                outputs = (outputs,)
+            for suffix, values in zip(definition.outputs.values(), outputs):
+                series[f"{name}{suffix}"] = values
+        return series
+
+
+def compute_series(columns: Dict[str, np.ndarray], names: List[str]) -> Dict[str, np.ndarray]:
+    """Full series for each named indicator; unknown names raise ValueError."""
+    return IndicatorGraph(columns).series(names)
+
+
+def output_values(name: str, values: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    """Latest outputs of one indicator by output name, picked from values keyed like compute_series."""
+    definition, _ = resolve(name)
+    return {output: values.get(f"{name}{suffix}") for output, suffix in definition.outputs.items()}
+
+
+# Shared intermediates
+
+@register("rolling_std", inputs=lambda period: [CLOSE], defaults={"period": 20}, public=False)
+def _rolling_std(close, period):
+    return engine.rolling_std(close, period)
+
+
+@register("highest", inputs=lambda period: [HIGH], defaults={"period": 14}, public=False)
+def _highest(high, period):
+    return engine.rolling_max(high, period)
+
+
+@register("lowest", inputs=lambda period: [LOW], defaults={"period": 14}, public=False)
+def _lowest(low, period):
+    return engine.rolling_min(low, period)
+
+
+@register("true_range", inputs=lambda: [HIGH, LOW, CLOSE], public=False)
+def _true_range(high, low, close):
+    return engine.true_range(high, low, close)
+
+
+# Public indicators. Recursive ones warm up for about six time constants so the
+# seed has decayed to about 1e-5 of its initial weight.
+
+@register("sma", inputs=lambda period: [CLOSE], defaults={"period": 20})
+def _sma(close, period):
+    return engine.sma(close, period)
+
+
+@register("ema", inputs=lambda period: [CLOSE], defaults={"period": 12},
+          warmup=lambda period: 6 * period)
+def _ema(close, period):
+    return engine.ema(close, period)
+
+
+@register("rsi", inputs=lambda period: [CLOSE], defaults={"period": 14},
+          warmup=lambda period: 12 * period,
+          metadata=lambda params, outputs: {**params, "overbought": 70, "oversold": 30})
+def _rsi(close, period):
+    return engine.rsi(close, period)
+
+
+@register("macd", inputs=lambda fast, slow, signal: [("ema", fast), ("ema", slow)],
+          defaults={"fast": 12, "slow": 26, "signal": 9},
+          outputs={"macd_line": "", "signal_line": "_signal", "histogram": "_histogram"}, value="macd_line",
+          warmup=lambda fast, slow, signal: 6 * (slow + signal),
+          metadata=lambda params, outputs: dict(outputs))
+def _macd(fast_ema, slow_ema, fast, slow, signal):
+    return engine.macd_from_emas(fast_ema, slow_ema, slow, signal)
+
+
+@register("bollinger_bands", inputs=lambda period, std_dev: [("sma", period), ("rolling_std", period)],
+          defaults={"period": 20, "std_dev": 2},
+          outputs={"upper_band": "_upper", "middle_band": "_middle", "lower_band": "_lower"}, value="middle_band",
+          warmup=lambda period, std_dev: period,
+          metadata=lambda params, outputs: {**outputs, **params})
+def _bollinger_bands(middle, std, period, std_dev):
+    return engine.bands(middle, std, std_dev)
+
+
+@register("stochastic", inputs=lambda period, smooth: [CLOSE, ("highest", period), ("lowest", period)],
+          defaults={"period": 14, "smooth": 3},
+          outputs={"k_percent": "_k", "d_percent": "_d"}, value="k_percent",
+          warmup=lambda period, smooth: period + smooth,
+          metadata=lambda params, outputs: {**outputs, **params, "overbought": 80, "oversold": 20})
+def _stochastic(close, highest, lowest, period, smooth):
+    return engine.stochastic_from_extremes(close, highest, lowest, period, smooth)
+
+
+@register("williams_r", inputs=lambda period: [CLOSE, ("highest", period), ("lowest", period)],
+          defaults={"period": 14},
+          metadata=lambda params, outputs: {**params, "overbought": -20, "oversold": -80})
+def _williams_r(close, highest, lowest, period):
+    return engine.williams_r_from_extremes(close, highest, lowest)
+
+
+@register("atr", inputs=lambda period: [("true_range",)], defaults={"period": 14},
+          warmup=lambda period: period + 1)
+def _atr(tr, period):
+    return engine.atr_from_true_range(tr, period)
@@ -0,0 +1,105 @@
+import asyncio
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from ..database import SessionLocal, upsert_rows
+from ..models.stock import IndicatorState
+from .executor import run_db, run_compute
+from .price_store import PriceStore
+from .indicator_registry import warmup_bars
+from .streaming_indicators import StreamingIndicator, create_indicator, restore_indicator
+
+INTERVAL = "1d"
+
+# (stock_id, interval) -> live streaming indicators by name, restored from indicator_states on first use
+_indicators: Dict[Tuple[int, str], Dict[str, StreamingIndicator]] = {}
+_locks: Dict[Tuple[int, str], asyncio.Lock] = {}
+
+
+class IndicatorStateStore:
+    """Current indicator values kept up to date by streaming indicators.
+
+    Each indicator is fed only the bars it has not seen yet, so a request costs
+    O(new bars) instead of a recomputation over the whole window. Every bar but
+    the newest is final (a sync re-fetches only the last stored day), so state is
+    committed and persisted up to the second-newest bar and the newest bar is
+    applied to a throwaway copy.
+    """
+
+    async def current_values(self, stock_id: int, symbol: str, names: List[str],
+                             min_bars: int = 1) -> Optional[Dict[str, Optional[float]]]:
+        """Latest outputs for each indicator name, or None if fewer than min_bars bars are stored."""
+        key = (stock_id, INTERVAL)
+        async with _locks.setdefault(key, asyncio.Lock()):
+            indicators = _indicators.setdefault(key, {})
+            missing = [name for name in names if name not in indicators]
+            if missing:
+                indicators.update(await run_db(_load_states, stock_id, INTERVAL, missing))
+
+            prices = await PriceStore().get_columns(stock_id, symbol)
+            if prices is None or len(prices["timestamp"]) < min_bars:
+                return None
+
+            values, advanced = await run_compute(_advance, indicators, names, prices)
+            if advanced:
+                await run_db(_save_states, stock_id, INTERVAL, {name: indicators[name] for name in advanced})
+            return values
+
+
+def _advance(indicators: Dict[str, StreamingIndicator], names: List[str],
+             prices: Dict[str, np.ndarray]) -> Tuple[Dict[str, Optional[float]], List[str]]:
+    """Feed each indicator its unseen final bars; returns (current values, names whose state advanced)."""
+    timestamps = prices["timestamp"]
+    final = len(timestamps) - 1
+    values, advanced = {}, []
+    for name in names:
+        indicator = indicators.get(name)
+        if indicator is None:
+            indicator = indicators[name] = create_indicator(name)
+            start = max(0, final - warmup_bars([name]))
+        else:
+            start = int(np.searchsorted(timestamps, indicator.last_bar_at, "right"))
+
+        if start < final:
+            for high, low, close in zip(prices["high"][start:final].tolist(), prices["low"][start:final].tolist(),
+                                        prices["close"][start:final].tolist()):
+                indicator.update(high, low, close)
+            indicator.last_bar_at = int(timestamps[final - 1])
+            advanced.append(name)
+
+        latest = restore_indicator(name, indicator.to_state())
+        latest.update(float(prices["high"][final]), float(prices["low"][final]), float(prices["close"][final]))
+        values.update(latest.values())
+    return values, advanced
+
+
+def _load_states(stock_id: int, interval: str, names: List[str]) -> Dict[str, StreamingIndicator]:
+    db = SessionLocal()
+    try:
+        rows = db.query(IndicatorState).filter(
+            IndicatorState.stock_id == stock_id,
+            IndicatorState.interval == interval,
+            IndicatorState.name.in_(names)
+        ).all()
+        indicators = {}
+        for row in rows:
+            indicator = restore_indicator(row.name, row.state)
+            indicator.last_bar_at = int(np.datetime64(row.last_bar_at, "ns").astype(np.int64))
+            indicators[row.name] = indicator
+        return indicators
+    finally:
+        db.close()
+
+
+def _save_states(stock_id: int, interval: str, indicators: Dict[str, StreamingIndicator]):
+    now = datetime.utcnow()
+    rows = [{
+        "stock_id": stock_id,
+        "interval": interval,
+        "name": name,
+        "state": indicator.to_state(),
+        "last_bar_at": np.datetime64(indicator.last_bar_at, "ns").astype("datetime64[us]").astype(datetime),
+        "updated_at": now
+    } for name, indicator in indicators.items()]
+    upsert_rows(IndicatorState, rows, ['stock_id', 'interval', 'name'], ['state', 'last_bar_at', 'updated_at'])
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from ..config import settings
+from .executor import CoalescedTasks
+
+logger = logging.getLogger(__name__)
+
+# After a Redis error, skip the shared tier for this long instead of paying a connect timeout per request
+REDIS_RETRY_SECONDS = 30
+
+
+class MarketDataCache:
+    """Two-tier cache for upstream market data with single-flight fetches.
+
+    Entries are fresh for `ttl` seconds and may then be served stale for another
+    `stale_ttl` seconds while one background task refreshes them. Values must be
+    JSON-serializable so they can be shared across workers through Redis; the
+    in-process tier is a bounded LRU in front of it.
+    """
+
+    def __init__(self, namespace: str, ttl: float, stale_ttl: float = 0,
+                 max_entries: int = 1024, use_redis: bool = True):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight = CoalescedTasks()
+        self._stats = {"hits": 0, "stale_hits": 0, "redis_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, calling fetch at most once per key at a time.
+
+        fetch returning None is treated as "no data" and is not cached.
+        """
+        entry = self._get_local(key)
+        if entry is None:
+            entry = await self._get_redis(key)
+            if entry is not None:
+                self._set_local(key, *entry)
+                self._stats["redis_hits"] += 1
+
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self._stats["hits"] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                # Serve the stale value now and refresh in the background
+                self._stats["stale_hits"] += 1
+                self._refresh(key, fetch)
+                return value
+
+        if key in self._inflight:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["misses"] += 1
+        return await asyncio.shield(self._refresh(key, fetch))
+
+    async def get_fresh(self, key: str) -> Any:
+        """Return the value for key only if it is within its TTL, without fetching"""
+        return (await self.get_fresh_many([key])).get(key)
+
+    async def get_fresh_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Values within their TTL for the keys that have one, without fetching; one Redis round trip"""
+        entries = {key: self._get_local(key) for key in keys}
+        remote = await self._get_redis_many([key for key, entry in entries.items() if entry is None])
+        for key, entry in remote.items():
+            self._set_local(key, *entry)
+        entries.update(remote)
+
+        now = time.time()
+        fresh = {}
+        for key, entry in entries.items():
+            if entry is None or now - entry[1] >= self.ttl:
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+                fresh[key] = entry[0]
+        return fresh
+
+    async def set(self, key: str, value: Any):
+        """Store a value fetched elsewhere"""
+        await self.set_many({key: value})
+
+    async def set_many(self, values: Dict[str, Any]):
+        """Store values fetched elsewhere, e.g. by a bulk request; None values are skipped"""
+        values = {key: value for key, value in values.items() if value is not None}
+        fetched_at = time.time()
+        for key, value in values.items():
+            self._set_local(key, value, fetched_at)
+        await self._set_redis_many(values, fetched_at)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        served = self._stats["hits"] + self._stats["stale_hits"]
+        lookups = served + self._stats["misses"] + self._stats["coalesced"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_rate": round(served / lookups, 4) if lookups else None,
+        }
+
+    def _refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Start (or join) the single fetch for key"""
+        return self._inflight.run(key, lambda: self._fetch_and_store(key, fetch))
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Fetch failed for {self.namespace}:{key}: {e}")
+            # Keep serving the previous value if there is one
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+        await self.set(key, value)
+        return value
+
+    def _get_local(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _set_local(self, key: str, value: Any, fetched_at: float):
+        self._entries[key] = (value, fetched_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_redis(self, key: str) -> Optional[Tuple[Any, float]]:
+        return (await self._get_redis_many([key])).get(key)
+
+    async def _get_redis_many(self, keys: List[str]) -> Dict[str, Tuple[Any, float]]:
+        """Entries found in Redis, fetched with one MGET"""
+        client = _redis_client() if self.use_redis and keys else None
+        if client is None:
+            return {}
+        try:
+            raws = await client.mget([f"{self.namespace}:{key}" for key in keys])
+        except Exception as e:
+            _redis_failed(e)
+            return {}
+        entries = {}
+        for key, raw in zip(keys, raws):
+            if raw is not None:
+                payload = json.loads(raw)
+                entries[key] = (payload["value"], payload["fetched_at"])
+        return entries
+
+    async def _set_redis_many(self, values: Dict[str, Any], fetched_at: float):
+        """Write entries in one pipelined round trip"""
+        client = _redis_client() if self.use_redis and values else None
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipeline:
+                for key, value in values.items():
+                    pipeline.set(
+                        f"{self.namespace}:{key}",
+                        json.dumps({"value": value, "fetched_at": fetched_at}, default=str),
+                        ex=max(1, int(self.ttl + self.stale_ttl)),
+                    )
+                await pipeline.execute()
+        except Exception as e:
+            _redis_failed(e)
+
+
+_redis = None
+_redis_retry_at = 0.0
+
+
+def _redis_client():
+    """Shared Redis client, or None while Redis is disabled or recently unreachable"""
+    global _redis
+    if not settings.market_cache_redis_enabled or time.time() < _redis_retry_at:
+        return None
+    if _redis is None:
+        _redis = redis.from_url(
+            settings.redis_url,
+            db=settings.redis_db,
+            socket_connect_timeout=settings.market_cache_redis_timeout,
+            socket_timeout=settings.market_cache_redis_timeout,
+        )
+    return _redis
+
+
+def _redis_failed(error: Exception):
+    global _redis_retry_at
+    if time.time() >= _redis_retry_at:
+        logger.warning(f"Redis cache unavailable, using in-process cache only: {error}")
+    _redis_retry_at = time.time() + REDIS_RETRY_SECONDS
+
+
+quote_cache = MarketDataCache(
+    "quote",
+    ttl=settings.quote_cache_ttl,
+    stale_ttl=settings.quote_cache_stale_ttl,
+    max_entries=settings.market_cache_max_entries,
+)
+# Quotes from the bulk download, which has no fundamentals; kept apart so single-symbol quotes never lose them
+bulk_quote_cache = MarketDataCache(
+    "bulk_quote",
+    ttl=settings.quote_cache_ttl,
+    max_entries=settings.market_cache_max_entries,
+)
+price_cache = MarketDataCache(
+    "price",
+    ttl=settings.price_cache_ttl,
+    stale_ttl=settings.price_cache_stale_ttl,
+    max_entries=settings.market_cache_max_entries,
+)
+history_cache = MarketDataCache(
+    "history",
+    ttl=settings.history_cache_ttl,
+    stale_ttl=settings.history_cache_stale_ttl,
+    max_entries=settings.market_cache_max_entries // 4,
+)
+
+overview_cache = MarketDataCache(
+    "overview",
+    ttl=settings.market_overview_refresh_interval * 2,
+    stale_ttl=settings.market_overview_stale_ttl,
+    max_entries=1,
+)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {cache.namespace: cache.stats() for cache in (quote_cache, bulk_quote_cache, price_cache,
+                                                             history_cache, overview_cache)}
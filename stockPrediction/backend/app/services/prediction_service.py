@@ -5,6 +5,7 @@ import random
 
 from ..models.prediction import Prediction, PredictionModel, PredictionAccuracy
 from ..schemas.prediction import PredictionResponse, PredictionModelResponse, PredictionAccuracyResponse
+from .executor import run_db_session
 
 class PredictionService:
     def __init__(self, db: Session):
@@ -67,9 +68,12 @@ class PredictionService:
                 metadata=prediction_data.get("metadata", {})
             )
             
-            self.db.add(prediction)
-            self.db.commit()
-            self.db.refresh(prediction)
+            def persist():
+                self.db.add(prediction)
+                self.db.commit()
+                self.db.refresh(prediction)
+            
+            await run_db_session(persist)
             
             return PredictionResponse.from_orm(prediction)
         except Exception as e:
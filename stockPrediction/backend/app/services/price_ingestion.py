@@ -0,0 +1,189 @@
+import io
+import logging
+import struct
+import time
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+from typing import Any, Dict, List
+
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+# stock_prices columns written by ingestion, in COPY order
+COLUMNS = ("stock_id", "date", "open_price", "high_price", "low_price", "close_price", "volume", "adjusted_close")
+
+DTYPES = {"stock_id": np.int64, "date": "datetime64[ns]"}  # the rest are float64, volume NaN when missing
+
+# Binary COPY field types, matching the staging table below
+COPY_FIELDS = {
+    "stock_id": ">i4",
+    "date": ">i8",  # microseconds since 2000-01-01
+    "open_price": ">f8",
+    "high_price": ">f8",
+    "low_price": ">f8",
+    "close_price": ">f8",
+    "volume": ">i8",
+    "adjusted_close": ">f8",
+}
+COPY_ROW = np.dtype([("fields", ">i2")] + [
+    field for column, type_ in COPY_FIELDS.items() for field in ((f"{column}_length", ">i4"), (column, type_))
+])
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+POSTGRES_EPOCH = np.datetime64("2000-01-01", "us")
+
+STAGING_TABLE = "stock_prices_staging"
+
+# Rows per execute_values page on the fallback path
+VALUES_PAGE_SIZE = 5000
+
+CREATE_STAGING = f"""
+    CREATE TEMP TABLE {STAGING_TABLE} (
+        stock_id integer NOT NULL,
+        date timestamp NOT NULL,
+        open_price double precision NOT NULL,
+        high_price double precision NOT NULL,
+        low_price double precision NOT NULL,
+        close_price double precision NOT NULL,
+        volume bigint,
+        adjusted_close double precision
+    ) ON COMMIT DROP
+"""
+
+# Missing volume and adjusted close are staged as -1 and NaN so every binary
+# row has the same width. Unchanged bars (most of a refresh that re-fetches
+# overlapping days) are not rewritten.
+MERGE_STAGING = f"""
+    INSERT INTO stock_prices ({", ".join(COLUMNS)})
+    SELECT stock_id, date, open_price, high_price, low_price, close_price,
+           NULLIF(volume, -1), NULLIF(adjusted_close, 'NaN'::double precision)
+    FROM {STAGING_TABLE}
+    ON CONFLICT (stock_id, date) DO UPDATE SET
+        open_price = EXCLUDED.open_price,
+        high_price = EXCLUDED.high_price,
+        low_price = EXCLUDED.low_price,
+        close_price = EXCLUDED.close_price,
+        volume = EXCLUDED.volume,
+        adjusted_close = EXCLUDED.adjusted_close
+    WHERE (stock_prices.open_price, stock_prices.high_price, stock_prices.low_price, stock_prices.close_price,
+           stock_prices.volume, stock_prices.adjusted_close)
+        IS DISTINCT FROM (EXCLUDED.open_price, EXCLUDED.high_price, EXCLUDED.low_price, EXCLUDED.close_price,
+                          EXCLUDED.volume, EXCLUDED.adjusted_close)
+"""
+
+
+def frame_bars(stock_id: int, data: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Column arrays in COLUMNS order from a Yahoo Finance history frame; bars without a close are dropped."""
+    data = data.dropna(subset=['Close'])
+    dates = data.index.tz_localize(None) if data.index.tz is not None else data.index
+    adjusted = data['Adj Close'] if 'Adj Close' in data.columns else data['Close']
+    return {
+        "stock_id": np.full(len(data), stock_id, dtype=np.int64),
+        "date": np.asarray(dates, dtype="datetime64[ns]"),
+        "open_price": data['Open'].to_numpy(dtype=np.float64),
+        "high_price": data['High'].to_numpy(dtype=np.float64),
+        "low_price": data['Low'].to_numpy(dtype=np.float64),
+        "close_price": data['Close'].to_numpy(dtype=np.float64),
+        "volume": data['Volume'].to_numpy(dtype=np.float64),
+        "adjusted_close": adjusted.to_numpy(dtype=np.float64),
+    }
+
+
+def concat_bars(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    if not parts:
+        return {column: np.empty(0, dtype=DTYPES.get(column, np.float64)) for column in COLUMNS}
+    return {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+
+
+def deduplicate(bars: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """One bar per (stock_id, date), the last one given winning, sorted by stock and date.
+
+    ON CONFLICT cannot update the same row twice in one statement, so
+    duplicates have to go before the merge.
+    """
+    count = len(bars["stock_id"])
+    if count == 0:
+        return bars
+    dates = bars["date"].view(np.int64)
+    order = np.lexsort((np.arange(count), dates, bars["stock_id"]))
+    stock_ids, dates = bars["stock_id"][order], dates[order]
+    last = np.append((stock_ids[1:] != stock_ids[:-1]) | (dates[1:] != dates[:-1]), True)
+    keep = order[last]
+    return {column: values[keep] for column, values in bars.items()}
+
+
+def _copy_binary(bars: Dict[str, np.ndarray]) -> io.BytesIO:
+    """The bars in PostgreSQL's binary COPY format, packed as one fixed-width structured array."""
+    rows = np.empty(len(bars["stock_id"]), dtype=COPY_ROW)
+    rows["fields"] = len(COPY_FIELDS)
+    for column, type_ in COPY_FIELDS.items():
+        rows[f"{column}_length"] = np.dtype(type_).itemsize
+    rows["stock_id"] = bars["stock_id"]
+    rows["date"] = (bars["date"].astype("datetime64[us]") - POSTGRES_EPOCH).astype(np.int64)
+    for column in ("open_price", "high_price", "low_price", "close_price", "adjusted_close"):
+        rows[column] = bars[column]
+    rows["volume"] = np.where(np.isnan(bars["volume"]), -1, bars["volume"]).astype(np.int64)
+    return io.BytesIO(COPY_HEADER + rows.tobytes() + COPY_TRAILER)
+
+
+def _values(bars: Dict[str, np.ndarray]) -> List[tuple]:
+    volumes = np.where(np.isnan(bars["volume"]), None, bars["volume"]).tolist()
+    adjusted = np.where(np.isnan(bars["adjusted_close"]), None, bars["adjusted_close"]).tolist()
+    return list(zip(
+        bars["stock_id"].tolist(),
+        bars["date"].astype("datetime64[us]").tolist(),
+        bars["open_price"].tolist(),
+        bars["high_price"].tolist(),
+        bars["low_price"].tolist(),
+        bars["close_price"].tolist(),
+        [int(volume) if volume is not None else None for volume in volumes],
+        adjusted
+    ))
+
+
+def ingest_bars(bars: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Upsert bars into stock_prices through a staging table in one transaction; returns a report.
+
+    Bars are streamed into the staging table with binary COPY FROM STDIN, or
+    inserted with execute_values pages if the server rejects COPY, then merged
+    on (stock_id, date). Runs on the database executor.
+    """
+    started = time.perf_counter()
+    received = len(bars["stock_id"])
+    bars = deduplicate(bars)
+    rows = len(bars["stock_id"])
+    report = {"received": received, "duplicates": received - rows, "rows": rows, "written": 0, "method": None}
+    if rows:
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(CREATE_STAGING)
+                cursor.copy_expert(f"COPY {STAGING_TABLE} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT binary)",
+                                   _copy_binary(bars))
+                report["method"] = "copy"
+            except psycopg2.Error as e:
+                logger.warning(f"COPY into {STAGING_TABLE} failed, falling back to execute_values: {e}")
+                connection.rollback()
+                cursor.execute(CREATE_STAGING)
+                execute_values(cursor, f"INSERT INTO {STAGING_TABLE} ({', '.join(COLUMNS)}) VALUES %s",
+                               _values(bars), page_size=VALUES_PAGE_SIZE)
+                report["method"] = "execute_values"
+            cursor.execute(MERGE_STAGING)
+            report["written"] = cursor.rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round(rows / seconds) if seconds > 0 else None
+    logger.info(f"Ingested {rows} price bars ({report['written']} changed) via {report['method']} "
+                f"at {report['rows_per_second']} rows/s")
+    return report
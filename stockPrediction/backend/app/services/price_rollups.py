@@ -0,0 +1,147 @@
+import asyncio
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func
+
+from ..config import settings
+from ..database import SessionLocal, upsert_rows
+from ..models.stock import StockPriceRollup
+from .executor import CoalescedTasks, run_db, run_compute
+from .columnar_cache import columnar_prices, frame_columns
+from .resampling import resample
+
+SOURCE_INTERVAL = "1d"
+
+# Columns an update rewrites on periods that are already stored
+ROLLUP_COLUMNS = ["open_price", "high_price", "low_price", "close_price", "volume", "adjusted_close",
+                  "bar_count", "last_bar_at"]
+
+# stock_id -> update currently running, and the newest daily bar (int ns) the rollups include
+_updating = CoalescedTasks("Price rollup update")
+_rolled_up: Dict[int, int] = {}
+
+
+class PriceRollupStore:
+    """Weekly and monthly bars kept in stock_price_rollups, aggregated from the stored daily bars.
+
+    Only daily bars are stored, so they are the finest source. An update
+    re-aggregates each interval from the start of its newest stored period (the
+    one new daily bars may still extend) and upserts those periods, so its cost
+    depends on the bars since the last update, not on the length of the
+    history. Reads go through the columnar cache like daily bars, so a chart
+    of twenty years of months reads 240 rows.
+    """
+
+    def schedule(self, stock_id: int, symbol: str) -> asyncio.Task:
+        """Update in the background; concurrent requests for the same stock share one run."""
+        return _updating.run(stock_id, lambda: self.update(stock_id, symbol), symbol)
+
+    async def update(self, stock_id: int, symbol: str) -> int:
+        """Aggregate daily bars not yet rolled up into every configured interval; returns rows written."""
+        newest = columnar_prices.last_timestamp(symbol, SOURCE_INTERVAL)
+        if newest is None:
+            return 0
+        intervals = settings.price_rollup_intervals
+        last = await run_db(_last_periods, stock_id, intervals)
+
+        written = 0
+        for interval in intervals:
+            daily = columnar_prices.read(symbol, SOURCE_INTERVAL, start=last.get(interval))
+            rows = await run_compute(_rollup_rows, stock_id, interval, daily)
+            if rows:
+                written += await run_db(upsert_rows, StockPriceRollup, rows, ['stock_id', 'interval', 'date'],
+                                        ROLLUP_COLUMNS)
+            await self.refresh_columns(stock_id, symbol, interval)
+        _rolled_up[stock_id] = int(newest.astype(np.int64))
+        return written
+
+    async def refresh_columns(self, stock_id: int, symbol: str, interval: str) -> int:
+        """Append periods stored since the columnar cache was last written; returns periods appended."""
+        last = columnar_prices.last_timestamp(symbol, interval)
+        since = None if last is None else last.astype("datetime64[us]").astype(datetime)
+        rows = await run_db(_query_rollups_since, stock_id, interval, since)
+        if not rows:
+            return 0
+        return await run_compute(columnar_prices.append, symbol, interval, frame_columns(*zip(*rows)))
+
+    async def get_columns(self, stock_id: int, symbol: str, interval: str, start_date: Optional[datetime] = None,
+                          end_date: Optional[datetime] = None, limit: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Rolled-up bars as column arrays, brought up to date with the daily bars first.
+
+        Timestamps are period starts; ValueError if the interval is not rolled up.
+        """
+        if interval not in settings.price_rollup_intervals:
+            raise ValueError(f"Interval must be {SOURCE_INTERVAL} or one of {', '.join(settings.price_rollup_intervals)}")
+        newest = columnar_prices.last_timestamp(symbol, SOURCE_INTERVAL)
+        if newest is not None and _rolled_up.get(stock_id) != int(newest.astype(np.int64)):
+            await self.schedule(stock_id, symbol)
+        return columnar_prices.read(symbol, interval, start_date, end_date, limit)
+
+def _rollup_rows(stock_id: int, interval: str, daily: Optional[Dict[str, np.ndarray]]) -> List[Dict[str, Any]]:
+    if daily is None or len(daily["timestamp"]) == 0:
+        return []
+    bars = resample(daily, interval)
+    dates = bars["timestamp"].view("datetime64[ns]").astype("datetime64[us]").tolist()
+    last_bars = bars["last_bar_at"].view("datetime64[ns]").astype("datetime64[us]").tolist()
+    volumes = np.where(np.isnan(bars["volume"]), None, bars["volume"]).tolist()
+    adjusted = np.where(np.isnan(bars["adjusted_close"]), None, bars["adjusted_close"]).tolist()
+    return [{
+        "stock_id": stock_id,
+        "interval": interval,
+        "date": date,
+        "open_price": open_price,
+        "high_price": high_price,
+        "low_price": low_price,
+        "close_price": close_price,
+        "volume": int(volume) if volume is not None else None,
+        "adjusted_close": adjusted_close,
+        "bar_count": bar_count,
+        "last_bar_at": last_bar_at
+    } for date, open_price, high_price, low_price, close_price, volume, adjusted_close, bar_count, last_bar_at in zip(
+        dates,
+        bars["open"].tolist(),
+        bars["high"].tolist(),
+        bars["low"].tolist(),
+        bars["close"].tolist(),
+        volumes,
+        adjusted,
+        bars["bar_count"].tolist(),
+        last_bars
+    )]
+
+
+def _last_periods(stock_id: int, intervals: List[str]) -> Dict[str, datetime]:
+    """Start of the newest stored period per interval; intervals without rows are left out."""
+    db = SessionLocal()
+    try:
+        return dict(db.query(StockPriceRollup.interval, func.max(StockPriceRollup.date)).filter(
+            StockPriceRollup.stock_id == stock_id,
+            StockPriceRollup.interval.in_(intervals)
+        ).group_by(StockPriceRollup.interval).all())
+    finally:
+        db.close()
+
+
+def _query_rollups_since(stock_id: int, interval: str, since: Optional[datetime]) -> List[tuple]:
+    """Periods starting on or after `since` (all if None) as tuples in frame_columns order."""
+    db = SessionLocal()
+    try:
+        query = db.query(
+            StockPriceRollup.date,
+            StockPriceRollup.id,
+            StockPriceRollup.open_price,
+            StockPriceRollup.high_price,
+            StockPriceRollup.low_price,
+            StockPriceRollup.close_price,
+            StockPriceRollup.adjusted_close,
+            StockPriceRollup.volume
+        ).filter(StockPriceRollup.stock_id == stock_id, StockPriceRollup.interval == interval)
+        if since is not None:
+            query = query.filter(StockPriceRollup.date >= since)
+        return query.order_by(StockPriceRollup.date).all()
+    finally:
+        db.close()
+
+
+price_rollups = PriceRollupStore()
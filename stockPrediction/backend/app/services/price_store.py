@@ -0,0 +1,267 @@
+import asyncio
+import time
+import uuid
+import yfinance as yf
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import func
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.stock import StockPrice
+from .executor import CoalescedTasks, run_db, run_upstream, run_compute
+from .columnar_cache import columnar_prices, frame_columns
+from .indicator_materializer import indicator_materializer
+from .price_rollups import price_rollups
+from .price_ingestion import frame_bars, concat_bars, ingest_bars
+from ..utils.serialization import price_rows_payload
+
+# stock_id -> time of the last successful sync, and the sync currently running
+_last_synced: Dict[int, float] = {}
+_syncing = CoalescedTasks()
+# stock_id -> time the columnar cache was last caught up with the table
+_columns_checked: Dict[int, float] = {}
+
+# Bulk refreshes run in the background: job id -> job (the newest REFRESH_JOBS_KEPT), and the job
+# running for each set of stocks, so a repeated request joins it instead of starting another
+REFRESH_JOBS_KEPT = 20
+_refresh_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_refreshing = CoalescedTasks()
+_running_refreshes: Dict[Tuple[Tuple[int, str], ...], Dict[str, Any]] = {}
+
+
+class PriceStore:
+    """Daily OHLCV bars kept in stock_prices and backfilled incrementally from Yahoo Finance.
+
+    The first sync for a stock downloads its full history once; later syncs only
+    download bars from the last stored date onwards (re-fetching that day so a
+    partial intraday bar gets completed). Reads are plain indexed range queries.
+    """
+
+    async def sync(self, stock_id: int, symbol: str, force: bool = False) -> int:
+        """Bring a stock's stored bars up to date; returns the number of bars written.
+
+        Syncs are throttled to one per price_sync_interval per stock, and concurrent
+        callers for the same stock share one sync.
+        """
+        if not force and time.time() - _last_synced.get(stock_id, 0) < settings.price_sync_interval:
+            return 0
+        return await asyncio.shield(_syncing.run(stock_id, lambda: self._sync(stock_id, symbol)))
+
+    async def get_columns(self, stock_id: int, symbol: str, start_date: Optional[datetime] = None,
+                          end_date: Optional[datetime] = None, limit: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Stored bars as column arrays (see ColumnarPriceCache.read), oldest first."""
+        if time.time() - _columns_checked.get(stock_id, 0) >= settings.price_sync_interval:
+            await self.refresh_columns(stock_id, symbol)
+        return columnar_prices.read(symbol, "1d", start_date, end_date, limit)
+
+    async def refresh_columns(self, stock_id: int, symbol: str) -> int:
+        """Append bars stored since the columnar cache was last written; returns bars appended."""
+        last = columnar_prices.last_timestamp(symbol, "1d")
+        since = None if last is None else last.astype("datetime64[us]").astype(datetime)
+        rows = await run_db(_query_bars_since, stock_id, since)
+        _columns_checked[stock_id] = time.time()
+        if not rows or (len(rows) == 1 and self._unchanged(symbol, rows[0])):
+            return 0
+        return await run_compute(columnar_prices.append, symbol, "1d", frame_columns(*zip(*rows)))
+
+    def _unchanged(self, symbol: str, row: tuple) -> bool:
+        """True if a (date, id, open, high, low, close, adjusted, volume) row equals the last cached bar."""
+        cached = columnar_prices.read(symbol, "1d", limit=1)
+        if cached is None:
+            return False
+        cached_row = (cached["id"][0], cached["open"][0], cached["high"][0], cached["low"][0],
+                      cached["close"][0], cached["adjusted_close"][0], cached["volume"][0])
+        return all(
+            (value is None and np.isnan(cached_value)) or value == cached_value
+            for value, cached_value in zip(row[1:], cached_row)
+        )
+
+    async def get_history(self, stock_id: int, symbol: str, start_date: Optional[datetime] = None,
+                          end_date: Optional[datetime] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Stored bars in a date range as StockPriceResponse-shaped dicts, oldest first."""
+        columns = await self.get_columns(stock_id, symbol, start_date, end_date, limit)
+        return price_rows_payload(columns, stock_id)
+
+    async def sync_many(self, stocks: List[Tuple[int, str]]) -> Dict[str, Any]:
+        """Bring many stocks up to date with bulk downloads and one COPY per chunk; returns a report.
+
+        Stocks with stored bars are downloaded from the oldest of their last stored
+        dates, and only each stock's bars from its own last date onwards are kept;
+        stocks without bars get their full history. Meant for a nightly
+        full-universe refresh, where per-stock syncs would cost one round trip each.
+        """
+        last_dates = await run_db(_last_stored_dates, [stock_id for stock_id, _ in stocks])
+        report = {"symbols": len(stocks), "failed": [], "received": 0, "duplicates": 0, "rows": 0, "written": 0,
+                  "download_seconds": 0.0, "ingest_seconds": 0.0}
+        size = settings.price_refresh_chunk_size
+        for chunk in (stocks[start:start + size] for start in range(0, len(stocks), size)):
+            stored = [stock for stock in chunk if stock[0] in last_dates]
+            new = [stock for stock in chunk if stock[0] not in last_dates]
+            groups = [(new, {"period": "max"})]
+            if stored:
+                groups.append((stored, {"start": min(last_dates[stock_id] for stock_id, _ in stored).date()}))
+            for group, window in groups:
+                if group:
+                    await self._sync_group(group, window, last_dates, report)
+
+        report["rows_per_second"] = round(report["rows"] / report["ingest_seconds"]) if report["ingest_seconds"] else None
+        report["download_seconds"] = round(report["download_seconds"], 3)
+        report["ingest_seconds"] = round(report["ingest_seconds"], 3)
+        return report
+
+    def start_refresh(self, stocks: List[Tuple[int, str]]) -> Dict[str, Any]:
+        """Run sync_many in the background and return its job; see get_refresh.
+
+        A refresh can outlive any HTTP timeout, so callers poll the job for its
+        report. Asking again for the same stocks while they refresh returns the
+        running job.
+        """
+        key = tuple(sorted(stocks))
+        job = _running_refreshes.get(key)
+        if job is None:
+            job = {"id": uuid.uuid4().hex[:12], "status": "running", "symbols": len(stocks),
+                   "started_at": datetime.utcnow(), "finished_at": None, "report": None, "error": None}
+            _refresh_jobs[job["id"]] = job
+            while len(_refresh_jobs) > REFRESH_JOBS_KEPT:
+                _refresh_jobs.popitem(last=False)
+            _running_refreshes[key] = job
+            _refreshing.run(key, lambda: self._refresh(key, job, stocks))
+        return job
+
+    def get_refresh(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A refresh job: its status ("running", "completed" or "failed"), report or error; None if unknown."""
+        return _refresh_jobs.get(job_id)
+
+    async def _refresh(self, key: Tuple[Tuple[int, str], ...], job: Dict[str, Any], stocks: List[Tuple[int, str]]):
+        try:
+            job["report"] = await self.sync_many(stocks)
+            job["status"] = "completed"
+        except Exception as e:
+            print(f"Error refreshing prices for {len(stocks)} stocks: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = datetime.utcnow()
+            _running_refreshes.pop(key, None)
+
+    async def _sync_group(self, group: List[Tuple[int, str]], window: Dict[str, Any],
+                          last_dates: Dict[int, datetime], report: Dict[str, Any]):
+        started = time.time()
+        symbols = [symbol for _, symbol in group]
+        try:
+            data = await run_upstream(lambda: yf.download(
+                symbols,
+                interval="1d",
+                group_by="ticker",
+                auto_adjust=False,
+                threads=True,
+                progress=False,
+                **window
+            ), timeout=settings.price_refresh_timeout)
+        except Exception as e:
+            print(f"Error downloading prices for {len(symbols)} symbols: {e}")
+            report["failed"].extend(symbols)
+            return
+        finally:
+            report["download_seconds"] += time.time() - started
+
+        parts, synced = [], []
+        for stock_id, symbol in group:
+            if isinstance(data.columns, pd.MultiIndex):
+                frame = data[symbol] if symbol in data.columns.get_level_values(0) else None
+            else:
+                frame = data
+            bars = frame_bars(stock_id, frame) if frame is not None and not frame.empty else None
+            if bars is None or len(bars["date"]) == 0:
+                report["failed"].append(symbol)
+                continue
+            if stock_id in last_dates:
+                keep = bars["date"] >= np.datetime64(last_dates[stock_id], "ns")
+                bars = {column: values[keep] for column, values in bars.items()}
+            parts.append(bars)
+            synced.append((stock_id, symbol))
+
+        try:
+            ingested = await run_db(ingest_bars, concat_bars(parts), timeout=settings.price_refresh_timeout)
+        except Exception as e:
+            print(f"Error ingesting prices for {len(synced)} symbols: {e}")
+            report["failed"].extend(symbol for _, symbol in synced)
+            return
+        for key in ("received", "duplicates", "rows", "written"):
+            report[key] += ingested[key]
+        report["ingest_seconds"] += ingested["seconds"]
+
+        await asyncio.gather(*(self.refresh_columns(stock_id, symbol) for stock_id, symbol in synced))
+        now = time.time()
+        for stock_id, symbol in synced:
+            indicator_materializer.schedule(stock_id, symbol)
+            price_rollups.schedule(stock_id, symbol)
+            _last_synced[stock_id] = now
+
+    async def _sync(self, stock_id: int, symbol: str) -> int:
+        last_date = await run_db(_last_stored_date, stock_id)
+        if last_date is None:
+            data = await run_upstream(lambda: yf.Ticker(symbol).history(period="max", auto_adjust=False))
+        else:
+            data = await run_upstream(lambda: yf.Ticker(symbol).history(start=last_date.date(), auto_adjust=False))
+
+        written = 0
+        if not data.empty:
+            written = await run_db(_upsert_bars, stock_id, data)
+            await self.refresh_columns(stock_id, symbol)
+            indicator_materializer.schedule(stock_id, symbol)
+            price_rollups.schedule(stock_id, symbol)
+        _last_synced[stock_id] = time.time()
+        return written
+
+
+# The helpers below run on the database executor with their own session, so a
+# shared sync never depends on the session of the request that started it.
+
+def _last_stored_date(stock_id: int) -> Optional[datetime]:
+    db = SessionLocal()
+    try:
+        return db.query(func.max(StockPrice.date)).filter(StockPrice.stock_id == stock_id).scalar()
+    finally:
+        db.close()
+
+
+def _last_stored_dates(stock_ids: List[int]) -> Dict[int, datetime]:
+    """Newest stored bar date per stock; stocks without bars are left out."""
+    db = SessionLocal()
+    try:
+        return dict(db.query(StockPrice.stock_id, func.max(StockPrice.date)).filter(
+            StockPrice.stock_id.in_(stock_ids)
+        ).group_by(StockPrice.stock_id).all())
+    finally:
+        db.close()
+
+
+def _query_bars_since(stock_id: int, since: Optional[datetime]) -> List[tuple]:
+    """Bars on or after `since` (all bars if None) as tuples in frame_columns order."""
+    db = SessionLocal()
+    try:
+        query = db.query(
+            StockPrice.date,
+            StockPrice.id,
+            StockPrice.open_price,
+            StockPrice.high_price,
+            StockPrice.low_price,
+            StockPrice.close_price,
+            StockPrice.adjusted_close,
+            StockPrice.volume
+        ).filter(StockPrice.stock_id == stock_id)
+        if since is not None:
+            query = query.filter(StockPrice.date >= since)
+        return query.order_by(StockPrice.date).all()
+    finally:
+        db.close()
+
+
+def _upsert_bars(stock_id: int, data: pd.DataFrame) -> int:
+    """Write bars through the COPY pipeline, overwriting any bar already stored for the same day."""
+    return ingest_bars(frame_bars(stock_id, data))["rows"]
@@ -0,0 +1,73 @@
+import numpy as np
+from typing import Dict
+
+# Resampling of OHLCV columns (as read from the columnar cache, int64 ns
+# timestamps, oldest first) into coarser bars. Each output bar is labelled
+# with the start of its period in UTC; weeks start on Monday.
+
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+
+# Fixed-width intervals in nanoseconds; weeks and months are calendar periods
+FIXED_INTERVALS = {
+    "5m": 5 * NS_PER_MINUTE,
+    "15m": 15 * NS_PER_MINUTE,
+    "1h": 60 * NS_PER_MINUTE,
+    "1d": NS_PER_DAY,
+}
+INTERVALS = (*FIXED_INTERVALS, "1wk", "1mo")
+
+
+def period_starts(timestamps: np.ndarray, interval: str) -> np.ndarray:
+    """Start of the period each timestamp falls in, as int64 ns."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if interval in FIXED_INTERVALS:
+        width = FIXED_INTERVALS[interval]
+        return timestamps - timestamps % width
+    if interval == "1wk":
+        # Day 0 (1970-01-01) was a Thursday, three days after a Monday
+        days = timestamps // NS_PER_DAY
+        return (days - (days + 3) % 7) * NS_PER_DAY
+    if interval == "1mo":
+        return timestamps.view("datetime64[ns]").astype("datetime64[M]").astype("datetime64[ns]").view(np.int64)
+    raise ValueError(f"Unknown interval: {interval}. Available: {', '.join(INTERVALS)}")
+
+
+def is_coarser(interval: str, than: str) -> bool:
+    return INTERVALS.index(interval) > INTERVALS.index(than)
+
+
+def resample(columns: Dict[str, np.ndarray], interval: str) -> Dict[str, np.ndarray]:
+    """Aggregate bars into `interval` periods: first open, highest high, lowest low, last close, summed volume.
+
+    Periods come from np.*.reduceat over the run boundaries, so the cost is a
+    few passes over the input whatever the number of periods. Alongside the
+    OHLCV columns the result has "bar_count" and "last_bar_at" (timestamp of
+    the newest input bar) per period; the newest period may still be incomplete.
+    """
+    timestamps = np.asarray(columns["timestamp"], dtype=np.int64)
+    if len(timestamps) == 0:
+        empty = np.empty(0)
+        return {"timestamp": np.empty(0, dtype=np.int64), "open": empty, "high": empty, "low": empty,
+                "close": empty, "adjusted_close": empty, "volume": empty,
+                "bar_count": np.empty(0, dtype=np.int64), "last_bar_at": np.empty(0, dtype=np.int64)}
+
+    periods = period_starts(timestamps, interval)
+    starts = np.flatnonzero(np.diff(periods, prepend=periods[0] - 1))
+    ends = np.append(starts[1:], len(timestamps)) - 1
+
+    volume = np.asarray(columns["volume"], dtype=np.float64)
+    reported = ~np.isnan(volume)
+    volumes = np.add.reduceat(np.where(reported, volume, 0.0), starts)
+    return {
+        "timestamp": periods[starts],
+        "open": np.asarray(columns["open"], dtype=np.float64)[starts],
+        "high": np.maximum.reduceat(np.asarray(columns["high"], dtype=np.float64), starts),
+        "low": np.minimum.reduceat(np.asarray(columns["low"], dtype=np.float64), starts),
+        "close": np.asarray(columns["close"], dtype=np.float64)[ends],
+        "adjusted_close": np.asarray(columns["adjusted_close"], dtype=np.float64)[ends],
+        # Missing only if no bar in the period reported a volume
+        "volume": np.where(np.add.reduceat(reported, starts) > 0, volumes, np.nan),
+        "bar_count": ends - starts + 1,
+        "last_bar_at": timestamps[ends],
+    }
@@ -0,0 +1,289 @@
+import re
+import numpy as np
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from .executor import run_compute
+from . import indicator_engine as engine
+from . import indicator_registry
+from .batch_indicators import MATRIX_FIELDS, align_columns, load_universe
+
+# Screening conditions are small boolean expressions over price fields and
+# indicator series, e.g.
+#
+#     rsi < 30 and close > sma_200 and volume > 2 * sma(volume, 20)
+#
+# Identifiers are price fields (open, high, low, close, volume) or indicator
+# series keys as returned by the series endpoint (rsi_21, macd_signal,
+# bollinger_bands_lower, ...). Functions apply a rolling window along the date
+# axis. Expressions compile to closures over symbols x dates matrices, and a
+# condition is evaluated on the last date.
+
+TOKEN = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?)|([A-Za-z_][A-Za-z0-9_]*)|(<=|>=|==|!=|[-+*/<>(),]))")
+
+COMPARISONS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+ARITHMETIC = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+
+
+def _shift(values: np.ndarray, periods: int) -> np.ndarray:
+    result = np.full(values.shape, np.nan)
+    if periods < values.shape[-1]:
+        result[..., periods:] = values[..., :values.shape[-1] - periods]
+    return result
+
+
+# name -> (function of (matrix, window), default window); the window is also the lookback it needs
+FUNCTIONS: Dict[str, Tuple[Callable[[np.ndarray, int], np.ndarray], Optional[int]]] = {
+    "sma": (engine.sma, None),
+    "ema": (engine.ema, None),
+    "std": (engine.rolling_std, None),
+    "highest": (engine.rolling_max, None),
+    "lowest": (engine.rolling_min, None),
+    "prev": (_shift, 1),
+    "change": (lambda values, periods: values - _shift(values, periods), 1),
+    "pct_change": (lambda values, periods: 100 * (values / _shift(values, periods) - 1), 1),
+    "abs": (lambda values, _: np.abs(values), 0),
+}
+
+
+class Expression:
+    """A compiled expression: evaluate(graph) returns a symbols x dates matrix.
+
+    `identifiers` lists the fields and indicator series it reads and `lookback`
+    the bars it needs before the evaluated date.
+    """
+
+    def __init__(self, evaluate: Callable[["indicator_registry.IndicatorGraph"], np.ndarray],
+                 identifiers: List[str], lookback: int):
+        self.evaluate = evaluate
+        self.identifiers = identifiers
+        self.lookback = lookback
+
+
+class _Parser:
+    """Recursive descent over: or > and > not > comparison > + - > * / > unary minus > atom."""
+
+    def __init__(self, text: str):
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    def parse(self) -> Expression:
+        expression = self._or()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}'")
+        return expression
+
+    def _tokenize(self, text: str) -> List[str]:
+        tokens, pos = [], 0
+        text = text.strip()
+        while pos < len(text):
+            match = TOKEN.match(text, pos)
+            if match is None or match.end() == pos:
+                raise ValueError(f"Cannot parse expression at '{text[pos:pos + 10]}'")
+            tokens.append(match.group(match.lastindex))
+            pos = match.end()
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self, expected: Optional[str] = None) -> str:
+        token = self._peek()
+        if token is None or (expected is not None and token.lower() != expected):
+            raise ValueError(f"Expected '{expected}'" if expected else "Unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def _or(self) -> Expression:
+        return self._boolean("or", self._and, np.logical_or)
+
+    def _and(self) -> Expression:
+        return self._boolean("and", self._not, np.logical_and)
+
+    def _boolean(self, keyword: str, operand: Callable[[], Expression], combine) -> Expression:
+        left = operand()
+        while (self._peek() or "").lower() == keyword:
+            self._take()
+            right = operand()
+            left = _combine(combine, left, right)
+        return left
+
+    def _not(self) -> Expression:
+        if (self._peek() or "").lower() == "not":
+            self._take()
+            inner = self._not()
+            return Expression(lambda graph: np.logical_not(inner.evaluate(graph)), inner.identifiers, inner.lookback)
+        return self._comparison()
+
+    def _comparison(self) -> Expression:
+        left = self._sum()
+        if self._peek() in COMPARISONS:
+            operator = COMPARISONS[self._take()]
+            # NaN compares as False, so symbols without enough history never match
+            return _combine(operator, left, self._sum())
+        return left
+
+    def _sum(self) -> Expression:
+        return self._arithmetic(("+", "-"), self._product)
+
+    def _product(self) -> Expression:
+        return self._arithmetic(("*", "/"), self._unary)
+
+    def _arithmetic(self, operators: Tuple[str, ...], operand: Callable[[], Expression]) -> Expression:
+        left = operand()
+        while self._peek() in operators:
+            operator = ARITHMETIC[self._take()]
+            right = operand()
+            left = _combine(operator, left, right)
+        return left
+
+    def _unary(self) -> Expression:
+        if self._peek() == "-":
+            self._take()
+            inner = self._unary()
+            return Expression(lambda graph: np.negative(inner.evaluate(graph)), inner.identifiers, inner.lookback)
+        return self._atom()
+
+    def _atom(self) -> Expression:
+        token = self._take()
+        if token == "(":
+            inner = self._or()
+            self._take(")")
+            return inner
+        if token[0].isdigit():
+            value = float(token)
+            return Expression(lambda graph: np.float64(value), [], 0)
+        if not (token[0].isalpha() or token[0] == "_"):
+            raise ValueError(f"Unexpected '{token}'")
+        if self._peek() == "(":
+            return self._call(token.lower())
+        return _identifier(token.lower())
+
+    def _call(self, name: str) -> Expression:
+        if name not in FUNCTIONS:
+            raise ValueError(f"Unknown function: {name}")
+        function, default = FUNCTIONS[name]
+        self._take("(")
+        argument = self._or()
+        window = default
+        if self._peek() == ",":
+            self._take(",")
+            token = self._take()
+            if not token.isdigit() or int(token) < 1:
+                raise ValueError(f"{name}() window must be a positive integer")
+            window = int(token)
+        self._take(")")
+        if window is None:
+            raise ValueError(f"{name}() needs a window, e.g. {name}(close, 20)")
+        return Expression(lambda graph: function(np.asarray(argument.evaluate(graph), dtype=np.float64), window),
+                          argument.identifiers, argument.lookback + window)
+
+
+def _combine(operator, left: Expression, right: Expression) -> Expression:
+    def evaluate(graph):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return operator(left.evaluate(graph), right.evaluate(graph))
+    return Expression(evaluate, left.identifiers + right.identifiers, max(left.lookback, right.lookback))
+
+
+def _identifier(name: str) -> Expression:
+    """A price field or an indicator series key, resolved to a node of the shared indicator graph."""
+    if name in MATRIX_FIELDS:
+        return Expression(lambda graph: np.asarray(graph.columns[name], dtype=np.float64), [name], 0)
+    indicator = _indicator_for(name)
+    lookback = indicator_registry.warmup_bars([indicator])
+    return Expression(lambda graph: graph.series([indicator])[name], [name], lookback)
+
+
+def _indicator_for(key: str) -> str:
+    """Indicator name whose outputs include series `key` ('macd_signal' -> 'macd')."""
+    for name in [key] + [key[:-len(suffix)] for definition in indicator_registry.INDICATORS.values()
+                         for suffix in definition.outputs.values() if suffix and key.endswith(suffix)]:
+        if indicator_registry.is_supported(name):
+            definition, _ = indicator_registry.resolve(name)
+            if any(f"{name}{suffix}" == key for suffix in definition.outputs.values()):
+                return name
+    raise ValueError(f"Unknown field: {key}")
+
+
+def compile_expression(text: str) -> Expression:
+    """Parse and compile an expression; ValueError describes what is wrong with it."""
+    if not text or not text.strip():
+        raise ValueError("Empty expression")
+    return _Parser(text).parse()
+
+
+def screen(columns: Dict[str, Dict[str, np.ndarray]], condition: Expression, rank_by: Optional[Expression] = None,
+           descending: bool = True, limit: int = 50) -> Dict[str, Any]:
+    """Symbols whose condition holds on the last date, ranked by `rank_by` (NaN ranks last)."""
+    if not columns:
+        return {"date": None, "evaluated": 0, "matched": 0, "matches": []}
+    symbols, timestamps, matrices, first, last = align_columns(columns)
+    graph = indicator_registry.IndicatorGraph(matrices)
+
+    # Symbols with less real history than the expressions need, or without a bar on the last date, are left out
+    lookback = max(condition.lookback, rank_by.lookback if rank_by else 0)
+    enough = ((len(timestamps) - first) > lookback) & (last == len(timestamps) - 1)
+    evaluated = condition.evaluate(graph)
+    if np.asarray(evaluated).dtype != bool:
+        raise ValueError("Condition must be a comparison, e.g. close > sma_50")
+    matched = np.broadcast_to(evaluated, matrices["close"].shape)[:, -1] & enough
+    rows = np.flatnonzero(matched)
+
+    if rank_by is not None and len(rows):
+        scores = np.broadcast_to(rank_by.evaluate(graph), matrices["close"].shape)[rows, -1].astype(np.float64)
+        keys = np.where(np.isnan(scores), np.inf, -scores if descending else scores)
+        order = np.argsort(keys, kind="stable")
+        rows, scores = rows[order], scores[order]
+    else:
+        scores = np.full(len(rows), np.nan)
+    rows, scores = rows[:limit], scores[:limit]
+
+    # Report the value of every identifier the expressions read, for the returned rows only
+    identifiers = list(dict.fromkeys(condition.identifiers + (rank_by.identifiers if rank_by else [])))
+    values = {}
+    for identifier in identifiers:
+        column = _identifier(identifier).evaluate(graph)[rows, -1]
+        values[identifier] = np.where(np.isnan(column), None, column).tolist()
+
+    return {
+        "date": np.datetime64(int(timestamps[-1]), "ns").astype("datetime64[us]").astype(datetime),
+        "evaluated": int(enough.sum()),
+        "matched": int(matched.sum()),
+        "matches": [{
+            "symbol": symbols[row],
+            "rank_value": None if np.isnan(score) else float(score),
+            "values": {identifier: values[identifier][i] for identifier in identifiers}
+        } for i, (row, score) in enumerate(zip(rows.tolist(), scores.tolist()))]
+    }
+
+
+class ScreenerService:
+    """Screens a universe of stocks with a condition expression over cross-sectional matrices."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def screen(self, condition: str, symbols: Optional[List[str]] = None, rank_by: Optional[str] = None,
+                     descending: bool = True, limit: int = 50, end_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """Ranked matches plus evaluation counts; invalid expressions raise ValueError.
+
+        Prices are read from the columnar cache as the background syncs left it,
+        so screening thousands of symbols does not check each one's freshness.
+        """
+        compiled = compile_expression(condition)
+        ranking = compile_expression(rank_by) if rank_by else None
+        lookback = max(compiled.lookback, ranking.lookback if ranking else 0)
+
+        columns, missing = await load_universe(self.db, symbols, end_date, lookback + 1, refresh=False)
+        result = await run_compute(screen, columns, compiled, ranking, descending, limit)
+        result["missing"] = missing
+        return result
@@ -1,12 +1,121 @@
+import asyncio
 import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, desc
 
+from ..config import settings
 from ..models.stock import Stock, StockPrice, StockIndicator
-from ..schemas.stock import StockResponse, StockPriceResponse, StockQuote, MarketOverview
+from ..schemas.stock import StockResponse, StockPriceResponse, StockQuote, MarketOverview, BatchQuoteResponse
+from .market_data_cache import quote_cache, bulk_quote_cache, price_cache, history_cache, overview_cache
+from .executor import run_db_session, run_upstream
+from .price_store import PriceStore
+from .price_rollups import price_rollups
+
+# Index symbol -> MarketOverview field
+MARKET_INDICES = {
+    '^GSPC': 'sp500',
+    '^IXIC': 'nasdaq',
+    '^DJI': 'dow',
+    '^VIX': 'vix'
+}
+OVERVIEW_KEY = "snapshot"
+
+
+async def fetch_bulk_quotes(symbols: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Fetch the last two daily bars for all symbols in one request and derive quotes from them.
+
+    Returns (quotes, errors) keyed by symbol. Bulk downloads carry no fundamentals,
+    so market cap, 52-week range, P/E and dividend yield are left unset.
+    """
+    data = await run_upstream(lambda: yf.download(
+        symbols,
+        period="5d",
+        interval="1d",
+        group_by="ticker",
+        auto_adjust=False,
+        threads=True,
+        progress=False
+    ))
+
+    quotes, errors = {}, {}
+    now = datetime.utcnow()
+    for symbol in symbols:
+        if isinstance(data.columns, pd.MultiIndex):
+            if symbol not in data.columns.get_level_values(0):
+                errors[symbol] = "No data returned"
+                continue
+            frame = data[symbol]
+        else:
+            frame = data
+        frame = frame.dropna(subset=['Close'])
+        if frame.empty:
+            errors[symbol] = "No data returned"
+            continue
+
+        current_price = float(frame['Close'].iloc[-1])
+        previous_close = float(frame['Close'].iloc[-2]) if len(frame) > 1 else current_price
+        change = current_price - previous_close
+        volume = frame['Volume'].iloc[-1]
+        quotes[symbol] = StockQuote(
+            symbol=symbol,
+            price=current_price,
+            change=change,
+            change_percent=(change / previous_close) * 100 if previous_close > 0 else 0,
+            volume=int(volume) if pd.notna(volume) else 0,
+            last_updated=now
+        ).model_dump(mode="json")
+    return quotes, errors
+
+
+async def fetch_market_overview() -> Optional[Dict[str, Any]]:
+    """Fetch all market indices in one bulk request as a cacheable snapshot."""
+    quotes, errors = await fetch_bulk_quotes(list(MARKET_INDICES))
+    for symbol, error in errors.items():
+        print(f"Error fetching {symbol}: {error}")
+    if not quotes:
+        return None
+    
+    snapshot = {field: quotes.get(symbol) for symbol, field in MARKET_INDICES.items()}
+    snapshot["as_of"] = datetime.utcnow().isoformat()
+    return snapshot
+
+
+class MarketOverviewRefresher:
+    """Refreshes the market overview snapshot on a fixed cadence so requests only read it."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                snapshot = await fetch_market_overview()
+                await overview_cache.set(OVERVIEW_KEY, snapshot)
+            except Exception as e:
+                print(f"Error refreshing market overview: {e}")
+            await asyncio.sleep(self.interval)
+
+
+market_overview_refresher = MarketOverviewRefresher(settings.market_overview_refresh_interval)
+
 
 class StockService:
     def __init__(self, db: Session):
@@ -14,20 +123,20 @@ class StockService:
 
     async def search_stocks(self, query: str, limit: int = 10) -> List[StockResponse]:
         """Search for stocks by symbol or name."""
-        stocks = self.db.query(Stock).filter(
+        stocks = await run_db_session(lambda: self.db.query(Stock).filter(
             and_(
                 Stock.is_active == True,
                 (Stock.symbol.ilike(f"%{query}%") | Stock.name.ilike(f"%{query}%"))
             )
-        ).limit(limit).all()
+        ).limit(limit).all())
         
         return [StockResponse.from_orm(stock) for stock in stocks]
 
     async def get_stock_by_symbol(self, symbol: str) -> Optional[StockResponse]:
         """Get stock by symbol."""
-        stock = self.db.query(Stock).filter(
+        stock = await run_db_session(lambda: self.db.query(Stock).filter(
             and_(Stock.symbol == symbol.upper(), Stock.is_active == True)
-        ).first()
+        ).first())
         
         if not stock:
             return None
@@ -38,31 +147,18 @@ class StockService:
         """Get stock price data."""
         try:
             # Get stock from database
-            stock = self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first()
+            stock = await run_db_session(lambda: self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first())
             if not stock:
                 return None
 
-            # Fetch data from Yahoo Finance
-            ticker = yf.Ticker(symbol)
-            data = ticker.history(period=period, interval=interval)
-            
-            if data.empty:
+            latest = await price_cache.get_or_fetch(
+                f"{symbol.upper()}:{period}:{interval}",
+                lambda: self._fetch_latest_bar(symbol.upper(), period, interval)
+            )
+            if not latest:
                 return None
 
-            # Get latest price
-            latest = data.iloc[-1]
-            
-            return StockPriceResponse(
-                id=0,  # Will be set when saved to database
-                stock_id=stock.id,
-                date=latest.name,
-                open_price=float(latest['Open']),
-                high_price=float(latest['High']),
-                low_price=float(latest['Low']),
-                close_price=float(latest['Close']),
-                volume=int(latest['Volume']),
-                adjusted_close=float(latest['Close'])  # Simplified
-            )
+            return StockPriceResponse(id=0, stock_id=stock.id, **latest)  # id is set when saved to database
         except Exception as e:
             print(f"Error fetching stock price for {symbol}: {e}")
             return None
@@ -71,78 +167,160 @@ class StockService:
                               end_date: Optional[datetime] = None, limit: int = 100) -> List[StockPriceResponse]:
         """Get historical stock data."""
         try:
-            stock = self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first()
+            stock = await run_db_session(lambda: self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first())
             if not stock:
                 return []
 
-            # Fetch from Yahoo Finance
-            ticker = yf.Ticker(symbol)
-            data = ticker.history(
-                start=start_date,
-                end=end_date,
-                period="max" if not start_date and not end_date else None
+            bars = await history_cache.get_or_fetch(
+                f"{symbol.upper()}:{start_date}:{end_date}:{limit}",
+                lambda: self._load_history(stock.id, symbol.upper(), start_date, end_date, limit)
             )
-            
-            if data.empty:
+            if not bars:
                 return []
 
-            # Convert to response format
-            history = []
-            for date, row in data.tail(limit).iterrows():
-                history.append(StockPriceResponse(
-                    id=0,
-                    stock_id=stock.id,
-                    date=date,
-                    open_price=float(row['Open']),
-                    high_price=float(row['High']),
-                    low_price=float(row['Low']),
-                    close_price=float(row['Close']),
-                    volume=int(row['Volume']),
-                    adjusted_close=float(row['Close'])
-                ))
-            
-            return history
+            return [StockPriceResponse(**bar) for bar in bars]
         except Exception as e:
             print(f"Error fetching stock history for {symbol}: {e}")
             return []
 
+    async def get_stock_history_columns(self, symbol: str, start_date: Optional[datetime] = None,
+                                        end_date: Optional[datetime] = None, limit: int = 100,
+                                        interval: str = "1d") -> Optional[Tuple[int, Optional[Dict[str, np.ndarray]]]]:
+        """Get historical stock data as column arrays for vectorized serialization.
+
+        Intervals other than 1d are read from the weekly/monthly rollups.
+        Returns (stock_id, columns), or None if the stock is unknown.
+        """
+        stock = await run_db_session(lambda: self.db.query(Stock).filter(Stock.symbol == symbol.upper()).first())
+        if not stock:
+            return None
+
+        store = PriceStore()
+        await self._backfill(store, stock.id, symbol.upper())
+        if interval != "1d":
+            # Catch the daily columns up first so the rollups see the newest bars
+            await store.get_columns(stock.id, symbol.upper(), limit=1)
+            return stock.id, await price_rollups.get_columns(stock.id, symbol.upper(), interval, start_date, end_date, limit)
+        return stock.id, await store.get_columns(stock.id, symbol.upper(), start_date, end_date, limit)
+
+    async def refresh_prices(self, symbols: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Start a background bulk refresh of stored daily bars for the given symbols (every active stock if None).
+
+        Returns the refresh job; its report is filled in when the refresh finishes.
+        """
+        if symbols is None:
+            stocks = await run_db_session(lambda: self.db.query(Stock.id, Stock.symbol).filter(Stock.is_active == True).all())
+        else:
+            wanted = sorted({symbol.strip().upper() for symbol in symbols if symbol.strip()})
+            stocks = await run_db_session(lambda: self.db.query(Stock.id, Stock.symbol).filter(Stock.symbol.in_(wanted)).all())
+        return PriceStore().start_refresh([(stock_id, symbol) for stock_id, symbol in stocks])
+
+    def get_price_refresh(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A refresh job started by refresh_prices, or None if unknown or expired."""
+        return PriceStore().get_refresh(job_id)
+
     async def get_real_time_quote(self, symbol: str) -> Optional[StockQuote]:
         """Get real-time stock quote."""
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            
-            if not info or 'currentPrice' not in info:
-                return None
-
-            # Calculate change
-            current_price = info.get('currentPrice', 0)
-            previous_close = info.get('previousClose', current_price)
-            change = current_price - previous_close
-            change_percent = (change / previous_close) * 100 if previous_close > 0 else 0
-
-            return StockQuote(
-                symbol=symbol.upper(),
-                price=current_price,
-                change=change,
-                change_percent=change_percent,
-                volume=info.get('volume', 0),
-                market_cap=info.get('marketCap'),
-                high_52_week=info.get('fiftyTwoWeekHigh'),
-                low_52_week=info.get('fiftyTwoWeekLow'),
-                pe_ratio=info.get('trailingPE'),
-                dividend_yield=info.get('dividendYield'),
-                last_updated=datetime.utcnow()
-            )
+            quote = await quote_cache.get_or_fetch(symbol.upper(), lambda: self._fetch_quote(symbol.upper()))
+            return StockQuote(**quote) if quote else None
         except Exception as e:
             print(f"Error fetching quote for {symbol}: {e}")
             return None
 
+    async def get_batch_quotes(self, symbols: List[str]) -> BatchQuoteResponse:
+        """Get quotes for many symbols, fetching every uncached one in a single bulk download.
+
+        Bulk quotes carry no fundamentals, so they are cached apart from the single-symbol quotes.
+        """
+        symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+        quotes = await bulk_quote_cache.get_fresh_many(symbols)
+        cached_count = len(quotes)
+
+        errors = {}
+        missing = [symbol for symbol in symbols if symbol not in quotes]
+        if missing:
+            try:
+                fetched, errors = await fetch_bulk_quotes(missing)
+            except Exception as e:
+                print(f"Error fetching bulk quotes for {', '.join(missing)}: {e}")
+                fetched, errors = {}, {symbol: f"Upstream error: {e}" for symbol in missing}
+            await bulk_quote_cache.set_many(fetched)
+            quotes.update(fetched)
+
+        return BatchQuoteResponse(
+            quotes={symbol: StockQuote(**quotes[symbol]) for symbol in symbols if symbol in quotes},
+            errors=errors,
+            cached=cached_count,
+            timestamp=datetime.utcnow()
+        )
+
+    async def _fetch_latest_bar(self, symbol: str, period: str, interval: str) -> Optional[Dict[str, Any]]:
+        """Fetch the most recent bar from Yahoo Finance as a cacheable dict."""
+        data = await run_upstream(lambda: yf.Ticker(symbol).history(period=period, interval=interval))
+        
+        if data.empty:
+            return None
+
+        return self._bar_to_dict(data.index[-1], data.iloc[-1])
+
+    async def _load_history(self, stock_id: int, symbol: str, start_date: Optional[datetime],
+                            end_date: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        """Backfill any new bars into the local store, then read the range from it."""
+        store = PriceStore()
+        await self._backfill(store, stock_id, symbol)
+        return await store.get_history(stock_id, symbol, start_date, end_date, limit)
+
+    async def _backfill(self, store: PriceStore, stock_id: int, symbol: str):
+        try:
+            await store.sync(stock_id, symbol)
+        except Exception as e:
+            # Serve whatever is stored; the next request retries the backfill
+            print(f"Error backfilling history for {symbol}: {e}")
+
+    async def _fetch_quote(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch a quote from Yahoo Finance as a cacheable dict."""
+        info = await run_upstream(lambda: yf.Ticker(symbol).info)
+        
+        if not info or 'currentPrice' not in info:
+            return None
+
+        # Calculate change
+        current_price = info.get('currentPrice', 0)
+        previous_close = info.get('previousClose', current_price)
+        change = current_price - previous_close
+        change_percent = (change / previous_close) * 100 if previous_close > 0 else 0
+
+        return StockQuote(
+            symbol=symbol,
+            price=current_price,
+            change=change,
+            change_percent=change_percent,
+            volume=info.get('volume', 0),
+            market_cap=info.get('marketCap'),
+            high_52_week=info.get('fiftyTwoWeekHigh'),
+            low_52_week=info.get('fiftyTwoWeekLow'),
+            pe_ratio=info.get('trailingPE'),
+            dividend_yield=info.get('dividendYield'),
+            last_updated=datetime.utcnow()
+        ).model_dump(mode="json")
+
+    @staticmethod
+    def _bar_to_dict(date, row) -> Dict[str, Any]:
+        return {
+            "date": date.isoformat(),
+            "open_price": float(row['Open']),
+            "high_price": float(row['High']),
+            "low_price": float(row['Low']),
+            "close_price": float(row['Close']),
+            "volume": int(row['Volume']),
+            "adjusted_close": float(row['Close'])  # Simplified
+        }
+
     async def get_stock_news(self, symbol: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get news related to a stock."""
         try:
-            ticker = yf.Ticker(symbol)
-            news = ticker.news
+            news = await run_upstream(lambda: yf.Ticker(symbol).news)
             
             return news[:limit] if news else []
         except Exception as e:
@@ -152,8 +330,7 @@ class StockService:
     async def get_analyst_recommendations(self, symbol: str) -> Dict[str, Any]:
         """Get analyst recommendations."""
         try:
-            ticker = yf.Ticker(symbol)
-            recommendations = ticker.recommendations
+            recommendations = await run_upstream(lambda: yf.Ticker(symbol).recommendations)
             
             if recommendations is None or recommendations.empty:
                 return {"recommendations": [], "summary": {}}
@@ -173,52 +350,13 @@ class StockService:
             return {"recommendations": [], "summary": {}}
 
     async def get_market_overview(self) -> MarketOverview:
-        """Get market overview with key indices."""
+        """Get market overview with key indices from the latest background snapshot."""
         try:
-            # Fetch major indices
-            indices = {
-                '^GSPC': 'S&P 500',
-                '^IXIC': 'NASDAQ',
-                '^DJI': 'DOW',
-                '^VIX': 'VIX'
-            }
+            snapshot = await overview_cache.get_or_fetch(OVERVIEW_KEY, fetch_market_overview)
+            if not snapshot:
+                return MarketOverview(timestamp=datetime.utcnow())
             
-            overview_data = {}
-            
-            for symbol, name in indices.items():
-                try:
-                    ticker = yf.Ticker(symbol)
-                    info = ticker.info
-                    
-                    current_price = info.get('currentPrice', 0)
-                    previous_close = info.get('previousClose', current_price)
-                    change = current_price - previous_close
-                    change_percent = (change / previous_close) * 100 if previous_close > 0 else 0
-                    
-                    overview_data[name.lower().replace(' ', '').replace('&', '')] = StockQuote(
-                        symbol=symbol,
-                        price=current_price,
-                        change=change,
-                        change_percent=change_percent,
-                        volume=info.get('volume', 0),
-                        market_cap=info.get('marketCap'),
-                        high_52_week=info.get('fiftyTwoWeekHigh'),
-                        low_52_week=info.get('fiftyTwoWeekLow'),
-                        pe_ratio=info.get('trailingPE'),
-                        dividend_yield=info.get('dividendYield'),
-                        last_updated=datetime.utcnow()
-                    )
-                except Exception as e:
-                    print(f"Error fetching {name}: {e}")
-                    continue
-            
-            return MarketOverview(
-                sp500=overview_data.get('sp500'),
-                nasdaq=overview_data.get('nasdaq'),
-                dow=overview_data.get('dow'),
-                vix=overview_data.get('vix'),
-                timestamp=datetime.utcnow()
-            )
+            return MarketOverview(**snapshot, timestamp=datetime.utcnow())
         except Exception as e:
             print(f"Error fetching market overview: {e}")
             return MarketOverview(timestamp=datetime.utcnow())
@@ -0,0 +1,416 @@
+import math
+from collections import deque
+from typing import Dict, Optional
+
+from .indicator_registry import parse_indicator_name
+
+# Streaming counterparts of the indicator_engine kernels. Each indicator keeps a
+# few numbers (plus a ring buffer or deque bounded by its window) and updates in
+# O(1) per bar, giving the same values as the full-series kernels on the same
+# bars. State round-trips through plain JSON via to_state / from_state.
+
+
+class StreamingIndicator:
+    """Base class: feed bars in date order with update(), read outputs with values()."""
+    kind = None
+    # Timestamp (int64 ns) of the last bar fed; tracked by the owner, not part of to_state()
+    last_bar_at = None
+
+    def update(self, high: float, low: float, close: float):
+        raise NotImplementedError
+
+    def values(self) -> Dict[str, Optional[float]]:
+        """Current outputs keyed like indicator_engine.compute_series; None during warm-up."""
+        raise NotImplementedError
+
+    def to_state(self) -> dict:
+        raise NotImplementedError
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingIndicator":
+        raise NotImplementedError
+
+
+class EMA:
+    """Recursive EMA seeded with the first value (indicator_engine.ema)."""
+
+    def __init__(self, period: int = None, alpha: float = None):
+        self.alpha = alpha if alpha is not None else 2.0 / (period + 1)
+        self.value = None
+        self.count = 0
+
+    def update(self, x: float) -> float:
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        self.count += 1
+        return self.value
+
+    def to_state(self) -> dict:
+        return {"alpha": self.alpha, "value": self.value, "count": self.count}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "EMA":
+        ema = cls(alpha=state["alpha"])
+        ema.value, ema.count = state["value"], state["count"]
+        return ema
+
+
+class RollingWindow:
+    """Ring buffer with a running mean and sum of squared deviations (sliding Welford).
+
+    The running sums are rebuilt from the buffer once per full pass over it, so
+    rounding drift stays bounded at amortized O(1) per update.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.buffer = []
+        self.pos = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def push(self, x: float):
+        if len(self.buffer) < self.period:
+            self.buffer.append(x)
+            delta = x - self.mean
+            self.mean += delta / len(self.buffer)
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.buffer[self.pos]
+            self.buffer[self.pos] = x
+            self.pos = (self.pos + 1) % self.period
+            old_mean = self.mean
+            self.mean += (x - old) / self.period
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+            self.updates += 1
+            if self.updates % self.period == 0:
+                self._rebuild()
+
+    @property
+    def full(self) -> bool:
+        return len(self.buffer) == self.period
+
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1)."""
+        return math.sqrt(max(self.m2, 0.0) / (len(self.buffer) - 1)) if len(self.buffer) > 1 else 0.0
+
+    def _rebuild(self):
+        self.mean = math.fsum(self.buffer) / len(self.buffer)
+        self.m2 = math.fsum((x - self.mean) ** 2 for x in self.buffer)
+
+    def to_state(self) -> dict:
+        # Stored oldest first, so pos starts at 0 again on restore
+        return {"period": self.period, "buffer": self.buffer[self.pos:] + self.buffer[:self.pos], "updates": self.updates}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "RollingWindow":
+        window = cls(state["period"])
+        window.buffer = list(state["buffer"])
+        window.updates = state["updates"]
+        if window.buffer:
+            window._rebuild()
+        return window
+
+
+class RollingExtreme:
+    """Rolling max (or min) over the last `period` values with a monotonic deque."""
+
+    def __init__(self, period: int, maximum: bool = True):
+        self.period = period
+        self.maximum = maximum
+        self.index = 0
+        # (index, value) pairs with values decreasing (max) or increasing (min) from the front
+        self.window = deque()
+
+    def push(self, x: float):
+        while self.window and (self.window[-1][1] <= x if self.maximum else self.window[-1][1] >= x):
+            self.window.pop()
+        self.window.append((self.index, x))
+        if self.window[0][0] <= self.index - self.period:
+            self.window.popleft()
+        self.index += 1
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.window[0][1] if self.index >= self.period else None
+
+    def to_state(self) -> dict:
+        return {"period": self.period, "maximum": self.maximum, "index": self.index,
+                "window": [list(item) for item in self.window]}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "RollingExtreme":
+        extreme = cls(state["period"], state["maximum"])
+        extreme.index = state["index"]
+        extreme.window = deque(tuple(item) for item in state["window"])
+        return extreme
+
+
+class StreamingSMA(StreamingIndicator):
+    kind = "sma"
+
+    def __init__(self, name: str, period: int = 20):
+        self.name = name
+        self.window = RollingWindow(period)
+
+    def update(self, high: float, low: float, close: float):
+        self.window.push(close)
+
+    def values(self) -> Dict[str, Optional[float]]:
+        return {self.name: self.window.mean if self.window.full else None}
+
+    def to_state(self) -> dict:
+        return {"window": self.window.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingSMA":
+        indicator = cls(name, state["window"]["period"])
+        indicator.window = RollingWindow.from_state(state["window"])
+        return indicator
+
+
+class StreamingEMA(StreamingIndicator):
+    kind = "ema"
+
+    def __init__(self, name: str, period: int = 12):
+        self.name = name
+        self.period = period
+        self.ema = EMA(period)
+
+    def update(self, high: float, low: float, close: float):
+        self.ema.update(close)
+
+    def values(self) -> Dict[str, Optional[float]]:
+        return {self.name: self.ema.value if self.ema.count >= self.period else None}
+
+    def to_state(self) -> dict:
+        return {"period": self.period, "ema": self.ema.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingEMA":
+        indicator = cls(name, state["period"])
+        indicator.ema = EMA.from_state(state["ema"])
+        return indicator
+
+
+class StreamingRSI(StreamingIndicator):
+    """Wilder RSI: gains and losses averaged over the first `period` changes, then smoothed with alpha = 1/period."""
+    kind = "rsi"
+
+    def __init__(self, name: str, period: int = 14):
+        self.name = name
+        self.period = period
+        self.previous = None
+        self.changes = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, high: float, low: float, close: float):
+        if self.previous is not None:
+            delta = close - self.previous
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            self.changes += 1
+            if self.changes <= self.period:
+                # Seeding: running mean of the first `period` changes
+                self.avg_gain += (gain - self.avg_gain) / self.changes
+                self.avg_loss += (loss - self.avg_loss) / self.changes
+            else:
+                self.avg_gain += (gain - self.avg_gain) / self.period
+                self.avg_loss += (loss - self.avg_loss) / self.period
+        self.previous = close
+
+    def values(self) -> Dict[str, Optional[float]]:
+        if self.changes < self.period:
+            return {self.name: None}
+        if self.avg_loss == 0:
+            return {self.name: 50.0 if self.avg_gain == 0 else 100.0}
+        return {self.name: 100 - 100 / (1 + self.avg_gain / self.avg_loss)}
+
+    def to_state(self) -> dict:
+        return {"period": self.period, "previous": self.previous, "changes": self.changes,
+                "avg_gain": self.avg_gain, "avg_loss": self.avg_loss}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingRSI":
+        indicator = cls(name, state["period"])
+        indicator.previous, indicator.changes = state["previous"], state["changes"]
+        indicator.avg_gain, indicator.avg_loss = state["avg_gain"], state["avg_loss"]
+        return indicator
+
+
+class StreamingMACD(StreamingIndicator):
+    kind = "macd"
+
+    def __init__(self, name: str, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.name = name
+        self.slow = slow
+        self.fast_ema = EMA(fast)
+        self.slow_ema = EMA(slow)
+        self.signal_ema = EMA(signal)
+
+    def update(self, high: float, low: float, close: float):
+        self.signal_ema.update(self.fast_ema.update(close) - self.slow_ema.update(close))
+
+    def values(self) -> Dict[str, Optional[float]]:
+        if self.slow_ema.count < self.slow:
+            return {self.name: None, f"{self.name}_signal": None, f"{self.name}_histogram": None}
+        macd_line = self.fast_ema.value - self.slow_ema.value
+        return {
+            self.name: macd_line,
+            f"{self.name}_signal": self.signal_ema.value,
+            f"{self.name}_histogram": macd_line - self.signal_ema.value,
+        }
+
+    def to_state(self) -> dict:
+        return {"slow": self.slow, "fast_ema": self.fast_ema.to_state(), "slow_ema": self.slow_ema.to_state(),
+                "signal_ema": self.signal_ema.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingMACD":
+        indicator = cls(name, slow=state["slow"])
+        indicator.fast_ema = EMA.from_state(state["fast_ema"])
+        indicator.slow_ema = EMA.from_state(state["slow_ema"])
+        indicator.signal_ema = EMA.from_state(state["signal_ema"])
+        return indicator
+
+
+class StreamingBollingerBands(StreamingIndicator):
+    kind = "bollinger_bands"
+
+    def __init__(self, name: str, period: int = 20, std_dev: float = 2):
+        self.name = name
+        self.std_dev = std_dev
+        self.window = RollingWindow(period)
+
+    def update(self, high: float, low: float, close: float):
+        self.window.push(close)
+
+    def values(self) -> Dict[str, Optional[float]]:
+        if not self.window.full:
+            return {f"{self.name}_upper": None, f"{self.name}_middle": None, f"{self.name}_lower": None}
+        middle, width = self.window.mean, self.window.std() * self.std_dev
+        return {f"{self.name}_upper": middle + width, f"{self.name}_middle": middle, f"{self.name}_lower": middle - width}
+
+    def to_state(self) -> dict:
+        return {"std_dev": self.std_dev, "window": self.window.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingBollingerBands":
+        indicator = cls(name, state["window"]["period"], state["std_dev"])
+        indicator.window = RollingWindow.from_state(state["window"])
+        return indicator
+
+
+class StreamingStochastic(StreamingIndicator):
+    kind = "stochastic"
+
+    def __init__(self, name: str, period: int = 14, smooth: int = 3):
+        self.name = name
+        self.highest = RollingExtreme(period, maximum=True)
+        self.lowest = RollingExtreme(period, maximum=False)
+        self.k = None
+        self.d = RollingWindow(smooth)
+
+    def update(self, high: float, low: float, close: float):
+        self.highest.push(high)
+        self.lowest.push(low)
+        if self.highest.value is None:
+            return
+        spread = self.highest.value - self.lowest.value
+        self.k = 100 * (close - self.lowest.value) / spread if spread else None
+        self.d.push(self.k if self.k is not None else math.nan)
+
+    def values(self) -> Dict[str, Optional[float]]:
+        d = self.d.mean if self.d.full and not math.isnan(self.d.mean) else None
+        return {f"{self.name}_k": self.k, f"{self.name}_d": d}
+
+    def to_state(self) -> dict:
+        return {"highest": self.highest.to_state(), "lowest": self.lowest.to_state(), "k": self.k,
+                "d": self.d.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingStochastic":
+        indicator = cls(name)
+        indicator.highest = RollingExtreme.from_state(state["highest"])
+        indicator.lowest = RollingExtreme.from_state(state["lowest"])
+        indicator.k = state["k"]
+        indicator.d = RollingWindow.from_state(state["d"])
+        return indicator
+
+
+class StreamingWilliamsR(StreamingIndicator):
+    kind = "williams_r"
+
+    def __init__(self, name: str, period: int = 14):
+        self.name = name
+        self.highest = RollingExtreme(period, maximum=True)
+        self.lowest = RollingExtreme(period, maximum=False)
+        self.value = None
+
+    def update(self, high: float, low: float, close: float):
+        self.highest.push(high)
+        self.lowest.push(low)
+        if self.highest.value is None:
+            return
+        spread = self.highest.value - self.lowest.value
+        self.value = -100 * (self.highest.value - close) / spread if spread else None
+
+    def values(self) -> Dict[str, Optional[float]]:
+        return {self.name: self.value}
+
+    def to_state(self) -> dict:
+        return {"highest": self.highest.to_state(), "lowest": self.lowest.to_state(), "value": self.value}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingWilliamsR":
+        indicator = cls(name)
+        indicator.highest = RollingExtreme.from_state(state["highest"])
+        indicator.lowest = RollingExtreme.from_state(state["lowest"])
+        indicator.value = state["value"]
+        return indicator
+
+
+class StreamingATR(StreamingIndicator):
+    kind = "atr"
+
+    def __init__(self, name: str, period: int = 14):
+        self.name = name
+        self.previous = None
+        self.window = RollingWindow(period)
+
+    def update(self, high: float, low: float, close: float):
+        if self.previous is not None:
+            self.window.push(max(high - low, abs(high - self.previous), abs(low - self.previous)))
+        self.previous = close
+
+    def values(self) -> Dict[str, Optional[float]]:
+        return {self.name: self.window.mean if self.window.full else None}
+
+    def to_state(self) -> dict:
+        return {"previous": self.previous, "window": self.window.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict, name: str = None) -> "StreamingATR":
+        indicator = cls(name, state["window"]["period"])
+        indicator.previous = state["previous"]
+        indicator.window = RollingWindow.from_state(state["window"])
+        return indicator
+
+
+STREAMING_INDICATORS = {cls.kind: cls for cls in (
+    StreamingSMA, StreamingEMA, StreamingRSI, StreamingMACD, StreamingBollingerBands,
+    StreamingStochastic, StreamingWilliamsR, StreamingATR,
+)}
+
+
+def create_indicator(name: str) -> StreamingIndicator:
+    """Streaming indicator for a name such as 'sma_50', 'rsi' or 'macd_12_26_9'; ValueError if unknown."""
+    kind, params = parse_indicator_name(name)
+    if kind not in STREAMING_INDICATORS:
+        raise ValueError(f"Unknown indicator: {name}")
+    return STREAMING_INDICATORS[kind](name, *params)
+
+
+def restore_indicator(name: str, state: dict) -> StreamingIndicator:
+    kind, _ = parse_indicator_name(name)
+    return STREAMING_INDICATORS[kind].from_state(state, name=name)
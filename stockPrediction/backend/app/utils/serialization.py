@@ -0,0 +1,77 @@
+import numpy as np
+import orjson
+from fastapi import Response
+from typing import Dict, Optional
+
+# Response field -> price column, in StockPriceResponse order
+PRICE_FIELDS = {
+    "open_price": "open",
+    "high_price": "high",
+    "low_price": "low",
+    "close_price": "close",
+    "volume": "volume",
+    "adjusted_close": "adjusted_close",
+}
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+class NumpyJSONResponse(Response):
+    """JSON response rendered by orjson, with NumPy arrays and scalars serialized natively."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def _nullable_ints(values: np.ndarray):
+    """Integer column that may contain NaN: an int64 array, or a list with None where missing."""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.astype(np.int64)
+    return np.where(missing, None, np.where(missing, 0, values).astype(np.int64)).tolist()
+
+
+def price_columns_payload(columns: Optional[Dict[str, np.ndarray]], stock_id: int) -> dict:
+    """Column-oriented history: one array per field, serialized without touching individual rows."""
+    if columns is None:
+        return {"stock_id": stock_id, "count": 0, "date": [], "id": [], **{field: [] for field in PRICE_FIELDS}}
+    payload = {
+        "stock_id": stock_id,
+        "count": int(len(columns["timestamp"])),
+        "date": np.asarray(columns["timestamp"]).view("datetime64[ns]").astype("datetime64[s]"),
+        "id": np.asarray(columns["id"]),
+    }
+    for field, column in PRICE_FIELDS.items():
+        payload[field] = _nullable_ints(np.asarray(columns[column])) if field == "volume" else np.asarray(columns[column])
+    return payload
+
+
+def price_rows_payload(columns: Optional[Dict[str, np.ndarray]], stock_id: int) -> list:
+    """Row-oriented history in the StockPriceResponse shape, built from columns in one pass."""
+    if columns is None or len(columns["timestamp"]) == 0:
+        return []
+    volumes = _nullable_ints(np.asarray(columns["volume"]))
+    volumes = volumes.tolist() if isinstance(volumes, np.ndarray) else volumes
+    adjusted = np.asarray(columns["adjusted_close"])
+    adjusted = np.where(np.isnan(adjusted), None, adjusted).tolist()
+    return [{
+        "date": date,
+        "open_price": open_price,
+        "high_price": high_price,
+        "low_price": low_price,
+        "close_price": close_price,
+        "volume": volume,
+        "adjusted_close": adjusted_close,
+        "id": row_id,
+        "stock_id": stock_id
+    } for date, open_price, high_price, low_price, close_price, volume, adjusted_close, row_id in zip(
+        np.asarray(columns["timestamp"]).view("datetime64[ns]").astype("datetime64[us]").tolist(),
+        np.asarray(columns["open"]).tolist(),
+        np.asarray(columns["high"]).tolist(),
+        np.asarray(columns["low"]).tolist(),
+        np.asarray(columns["close"]).tolist(),
+        volumes,
+        adjusted,
+        np.asarray(columns["id"]).tolist()
+    )]